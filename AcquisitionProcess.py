@@ -0,0 +1,409 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Acquisition in separate processes. Each CosmicWatch reader runs in its own process, so GUI redraws can't delay serial
+reading and event timestamping. Parsed events are passed to GUI through a shared memory ring buffer. GUI copies new
+events of the ring once per batch into growing numpy columns (the ring overwrites old events, so they can't be kept
+as views), statistics and anomaly checks of the batch run in a background thread.
+"""
+
+import datetime
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+from threading import Thread
+
+import numpy
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer
+
+from CosmicWatchControl import CosmicWatch
+from Anomalies import AnomalyMonitor
+from Livetime import LivetimeAccount
+from Snapshots import EventSnapshot
+from StreamingStats import DetectorStatistics
+from Timestamping import HostClock
+
+# columns of EventRing; deadtime is the raw Arduino Deadtime[ms] value
+RING_COLUMNS = ['time', 'event', 'ardn_time', 'adc', 'sipm', 'deadtime', 'temp', 'rate']
+WRITER_REPORT_INTERVAL = 1.0 # s between reports of file writer lag sent by acquisition process
+
+
+class EventRing():
+    '''
+    Single writer ring buffer of events in shared memory. Memory layout: int64 header [write count, capacity] followed
+    by float64 array (columns, capacity). Write count is increased after the event is written, so readers never see
+    a half written event.
+    :param name: name of existing shared memory block to attach to, None to create a new one
+    :param capacity: number of events kept, older events are overwritten
+    '''
+
+    capacity = 2**18
+
+    def __init__(self, name=None, capacity=None):
+        self.created = name is None
+        if capacity is not None:
+            self.capacity = capacity
+        if self.created:
+            size = 16 + 8 * len(RING_COLUMNS) * self.capacity
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.header = numpy.ndarray((2,), dtype=numpy.int64, buffer=self.memory.buf)
+        if self.created:
+            self.header[:] = [0, self.capacity]
+        else:
+            self.capacity = int(self.header[1])
+        self.data = numpy.ndarray((len(RING_COLUMNS), self.capacity), dtype=numpy.float64, buffer=self.memory.buf,
+                                  offset=16)
+
+    def append(self, values):
+        '''
+        :param values: list of floats in order of RING_COLUMNS
+        '''
+        count = int(self.header[0])
+        self.data[:, count % self.capacity] = values
+        self.header[0] = count + 1
+
+    def count(self):
+        '''
+        :return: number of events written since start
+        '''
+        return int(self.header[0])
+
+    def read(self, since):
+        '''
+        Reads events written after event number since. Result is a view of shared memory when events are contiguous,
+        copy it before the writer can overwrite it.
+        :param since: count of events already read
+        :return: array (columns, new events), new count
+        '''
+        count = self.count()
+        since = max(since, count - self.capacity) # older events were overwritten
+        start = since % self.capacity
+        new = count - since
+        if start + new <= self.capacity:
+            return self.data[:, start:start + new], count
+        return numpy.concatenate((self.data[:, start:], self.data[:, :start + new - self.capacity]), axis=1), count
+
+    def close(self):
+        del self.header
+        del self.data
+        self.memory.close()
+        if self.created:
+            self.memory.unlink()
+
+
+class EventBuffer():
+    '''
+    Growing numpy array of one event column, used instead of a list by DetectorProcess. Capacity doubles when full,
+    so appending is amortized O(1). Slices are views; filled values never change, so a view stays valid after the
+    array was replaced by a larger one.
+    '''
+
+    def __init__(self, capacity=4096):
+        self.array = numpy.empty(capacity)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return self.array[:self.size][index]
+
+    def extend(self, values):
+        new = len(values)
+        if self.size + new > self.array.size:
+            grown = numpy.empty(max(2 * self.array.size, self.size + new))
+            grown[:self.size] = self.array[:self.size]
+            self.array = grown
+        self.array[self.size:self.size + new] = values
+        self.size += new
+
+
+class ProcessMaster():
+    '''
+    Stands in for the GUI inside acquisition process. Messages for GUI are sent through status_queue.
+    '''
+
+    def __init__(self, measurement_folder, status_queue):
+        self.current_measurement_folder = measurement_folder
+        self.status_queue = status_queue
+
+    def update_log(self, message):
+        self.status_queue.put(('log', message))
+
+    def init_table(self, detector):
+        self.status_queue.put(('connected', {'device_id': detector.device_id, 'mode': detector.mode}))
+
+
+class WriterStatus():
+    '''
+    Stands in for the file writer of acquisition process in GUI, lag() as DataFileWriter.lag() for Metrics.py.
+    Age of buffered lines keeps growing between reports, so a stalled acquisition process is visible too.
+    '''
+
+    def __init__(self):
+        self.pending_lines = 0
+        self.age = 0.0
+        self.received = time.monotonic()
+
+    def update(self, pending_lines, age):
+        self.pending_lines = pending_lines
+        self.age = age
+        self.received = time.monotonic()
+
+    def lag(self):
+        if self.pending_lines == 0:
+            return 0, 0.0
+        return self.pending_lines, self.age + time.monotonic() - self.received
+
+
+def control_loop(detector, control_queue, status_queue):
+    '''
+    Executes commands sent by GUI: pause, resume, port_lost, port_available, stop.
+    '''
+    while True:
+        command, value = control_queue.get()
+        if command == 'pause':
+            detector.pause(value)
+        elif command == 'resume':
+            detector.resume(value)
+        elif command == 'port_lost':
+            detector.port_lost()
+        elif command == 'port_available':
+            detector.port_available()
+        elif command == 'stop':
+            detector.stop_program()
+            break
+
+
+def report_writer(detector, status_queue):
+    '''
+    Sends lag of file writer to GUI every WRITER_REPORT_INTERVAL until the detector is stopped.
+    '''
+    while detector.stop == False:
+        time.sleep(WRITER_REPORT_INTERVAL)
+        data_file = detector.data_file
+        if data_file is not None:
+            status_queue.put(('writer', data_file.lag()))
+
+
+def acquisition_worker(settings, ring_name, status_queue, control_queue):
+    '''
+    Process target. Runs CosmicWatch reader and writes its events to EventRing.
+    :param settings: dict with port_name, measurement_folder, distance, angle, compression, rotation, hdf5,
+                     time_start, clock_anchor
+    '''
+    ring = EventRing(ring_name)
+    detector = CosmicWatch()
+    detector.masterGUI = ProcessMaster(settings['measurement_folder'], status_queue)
+    detector.port_name = settings['port_name']
+    detector.distance = settings['distance']
+    detector.angle = settings['angle']
+    detector.compression = settings['compression']
+    detector.rotation = settings['rotation']
+    detector.hdf5 = settings['hdf5']
+    detector.time_start = settings['time_start']
+    detector.clock = HostClock(settings['time_start'], settings['clock_anchor'])
+    detector.event_ring = ring
+    detector.anomalies = None # checked by DetectorProcess in GUI, it highlights the table row
+    detector.connection_changed.connect(lambda connected, t: status_queue.put(('connection', (connected, t))))
+
+    Thread(target=control_loop, args=(detector, control_queue, status_queue), daemon=True).start()
+    Thread(target=report_writer, args=(detector, status_queue), daemon=True).start()
+    try:
+        detector.run_detector()
+    except Exception as exc:
+        status_queue.put(('log', 'Port: ' + detector.port_name + '. Acquisition process error. Exception: ' +
+                          repr(exc)))
+    finally:
+        ring.close()
+        status_queue.put(('stopped', None))
+
+
+class DetectorProcess(QObject):
+    '''
+    GUI side of detector running in acquisition process. Has the attributes of CosmicWatch used by GUI and charts,
+    they are updated from EventRing by a timer in batches. Event lists are EventBuffer columns.
+    poll_interval: ms between ring reads
+    '''
+
+    port_name = ''
+    device_id = 'N/A'
+    mode = 'N/A'
+    amplitude = 'N/A'
+    number = 'N/A'
+    time = 'N/A'
+    rate = 'N/A'
+    rate_error = 'N/A'
+    time_start = 0
+    clock = None
+    deadtime = 0
+    distance = ''
+    angle = ''
+    compression = ''
+    rotation = {}
+    hdf5 = False
+    paused = False
+    fail_counter = 0
+    reconnects = 0
+    events_written = 0 # events are put to EventRing after they are written
+    last_event_time = None
+    data_file = None # WriterStatus, file is written by acquisition process
+    poll_interval = 100
+    version = 0 # events complete in all event lists, see Snapshots.py
+
+    table_updater = pyqtSignal()
+    chart_initializer = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self.amplitudes_list = EventBuffer()
+        self.adc_list = EventBuffer()
+        self.temp_list = EventBuffer()
+        self.time_list = EventBuffer()
+        self.livetime = LivetimeAccount()
+        self.statistics = DetectorStatistics()
+        self.anomalies = AnomalyMonitor()
+        self.batches = queue.Queue() # (command, columns) for analyse_batches()
+        self.ring = None
+        self.read_count = 0
+        self.last_deadtime = None
+        self.data_file = WriterStatus()
+
+    def start_program(self):
+        '''
+        Start acquisition process.
+        '''
+        self.ring = EventRing()
+        self.status_queue = multiprocessing.Queue()
+        self.control_queue = multiprocessing.Queue()
+        settings = {'port_name': self.port_name, 'measurement_folder': self.masterGUI.current_measurement_folder,
+                    'distance': self.distance, 'angle': self.angle, 'compression': self.compression,
+                    'rotation': self.rotation, 'hdf5': self.hdf5, 'time_start': self.time_start,
+                    'clock_anchor': self.clock.anchor}
+        self.process = multiprocessing.Process(target=acquisition_worker, daemon=True,
+                                               args=(settings, self.ring.name, self.status_queue, self.control_queue))
+        self.process.start()
+        Thread(target=self.analyse_batches, daemon=True).start()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(self.poll_interval)
+
+    def stop_program(self):
+        '''
+        Stops acquisition process, waits for its last events and messages.
+        '''
+        if self.ring is None:
+            return
+        self.control_queue.put(('stop', None))
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.timer.stop()
+        self.poll()
+        self.livetime.finish(self.clock.elapsed())
+        self.batches.put(('stop', None))
+        self.ring.close()
+        self.ring = None
+
+    def pause(self, t):
+        self.paused = True
+        self.livetime.pause(t)
+        if self.ring is not None:
+            self.control_queue.put(('pause', t))
+
+    def resume(self, t):
+        self.paused = False
+        self.livetime.resume(t)
+        self.batches.put(('interrupt', None)) # after events read before the pause
+        if self.ring is not None:
+            self.control_queue.put(('resume', t))
+
+    def port_lost(self):
+        self.control_queue.put(('port_lost', None))
+
+    def port_available(self):
+        self.control_queue.put(('port_available', None))
+
+    def snapshot(self):
+        return EventSnapshot(self)
+
+    def analyse_batches(self):
+        '''
+        Thread: statistics and anomaly checks of event batches read by poll(), so per event work is not done in GUI
+        thread. Commands are handled in order of poll(): 'events', 'interrupt' (pause or reconnection) and 'stop'.
+        '''
+        while True:
+            command, columns = self.batches.get()
+            if command == 'stop':
+                break
+            if command == 'interrupt':
+                self.anomalies.interrupt()
+                continue
+            self.statistics.add_events(columns['time'], columns)
+            # anomaly tests are sequential per event, they are O(1) each
+            for event_time, amplitude in zip(columns['time'].tolist(), columns['sipm'].tolist()):
+                for message in self.anomalies.add_event(event_time, amplitude):
+                    self.masterGUI.update_log('ALERT for ID ' + self.device_id + ': ' + message)
+
+    def poll(self):
+        '''
+        Handles messages of acquisition process and reads new events from EventRing.
+        '''
+        while True:
+            try:
+                kind, value = self.status_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                self.masterGUI.update_log(value)
+            elif kind == 'connected':
+                self.device_id = value['device_id']
+                self.mode = value['mode']
+                self.masterGUI.init_table(self)
+                self.table_updater.emit()
+                self.chart_initializer.emit()
+            elif kind == 'connection':
+                connected, t = value
+                if connected:
+                    self.livetime.connect(t)
+                    self.batches.put(('interrupt', None))
+                    self.reconnects += 1
+                    self.fail_counter = 0
+                else:
+                    self.livetime.disconnect(t)
+                    self.fail_counter += 1
+            elif kind == 'writer':
+                self.data_file.update(*value)
+            elif kind == 'stopped':
+                self.data_file.update(0, 0.0) # writer was closed and flushed
+                self.timer.stop()
+
+        if self.ring is None:
+            return
+        events, self.read_count = self.ring.read(self.read_count)
+        if events.shape[1] == 0:
+            return
+        events = events.copy() # writer may reuse the memory, one copy per batch
+        columns = dict(zip(RING_COLUMNS, events))
+        self.amplitudes_list.extend(columns['sipm'])
+        self.adc_list.extend(columns['adc'])
+        self.temp_list.extend(columns['temp'])
+        self.time_list.extend(columns['time'])
+        self.version += events.shape[1]
+        self.livetime.arduino_events(columns['deadtime'])
+        self.batches.put(('events', columns))
+
+        last = events[:, -1]
+        self.events_written = self.read_count
+        self.last_event_time = last[0]
+        self.number = str(int(last[1]))
+        self.amplitude = '{:g}'.format(last[4])
+        self.time = datetime.datetime.fromtimestamp(last[0], datetime.timezone.utc).strftime('%H:%M:%S.%f')
+        self.rate = str(round(last[7], 3))
+        realtime, livetime, self.deadtime = self.livetime.times(self.clock.elapsed())
+        if last[7] > 0 and livetime > 0:
+            self.rate_error = "{:.3%}".format((last[1]**(1/2) / livetime) / last[7])
+        self.table_updater.emit() # once per batch instead of once per event
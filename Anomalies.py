@@ -0,0 +1,214 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Online detection of rate and amplitude spectrum changes during acquisition, e.g. noise bursts, light leaks, dead
+detector. Rate: two sided CUSUM of log-likelihood ratios of inter-arrival times (exponential distribution), O(1) per
+event. After a change the rate is learned again, so the run is split into blocks of constant rate like Bayesian
+blocks, but online. Silence is found from time since last event. Spectrum: amplitudes of a window of events are
+compared with reference spectrum by two sample chi-square test, O(1) amortized per event.
+"""
+
+import bisect
+import math
+
+RATE_FACTOR = 2.0 # rate change looked for: doubling or halving
+CUSUM_THRESHOLD = 12.0 # log-likelihood ratio needed for alert, false alert about once per exp(12) events
+LEARN_EVENTS = 300 # events used to learn rate of new block
+SILENCE_PROBABILITY = 1e-6 # alert when no event came for a time this improbable at learned rate
+SPECTRUM_REFERENCE = 1000 # events used to learn reference spectrum
+SPECTRUM_BINS = 10 # bins of equal reference probability (fewer if amplitudes repeat)
+SPECTRUM_WINDOW = 200 # events per spectrum test
+SPECTRUM_Z = 3.719 # one sided standard normal quantile of p = 1e-4, significance of spectrum test
+ALERT_SECONDS = 60 # detector stays highlighted this long after alert
+
+
+def chi_square_threshold(dof, z=SPECTRUM_Z):
+    '''
+    Chi-square quantile by Wilson-Hilferty approximation, good to ~1% for dof >= 3.
+    '''
+    return dof * (1 - 2 / (9 * dof) + z * math.sqrt(2 / (9 * dof)))**3
+
+
+class RateChangeDetector():
+    '''
+    CUSUM test of rate * RATE_FACTOR (increase) and rate / RATE_FACTOR (drop) against learned rate.
+    '''
+
+    def __init__(self):
+        self.last_time = None
+        self.reset()
+
+    def reset(self):
+        self.rate = None # rate of block [1/s], estimated from all its events after LEARN_EVENTS
+        self.block_events = 0
+        self.block_time = 0.0
+        # CUSUM sums, events and time since sum was last 0 (estimate of the new rate)
+        self.up = [0.0, 0, 0.0]
+        self.down = [0.0, 0, 0.0]
+
+    def interrupt(self):
+        '''
+        Pause or reconnection, time until next event is not an inter-arrival time.
+        '''
+        self.last_time = None
+
+    def cusum(self, sums, llr, dt):
+        sums[0] = max(0.0, sums[0] + llr)
+        if sums[0] == 0:
+            sums[1] = 0
+            sums[2] = 0.0
+        else:
+            sums[1] += 1
+            sums[2] += dt
+
+    def add(self, t):
+        '''
+        :param t: event time [s]
+        :return: alert message or None
+        '''
+        if self.last_time is None:
+            self.last_time = t
+            return None
+        dt = max(t - self.last_time, 0.0)
+        self.last_time = t
+        self.block_events += 1
+        self.block_time += dt
+        if self.rate is None:
+            if self.block_events >= LEARN_EVENTS and self.block_time > 0:
+                self.rate = self.block_events / self.block_time
+            return None
+
+        log_factor = math.log(RATE_FACTOR)
+        self.cusum(self.up, log_factor - (RATE_FACTOR - 1) * self.rate * dt, dt)
+        self.cusum(self.down, -log_factor + (1 - 1 / RATE_FACTOR) * self.rate * dt, dt)
+        for sums, kind in [(self.up, 'Rate increase'), (self.down, 'Rate drop')]:
+            if sums[0] > CUSUM_THRESHOLD:
+                new_rate = sums[1] / sums[2] if sums[2] > 0 else math.inf
+                message = kind + ' from ' + '{:.3f}'.format(self.rate) + ' to ' + '{:.3f}'.format(new_rate) + ' 1/s.'
+                self.reset()
+                return message
+        self.rate = self.block_events / self.block_time
+        return None
+
+    def silence(self, now):
+        '''
+        :param now: current time [s]
+        :return: seconds since last event if so long silence is improbable at learned rate, else None
+        '''
+        if self.rate is None or self.last_time is None:
+            return None
+        quiet = now - self.last_time
+        if quiet > -math.log(SILENCE_PROBABILITY) / self.rate:
+            return quiet
+        return None
+
+
+class SpectrumChangeDetector():
+    '''
+    Bins of reference spectrum are its quantiles, counts of every window of events are tested against reference
+    counts. Reference is learned again after a change.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.reference = []
+        self.edges = None
+        self.reference_counts = None
+        self.threshold = 0.0
+        self.counts = []
+        self.n = 0
+
+    def learn(self):
+        ordered = sorted(self.reference)
+        self.edges = sorted(set(ordered[len(ordered) * i // SPECTRUM_BINS] for i in range(1, SPECTRUM_BINS)))
+        self.reference_counts = [0] * (len(self.edges) + 1)
+        for amplitude in ordered:
+            self.reference_counts[bisect.bisect_right(self.edges, amplitude)] += 1
+        self.threshold = chi_square_threshold(max(len(self.reference_counts) - 1, 1))
+        self.counts = [0] * len(self.reference_counts)
+        self.reference = []
+
+    def chi_square(self):
+        '''
+        Two sample chi-square of window counts and reference counts, noise of reference is included.
+        '''
+        total = sum(self.reference_counts)
+        scale = math.sqrt(total / self.n)
+        return sum((count * scale - reference / scale)**2 / (count + reference)
+                   for count, reference in zip(self.counts, self.reference_counts) if count + reference > 0)
+
+    def add(self, amplitude):
+        '''
+        :param amplitude: SiPM [mV]
+        :return: alert message or None
+        '''
+        if self.edges is None:
+            self.reference.append(amplitude)
+            if len(self.reference) >= SPECTRUM_REFERENCE:
+                self.learn()
+            return None
+        self.counts[bisect.bisect_right(self.edges, amplitude)] += 1
+        self.n += 1
+        if self.n < SPECTRUM_WINDOW:
+            return None
+        chi_square = self.chi_square()
+        self.counts = [0] * len(self.counts)
+        self.n = 0
+        if chi_square > self.threshold:
+            message = 'Amplitude spectrum change, chi-square ' + '{:.1f}'.format(chi_square) + ' (limit ' + \
+                      '{:.1f}'.format(self.threshold) + ').'
+            self.reset()
+            return message
+        return None
+
+
+class AnomalyMonitor():
+    '''
+    Rate, silence and spectrum checks of one detector.
+    '''
+
+    def __init__(self):
+        self.rate = RateChangeDetector()
+        self.spectrum = SpectrumChangeDetector()
+        self.alerts = 0 # number of alerts in run
+        self.alert_time = None # time of last alert [s]
+        self.silent = False # silence already reported
+
+    def add_event(self, t, amplitude):
+        '''
+        :param t: event time, UTC seconds
+        :param amplitude: SiPM [mV]
+        :return: list of alert messages, usually empty
+        '''
+        self.silent = False
+        messages = [message for message in [self.rate.add(t), self.spectrum.add(amplitude)] if message is not None]
+        if len(messages) > 0:
+            self.alerts += len(messages)
+            self.alert_time = t
+        return messages
+
+    def check_silence(self, now):
+        '''
+        Called periodically, also when no events come.
+        :param now: current UTC seconds
+        :return: alert message, None if detector is not silent or silence was reported already
+        '''
+        quiet = self.rate.silence(now)
+        if quiet is None:
+            return None
+        self.alert_time = now
+        if self.silent == True:
+            return None
+        self.silent = True
+        self.alerts += 1
+        return 'No event for ' + str(int(quiet)) + ' s at rate ' + '{:.3f}'.format(self.rate.rate) + ' 1/s.'
+
+    def interrupt(self):
+        self.rate.interrupt()
+
+    def alert_active(self, now):
+        '''
+        :return: True if there was an alert in last ALERT_SECONDS
+        '''
+        return self.alert_time is not None and now - self.alert_time < ALERT_SECONDS
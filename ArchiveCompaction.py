@@ -0,0 +1,240 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Archive compaction. Merges run folders created by every Start press (e.g. Measurements\\20210210_031958\\) into one
+file per day, detector and configuration (distance, angle). Run boundaries, original headers and log entries are
+kept in a run index saved next to compacted file. Runs added later are merged into existing compacted file.
+Usage: python ArchiveCompaction.py [measurements_folder] [--output folder] [--compression gzip|xz|none]
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+
+from DataFiles import DataFileWriter, COMPRESSIONS, MANIFEST_SUFFIX, read_lines, split_header, header_info, line_time, \
+    is_segment
+
+RUN_FOLDER = re.compile(r'^\d{8}_\d{6}$') # run folder name, e.g. 20210210_031958
+RUNS_SUFFIX = '.runs.json' # run index saved next to compacted file
+
+
+class CompactionError(Exception):
+    pass
+
+
+def is_event(line):
+    '''
+    :return: True if line is an event line (not empty, not a '#' comment sent by detector)
+    '''
+    return line.strip() != '' and line[0] != '#'
+
+
+def find_runs(measurements_folder):
+    '''
+    Finds run folders and their data files.
+    :param measurements_folder: folder with run folders, e.g. 'Measurements'
+    :return: list of dicts: run (folder name), folder, data_files (list of paths), log (list of lines)
+    '''
+    runs = []
+    for run in sorted(os.listdir(measurements_folder)):
+        folder = os.path.join(measurements_folder, run)
+        if not RUN_FOLDER.match(run) or not os.path.isdir(folder):
+            continue
+        data_files = []
+        log = []
+        for file_name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, file_name)
+            if file_name == 'log.txt':
+                with open(path, 'r', errors='replace') as log_file:
+                    log = log_file.readlines()
+            elif ('_MASTER_' in file_name or '_SLAVE_' in file_name) and is_segment(file_name) == False and \
+                    file_name.endswith(('.csv', '.txt', MANIFEST_SUFFIX) +
+                                       tuple(suffix for suffix, module in COMPRESSIONS.values())):
+                data_files.append(path)
+        runs.append({'run': run, 'folder': folder, 'data_files': data_files, 'log': log})
+    return runs
+
+
+def group_runs(runs):
+    '''
+    Groups data files by day, mode, detector ID, distance and angle.
+    :param runs: list returned by find_runs()
+    :return: dict: group name -> list of dicts: run, source, header, log, data
+    '''
+    groups = {}
+    for run in runs:
+        for path in run['data_files']:
+            header, data = split_header(read_lines(path))
+            info = header_info(header, path)
+            name = run['run'][0:8] + '_' + info['mode'].upper() + '_' + info['device_id'] + '_' + \
+                   (info['distance'] or 'X') + 'cm_' + (info['angle'] or 'X') + 'deg'
+            groups.setdefault(name, []).append({'run': run['run'], 'source': path, 'header': header,
+                                                'log': run['log'], 'data': data})
+    return groups
+
+
+def write_group(path, entries, compression):
+    '''
+    Writes compacted file and its run index. Every run starts a new compressed block.
+    :param path: full path of compacted file
+    :param entries: list of runs of one group, see group_runs()
+    :param compression: '', 'gzip' or 'xz'
+    :return: run index, list of dicts
+    '''
+    index = []
+    line_number = 0
+    with DataFileWriter(path, compression, 'w') as compacted:
+        header = list(entries[0]['header'])
+        header.append('### Compacted runs: ' + str(len(entries)) + '. Run boundaries in ' +
+                      os.path.basename(path) + RUNS_SUFFIX + '\r\n')
+        for line in header:
+            compacted.write(line)
+        compacted.write('\r\n')
+        compacted.flush()
+        for entry in entries:
+            times = [line_time(line) for line in entry['data'] if line_time(line) is not None]
+            index.append({'run': entry['run'],
+                          'source': entry['source'],
+                          'first_line': line_number,  # index of first line after header
+                          'lines': len(entry['data']),
+                          'events': sum(1 for line in entry['data'] if is_event(line)),
+                          'first_time': times[0] if len(times) > 0 else None,
+                          'last_time': times[-1] if len(times) > 0 else None,
+                          'header': entry['header'],
+                          'log': entry['log']})
+            for line in entry['data']:
+                if line[-1] != '\n':
+                    line += '\r\n' # last line of file may be missing newline
+                compacted.write(line)
+            compacted.flush()
+            line_number += len(entry['data'])
+
+    with open(path + RUNS_SUFFIX, 'w') as runs_file:
+        json.dump({'runs': index}, runs_file, indent=1)
+    return index
+
+
+def read_run(path, run):
+    '''
+    Reads single run back from compacted file.
+    :param path: full path of compacted file
+    :param run: run folder name, e.g. '20210210_031958'
+    :return: header_lines, data_lines of the run as they were in original file
+    '''
+    with open(path + RUNS_SUFFIX, 'r') as runs_file:
+        index = json.load(runs_file)['runs']
+    for entry in index:
+        if entry['run'] == run:
+            header, data = split_header(read_lines(path))
+            return entry['header'], data[entry['first_line']:entry['first_line'] + entry['lines']]
+    raise CompactionError('Run ' + run + ' not found in ' + path)
+
+
+def load_group(path):
+    '''
+    Reads runs of compacted file back, so a group can be written again with new runs.
+    :param path: full path of compacted file
+    :return: list of runs, see group_runs()
+    '''
+    with open(path + RUNS_SUFFIX, 'r') as runs_file:
+        index = json.load(runs_file)['runs']
+    header, data = split_header(read_lines(path))
+    return [{'run': entry['run'], 'source': entry['source'], 'header': entry['header'], 'log': entry['log'],
+             'data': data[entry['first_line']:entry['first_line'] + entry['lines']]} for entry in index]
+
+
+def run_key(entry):
+    '''
+    :return: run folder and data file name, identifies run even if measurements folder was given by another path
+    '''
+    return entry['run'], os.path.basename(entry['source'])
+
+
+def verify_group(path, index):
+    '''
+    Checks that compacted file contains the same number of lines and events for each run as original files.
+    Raises CompactionError on mismatch.
+    '''
+    header, data = split_header(read_lines(path))
+    for entry in index:
+        run_data = data[entry['first_line']:entry['first_line'] + entry['lines']]
+        events = sum(1 for line in run_data if is_event(line))
+        if len(run_data) != entry['lines'] or events != entry['events']:
+            raise CompactionError('Event count mismatch for run ' + entry['run'] + ' in ' + path + ': ' +
+                                  str(events) + ' != ' + str(entry['events']))
+    if len(data) != sum(entry['lines'] for entry in index):
+        raise CompactionError('Unexpected lines at the end of ' + path)
+
+
+def compact(measurements_folder, output_folder, compression='gzip', remove_sources=False):
+    '''
+    Compacts all run folders of measurements_folder into output_folder.
+    Runs already in the run index of a compacted file are skipped, new runs of the group are merged with them and
+    the file is written again. Previous file is kept with '.old' suffix until the new one is verified.
+    :param remove_sources: delete run folders whose all data files were compacted and verified
+    :return: list of paths of created or updated files
+    '''
+    os.makedirs(output_folder, exist_ok=True)
+    runs = find_runs(measurements_folder)
+    groups = group_runs(runs)
+    suffix = '.csv' + (COMPRESSIONS[compression][0] if compression != '' else '')
+    created = []
+    compacted_sources = set()
+    for name, entries in sorted(groups.items()):
+        path = os.path.join(output_folder, name + suffix)
+        old_entries = load_group(path) if os.path.exists(path) else []
+        old_runs = set(run_key(entry) for entry in old_entries)
+        new_entries = [entry for entry in entries if run_key(entry) not in old_runs]
+        compacted_sources.update(entry['source'] for entry in entries if run_key(entry) in old_runs)
+        if len(new_entries) == 0:
+            print('Skipping ' + name + ', already compacted.')
+            continue
+        if len(old_entries) > 0:
+            os.replace(path, path + '.old')
+            os.replace(path + RUNS_SUFFIX, path + '.old' + RUNS_SUFFIX)
+        group = sorted(old_entries + new_entries, key=lambda entry: (entry['run'], entry['source']))
+        index = write_group(path, group, compression)
+        verify_group(path, index)
+        if len(old_entries) > 0:
+            os.remove(path + '.old')
+            os.remove(path + '.old' + RUNS_SUFFIX)
+        created.append(path)
+        compacted_sources.update(entry['source'] for entry in new_entries)
+        print(name + ': ' + str(len(group)) + ' runs (' + str(len(new_entries)) + ' new), ' +
+              str(sum(entry['events'] for entry in index)) + ' events.')
+
+    empty_runs = [run['run'] for run in runs if len(run['data_files']) == 0]
+    if len(empty_runs) > 0:
+        print('Runs without data files (left untouched): ' + ', '.join(empty_runs))
+
+    if remove_sources:
+        for run in runs:
+            if len(run['data_files']) > 0 and all(path in compacted_sources for path in run['data_files']):
+                shutil.rmtree(run['folder'])
+    return created
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge CosmicWatch run folders into one file per day, detector '
+                                                 'and configuration.')
+    parser.add_argument('measurements', nargs='?', default='Measurements', help='folder with run folders')
+    parser.add_argument('--output', default=None, help='output folder, default: <measurements>/Compacted')
+    parser.add_argument('--compression', default='gzip', choices=['gzip', 'xz', 'none'])
+    parser.add_argument('--remove-sources', action='store_true',
+                        help='delete run folders after their files were compacted and verified')
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(args.measurements, 'Compacted')
+    compression = '' if args.compression == 'none' else args.compression
+    try:
+        compact(args.measurements, output, compression, args.remove_sources)
+    except CompactionError as exc:
+        print('ERROR: ' + str(exc))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Batch re-analysis of archived measurements. Every MASTER/SLAVE data file is analysed in a separate process:
+rate +/- error, real/live/dead time, SiPM and ADC histograms, MIP peak fitted to SiPM histogram (SpectrumFit.py),
+temperature statistics, counts and temperature in time bins. Results are saved as summary table and one .npz file of
+histograms per run. Files which did not change since the last analysis are skipped. Reports.py draws its figures from
+the .npz files.
+Usage: python BatchAnalysis.py [measurements_folder] [--output folder] [--jobs N] [--force]
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from DataFiles import strip_data_suffix, file_state
+from Integrity import summary
+from IntegrityCheck import read_valid_data
+from SpectrumFit import fit_spectra, PARAMETERS
+from TemperatureCalibration import find_data_files, TEMP_RANGE
+
+OUTPUT_FOLDER = 'analysis' # created in measurements folder
+SUMMARY_FILE = 'summary.csv'
+INDEX_FILE = 'analysis_index.json' # path -> size, modification time and summary row of analysed files
+ANALYSIS_VERSION = 5 # increased when .npz content changes, files analysed by older version are analysed again
+TIME_BIN = 600 # [s], bin of counts and temperature against time
+MIP_MODEL = 'landau_gauss' # model of SpectrumFit.py fitted to SiPM histogram
+
+# fixed bin edges, so histograms of different runs can be added and compared
+SIPM_BINS = numpy.linspace(0, 1000, 201) # [mV]
+ADC_BINS = numpy.linspace(0, 1024, 129)
+
+SUMMARY_COLUMNS = ['file', 'device_id', 'mode', 'distance', 'angle', 'events', 'realtime', 'livetime', 'deadtime',
+                   'rate', 'rate_error', 'live_rate', 'live_rate_error', 'sipm_mean', 'mip_peak', 'mip_peak_error',
+                   'mip_fwhm', 'mip_chi2_ndf', 'adc_mean', 'temp_mean', 'temp_std', 'temp_min', 'temp_max', 'integrity']
+
+
+def load_run(path):
+    '''
+    Bad rows found by integrity check are skipped.
+    :param path: full path of data file
+    :return: header info dict (with 'integrity' report),
+             array of columns [Event, Ardn_time, ADC, SiPM, Deadtime, Temp] (shape (events, 6)),
+             array of UTC times of events
+    '''
+    info, data = read_valid_data(path)
+    columns = numpy.column_stack([data[name] for name in ['event', 'ardn_time', 'adc', 'sipm', 'deadtime', 'temp']])
+    if columns.shape[0] == 0:
+        return info, numpy.empty((0, 6)), numpy.empty(0)
+    return info, columns, data['time']
+
+
+def file_start_time(path):
+    '''
+    :return: UTC seconds of measurement start from file name, e.g. '20210210_033024_MASTER_Detektor A.csv';
+             None if name doesn't start with date
+    '''
+    try:
+        return datetime.datetime.strptime(os.path.basename(path)[0:15], '%Y%m%d_%H%M%S').replace(
+            tzinfo=datetime.timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def time_series(times, temp, valid_temp):
+    '''
+    Counts and temperature in TIME_BIN bins since first event, the last bin ends at the last event.
+    :param valid_temp: bool array, temperatures used
+    :return: dict: time_edges (UTC seconds), time_counts, temp_counts, temp_sums
+    '''
+    if times.size == 0:
+        return {'time_edges': numpy.empty(0), 'time_counts': numpy.empty(0), 'temp_counts': numpy.empty(0),
+                'temp_sums': numpy.empty(0)}
+    edges = times[0] + TIME_BIN * numpy.arange(int((times[-1] - times[0]) // TIME_BIN) + 1)
+    edges = numpy.append(edges, times[-1] if times[-1] > edges[-1] else edges[-1] + TIME_BIN)
+    return {'time_edges': edges, 'time_counts': numpy.histogram(times, edges)[0],
+            'temp_counts': numpy.histogram(times[valid_temp], edges)[0],
+            'temp_sums': numpy.histogram(times[valid_temp], edges, weights=temp[valid_temp])[0]}
+
+
+def total_deadtime(deadtime_ms):
+    '''
+    Deadtime column is cumulative and restarts from 0 when Arduino restarts, values before each restart are added.
+    :param deadtime_ms: array of Deadtime[ms] column
+    :return: dead time in seconds
+    '''
+    if deadtime_ms.size == 0:
+        return 0.0
+    resets = numpy.flatnonzero(numpy.diff(deadtime_ms) < 0)
+    return float(deadtime_ms[resets].sum() + deadtime_ms[-1]) / 1000
+
+
+def analyse_run(path):
+    '''
+    Analyses one data file, runs in worker process.
+    :return: summary row (dict, see SUMMARY_COLUMNS), histograms (dict of arrays)
+    '''
+    info, columns, times = load_run(path)
+    first_time = float(times[0]) if times.size > 0 else None
+    last_time = float(times[-1]) if times.size > 0 else None
+    adc = columns[:, 2]
+    sipm = columns[:, 3]
+    all_temp = columns[:, 5]
+    valid_temp = (all_temp > TEMP_RANGE[0]) & (all_temp < TEMP_RANGE[1])
+    temp = all_temp[valid_temp]
+
+    start = file_start_time(path)
+    if start is None:
+        start = first_time
+    realtime = last_time - start if last_time is not None and start is not None else 0.0
+    deadtime = total_deadtime(columns[:, 4])
+    livetime = realtime - deadtime
+    events = int(columns.shape[0])
+
+    row = {'file': path, 'device_id': info['device_id'], 'mode': info['mode'], 'distance': info['distance'],
+           'angle': info['angle'], 'events': events, 'realtime': realtime, 'livetime': livetime,
+           'deadtime': deadtime,
+           # rate and its error as in CosmicWatch.update_values() and Rate column of data files
+           'rate': events / realtime if realtime > 0 else numpy.nan,
+           'rate_error': events**(1/2) / livetime if livetime > 0 else numpy.nan,
+           'live_rate': events / livetime if livetime > 0 else numpy.nan,
+           'live_rate_error': events**(1/2) / livetime if livetime > 0 else numpy.nan,
+           'sipm_mean': float(sipm.mean()) if events > 0 else numpy.nan,
+           'adc_mean': float(adc.mean()) if events > 0 else numpy.nan,
+           'temp_mean': float(temp.mean()) if temp.size > 0 else numpy.nan,
+           'temp_std': float(temp.std()) if temp.size > 0 else numpy.nan,
+           'temp_min': float(temp.min()) if temp.size > 0 else numpy.nan,
+           'temp_max': float(temp.max()) if temp.size > 0 else numpy.nan,
+           'integrity': summary(info['integrity'])}
+    histograms = {'sipm': numpy.histogram(sipm, SIPM_BINS)[0], 'sipm_bins': SIPM_BINS,
+                  'adc': numpy.histogram(adc, ADC_BINS)[0], 'adc_bins': ADC_BINS}
+    histograms.update(time_series(times, all_temp, valid_temp))
+
+    fit = fit_spectra(histograms['sipm'], SIPM_BINS, MIP_MODEL)
+    valid = bool(fit['valid'][0]) # NaN columns if no peak was found
+    for name, result in [('mip_peak', 'peak'), ('mip_peak_error', 'peak_error'), ('mip_fwhm', 'fwhm'),
+                         ('mip_chi2_ndf', 'chi2_ndf')]:
+        row[name] = float(fit[result][0]) if valid == True else numpy.nan
+    histograms['mip_parameters'] = numpy.array([fit[name][0] if valid == True else numpy.nan
+                                                for name in PARAMETERS[MIP_MODEL]]) # for curve()
+    return row, histograms
+
+
+def try_analyse_run(path):
+    '''
+    analyse_run() which returns error message instead of raising, so one broken file doesn't stop the batch.
+    :return: row, histograms, error message ('' on success)
+    '''
+    try:
+        row, histograms = analyse_run(path)
+    except Exception as exc:
+        return None, None, repr(exc)
+    return row, histograms, ''
+
+
+def histogram_path(output, measurements, path):
+    '''
+    :return: path of .npz histogram file of data file, sub-folders of measurements folder are kept
+    '''
+    relative = os.path.relpath(path, measurements)
+    return os.path.join(output, os.path.dirname(relative), strip_data_suffix(os.path.basename(relative)) + '.npz')
+
+
+def load_index(output):
+    try:
+        with open(os.path.join(output, INDEX_FILE), 'r') as index_file:
+            return json.load(index_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def analyse_archive(measurements, output=None, jobs=None, force=False):
+    '''
+    Analyses all data files of measurements folder, unchanged files analysed before are skipped.
+    :param measurements: measurements folder
+    :param output: output folder, default measurements/analysis
+    :param jobs: number of worker processes, default number of CPUs
+    :param force: analyse all files again
+    :return: list of summary rows, number of analysed files, number of files which failed (they have no row)
+    '''
+    output = output or os.path.join(measurements, OUTPUT_FOLDER)
+    os.makedirs(output, exist_ok=True)
+    index = {} if force == True else load_index(output)
+
+    paths = find_data_files(measurements)
+    todo = []
+    for path in paths:
+        entry = index.get(path)
+        if entry is None or entry['state'] != file_state(path) or entry.get('version') != ANALYSIS_VERSION or \
+                os.path.exists(histogram_path(output, measurements, path)) == False:
+            todo.append(path)
+
+    skipped = set(paths) - set(todo)
+    new_index = {path: index[path] for path in skipped}
+    failed = 0
+    if len(todo) > 0:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for path, result in zip(todo, executor.map(try_analyse_run, todo, chunksize=4)):
+                row, histograms, error = result
+                if error != '':
+                    print('Skipping ' + path + ': ' + error)
+                    failed += 1
+                    continue
+                npz_path = histogram_path(output, measurements, path)
+                os.makedirs(os.path.dirname(npz_path), exist_ok=True)
+                numpy.savez_compressed(npz_path, **histograms)
+                new_index[path] = {'state': file_state(path), 'version': ANALYSIS_VERSION, 'row': row}
+
+    with open(os.path.join(output, INDEX_FILE), 'w') as index_file:
+        json.dump(new_index, index_file)
+    rows = [new_index[path]['row'] for path in paths if path in new_index]
+    save_summary(rows, os.path.join(output, SUMMARY_FILE))
+    return rows, len(todo) - failed, failed
+
+
+def save_summary(rows, path):
+    with open(path, 'w', newline='') as summary_file:
+        writer = csv.DictWriter(summary_file, SUMMARY_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: '{:.6g}'.format(value) if isinstance(value, float) else value
+                             for key, value in row.items()})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyse all archived measurements in parallel.')
+    parser.add_argument('measurements', nargs='?', default='Measurements', help='folder with measurements')
+    parser.add_argument('--output', default=None, help='default: <measurements>/' + OUTPUT_FOLDER)
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, default: number of CPUs')
+    parser.add_argument('--force', action='store_true', help='analyse unchanged files again')
+    args = parser.parse_args(argv)
+
+    rows, analysed, failed = analyse_archive(args.measurements, args.output, args.jobs, args.force)
+    for row in rows:
+        print(os.path.relpath(row['file'], args.measurements) + ': ' + str(row['events']) + ' events, rate ' +
+              '{:.4f}'.format(row['rate']) + ' +/- ' + '{:.4f}'.format(row['rate_error']) + ' 1/s')
+    print(str(len(rows)) + ' runs, ' + str(analysed) + ' analysed, ' + str(len(rows) - analysed) + ' unchanged, ' +
+          str(failed) + ' failed.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,974 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Chart windows of GUI.py. Imported on first use of a chart, so matplotlib and NumPy are not loaded at GUI start.
+"""
+
+import math
+import time
+
+import matplotlib.colors as mpl_colors
+import matplotlib.figure as mpl_fig
+import numpy
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+from PyQt5.QtWidgets import (QButtonGroup, QCheckBox, QComboBox, QFileDialog, QGridLayout, QLabel, QPushButton,
+                             QRadioButton, QVBoxLayout, QWidget)
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from numpy import polyfit, poly1d
+
+from Snapshots import published_version
+from SpectrumFit import curve, fit_amplitudes
+from TemperatureCalibration import correct_amplitudes
+
+
+def amplitude_data(detector, corrected, calibration):
+    '''
+    Amplitudes used by charts.
+    :param detector: CosmicWatch() or FakeCosmicWatch()
+    :param corrected: bool, apply temperature correction
+    :param calibration: dict: device_id -> temperature coefficients, see TemperatureCalibration.py
+    :return: detector.amplitudes_list or corrected amplitudes, uncorrected if detector is not calibrated
+    '''
+    if corrected == False:
+        return detector.amplitudes_list
+    return correct_amplitudes(detector.amplitudes_list, detector.temp_list, calibration.get(detector.device_id))
+
+
+def draw_mip_fit(axes, amplitudes, edges, model='landau_gauss'):
+    '''
+    Fits MIP peak to amplitudes and draws fitted curve over amplitude histogram, see SpectrumFit.py.
+    :param edges: bin edges of drawn histogram, the curve is scaled to its bin width
+    '''
+    results, parameters = fit_amplitudes(amplitudes, model)
+    if results['valid'] == False:
+        axes.text(0.98, 0.95, 'No MIP peak found', transform=axes.transAxes, ha='right', va='top')
+        return
+    x = numpy.linspace(edges[0], edges[-1], 500)
+    axes.plot(x, curve(model, parameters, x, edges[1] - edges[0]), color='#E8663A',
+              label='MIP peak ' + '{:.1f}'.format(results['peak']) + ' +/- ' + '{:.1f}'.format(results['peak_error']) +
+                    ' mV, FWHM ' + '{:.1f}'.format(results['fwhm']) + ' mV')
+    axes.set_ylim(bottom=0.5)
+    axes.legend()
+
+
+class Chart_Window(QWidget):
+    '''
+    Secondary window displaying chart. Can run StaticChart or AnimatedChart.
+    :param mode = Title of window or chart.
+    :param detector = CosmicWatch() class or FakeCosmicWatch() class. It must have attributes used by charts.
+    :param animated = bool
+    :param multiple = bool
+    :param masterGUI = GUIControl() class, the master GUI
+    :param chart_list_index = int, index of this window on chart_list of GUI. Used for memory clearing.
+    :param heatmap = bool, show live HeatmapChart (animated must be True)
+    '''
+
+    chart_updater = pyqtSignal() # signal used to update chart on button change
+
+    color_dict = {
+        'Blue': '#31B3E8',
+        'Red': '#ff0000',
+        'Black': '#000000',
+        'Violet': '#ee82ee',
+        'Green': '#228b22',
+        'Brown': '#a52a3a',
+        'Chocolate': '#d2691e',
+        'Orange': '#ffa500'
+    }
+
+    def __init__(self, mode, detector, animated, multiple, masterGUI, chart_list_index, heatmap=False):
+        super().__init__()
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+
+        self.data_pack_list = []
+        self.masterGUI = masterGUI
+        self.animated = animated == True and multiple == False # myFig is LiveChart drawn by ChartScheduler
+        self.detector = detector
+        self.heatmap = heatmap
+        self.multiple = multiple
+        self.chart_list_index = chart_list_index
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+
+        if multiple == True:
+            self.setWindowTitle(mode)
+            #self.myFig = MultipleChart(mode, self, self.chart_updater)
+            self.myFig = RatesChart(mode, self, self.chart_updater)
+        elif animated == False:
+            self.setWindowTitle(mode)
+            self.myFig = StaticChart(mode, detector, self.chart_updater)
+        elif heatmap == True:
+            self.setWindowTitle(mode + ' 2D histogram [Online]')
+            self.myFig = HeatmapChart(mode, detector)
+        else:
+            self.setWindowTitle(mode + ' [Online]')
+            self.myFig = AnimatedChart(mode, detector)
+
+        self.myFig.calibration = masterGUI.get_calibration()
+        if self.animated == True:
+            masterGUI.get_chart_scheduler().add(self.myFig)
+
+        toolbar = NavigationToolbar(self.myFig, self)
+        layout.addWidget(toolbar)
+        layout.addWidget(self.myFig)
+
+        if multiple == True:
+            buttons = self.create_buttons_rates()
+        elif heatmap == True:
+            buttons = self.create_buttons_heatmap()
+        else:
+            buttons = self.create_buttons()
+
+        layout.addLayout(buttons)
+
+        self.setStyleSheet('background-color: #f7f9d4')
+        self.show()
+
+    def create_buttons_rates(self):
+        '''
+         Creates radio buttons
+         Scales: linear vs log
+         Xscale: distance vs angle
+         Bars: empty vs filled
+          '''
+        #.adc = x scale unit
+
+        # button settings
+        buttons = QGridLayout()
+        scales = QButtonGroup(self)
+        values = QButtonGroup(self)
+        buttons.setAlignment(Qt.AlignHCenter)
+
+        linear_scale = QRadioButton('Linear scale')
+        linear_scale.log = False
+        linear_scale.setChecked(True)
+        linear_scale.toggled.connect(self.change_scale)
+        scales.addButton(linear_scale)
+        buttons.addWidget(linear_scale, 1, 0)
+
+        log_scale = QRadioButton('Log scale')
+        log_scale.log = True
+        log_scale.toggled.connect(self.change_scale)
+        scales.addButton(log_scale)
+        buttons.addWidget(log_scale, 0, 0)
+
+        distance_values = QRadioButton('Compare distances')
+        distance_values.adc = True  # x axis distance
+        distance_values.xlabel = 'Distance [cm]'
+        distance_values.toggled.connect(self.change_values)
+        values.addButton(distance_values)
+        buttons.addWidget(distance_values, 0, 1)
+
+        angle_values = QRadioButton('Compare angles')
+        angle_values.adc = False  # x axis = angle
+        angle_values.xlabel = 'Angle [deg]'
+        angle_values.toggled.connect(self.change_values)
+        angle_values.setChecked(True)
+        values.addButton(angle_values)
+        buttons.addWidget(angle_values, 1, 1)
+
+        add_chart_button = QPushButton('Add graph')
+        add_chart_button.clicked.connect(self.add_chart)
+
+        edit_chart_button = QPushButton('Edit graph')
+        edit_chart_button.clicked.connect(self.edit_chart)
+
+        buttons.addWidget(add_chart_button, 1, 3)
+        buttons.addWidget(edit_chart_button, 0, 3)
+
+        return buttons
+
+    def create_buttons(self):
+        '''
+        Creates radio buttons
+        Scales: linear vs log
+        Xscale: amplitudes vs adc
+        Bars: empty vs filled
+        '''
+        # button settings
+        buttons = QGridLayout()
+        scales = QButtonGroup(self)
+        values = QButtonGroup(self)
+        buttons.setAlignment(Qt.AlignHCenter)
+
+        linear_scale = QRadioButton('Linear scale')
+        linear_scale.log = False
+        linear_scale.setChecked(True)
+        linear_scale.toggled.connect(self.change_scale)
+        scales.addButton(linear_scale)
+        buttons.addWidget(linear_scale, 1, 0)
+
+        log_scale = QRadioButton('Log scale')
+        log_scale.log = True
+        log_scale.toggled.connect(self.change_scale)
+        scales.addButton(log_scale)
+        buttons.addWidget(log_scale, 0, 0)
+
+        digital_values = QRadioButton('Digital values')
+        digital_values.adc = True
+        digital_values.xlabel = 'ADC [0-1023]'
+        digital_values.toggled.connect(self.change_values)
+        values.addButton(digital_values)
+        buttons.addWidget(digital_values, 0, 1)
+
+        analog_values = QRadioButton('Analog amplitudes')
+        analog_values.adc = False
+        analog_values.xlabel = 'Amplitude [mV]'
+        analog_values.toggled.connect(self.change_values)
+        analog_values.setChecked(True)
+        values.addButton(analog_values)
+        buttons.addWidget(analog_values, 1, 1)
+
+        filling = QButtonGroup()
+
+        filled = QRadioButton('Bars filled')
+        filled.fill = 'stepfilled'
+        filled.toggled.connect(self.change_fill)
+        filling.addButton(filled)
+        buttons.addWidget(filled, 0, 2)
+
+        empty = QRadioButton('Bars empty')
+        empty.fill = 'step'
+        empty.setChecked(True)
+        empty.toggled.connect(self.change_fill)
+        filling.addButton(empty)
+        buttons.addWidget(empty, 1, 2)
+
+        corrected = QCheckBox('Temperature corrected')
+        corrected.setToolTip('Amplitudes corrected with coefficients from "Calibrate temperature".')
+        corrected.toggled.connect(self.change_correction)
+        buttons.addWidget(corrected, 0, 4)
+
+        if self.multiple == False:
+            color_box = QComboBox()
+            color_list = sorted(self.color_dict.keys())
+            for color in color_list:
+                color_box.addItem(color)
+            color_box.setCurrentIndex(1)
+            color_box.currentIndexChanged.connect(self.change_color)
+            buttons.addWidget(color_box, 1, 3)
+
+            color_label = QLabel()
+            color_label.setText('Color selection:')
+            buttons.addWidget(color_label, 0, 3)
+
+            fit = QCheckBox('Fit MIP peak')
+            fit.setToolTip('Landau convolved with Gauss on exponential background fitted to analog amplitudes.')
+            fit.toggled.connect(self.change_fit)
+            buttons.addWidget(fit, 1, 4)
+        else:
+            add_chart_button = QPushButton('Add graph')
+            add_chart_button.clicked.connect(self.add_chart)
+
+            edit_chart_button = QPushButton('Edit graph')
+            edit_chart_button.clicked.connect(self.edit_chart)
+
+            buttons.addWidget(add_chart_button, 1, 3)
+            buttons.addWidget(edit_chart_button, 0, 3)
+
+        return buttons
+
+    def create_buttons_heatmap(self):
+        '''
+        Creates radio buttons
+        Colors: linear vs log
+        Values: amplitudes vs adc
+        Xscale: time vs temperature
+        '''
+        buttons = QGridLayout()
+        scales = QButtonGroup(self)
+        values = QButtonGroup(self)
+        axes = QButtonGroup(self)
+        buttons.setAlignment(Qt.AlignHCenter)
+
+        linear_scale = QRadioButton('Linear colors')
+        linear_scale.log = False
+        linear_scale.toggled.connect(self.change_scale)
+        scales.addButton(linear_scale)
+        buttons.addWidget(linear_scale, 1, 0)
+
+        log_scale = QRadioButton('Log colors')
+        log_scale.log = True
+        log_scale.setChecked(True)
+        log_scale.toggled.connect(self.change_scale)
+        scales.addButton(log_scale)
+        buttons.addWidget(log_scale, 0, 0)
+
+        digital_values = QRadioButton('Digital values')
+        digital_values.adc = True
+        digital_values.xlabel = 'ADC [0-1023]'
+        digital_values.toggled.connect(self.change_values)
+        values.addButton(digital_values)
+        buttons.addWidget(digital_values, 0, 1)
+
+        analog_values = QRadioButton('Analog amplitudes')
+        analog_values.adc = False
+        analog_values.xlabel = 'Amplitude [mV]'
+        analog_values.setChecked(True)
+        analog_values.toggled.connect(self.change_values)
+        values.addButton(analog_values)
+        buttons.addWidget(analog_values, 1, 1)
+
+        time_axis = QRadioButton('Against time')
+        time_axis.temperature = False
+        time_axis.setChecked(True)
+        time_axis.toggled.connect(self.change_axis)
+        axes.addButton(time_axis)
+        buttons.addWidget(time_axis, 0, 2)
+
+        temperature_axis = QRadioButton('Against temperature')
+        temperature_axis.temperature = True
+        temperature_axis.toggled.connect(self.change_axis)
+        axes.addButton(temperature_axis)
+        buttons.addWidget(temperature_axis, 1, 2)
+
+        return buttons
+
+    def add_chart(self):
+        '''
+        Opens dialog box for file select of .txt and .csv and saves it full path to self.file_path.
+        Opens selected .txt or .csv file as chart. Requires empty line after header or no header (raw data).
+        '''
+        open_file = QFileDialog.getOpenFileName(self, 'Open measurements file', '', 'Data files (*.txt *.csv *.gz *.xz *.h5 *.manifest.json)')
+        file_path = open_file[0]
+        if file_path == '':
+            self.masterGUI.update_info_panel('No file was selected.')
+        else:
+            self.masterGUI.update_info_panel('Selected file: ' + file_path)
+            #Opens selected .txt or .csv file as chart. Requires empty line after header or no header (raw data).
+            try:
+                data_pack = self.masterGUI.prepare_data(file_path)
+                self.data_pack_list.append(data_pack)
+            except Exception as DataReadingError:
+                self.masterGUI.warning_info_panel('Data reading failed. Error: ' + repr(DataReadingError))
+        self.chart_updater.emit()
+
+    def edit_chart(self):
+        pass
+
+    def change_scale(self):
+        button = self.sender()
+        if button.isChecked():
+            self.myFig.log = button.log
+            self.chart_updater.emit()
+
+    def change_values(self):
+        button = self.sender()
+        if button.isChecked():
+            self.myFig.adc_mode = button.adc
+            self.myFig.xlabel = button.xlabel
+            self.chart_updater.emit()
+
+    def change_axis(self):
+        button = self.sender()
+        if button.isChecked():
+            self.myFig.temperature_mode = button.temperature
+            self.chart_updater.emit()
+
+    def change_fill(self):
+        button = self.sender()
+        if button.isChecked():
+            self.myFig.fill = button.fill
+            self.chart_updater.emit()
+
+    def change_correction(self):
+        box = self.sender()
+        self.myFig.corrected = box.isChecked()
+        self.chart_updater.emit()
+
+    def change_fit(self):
+        box = self.sender()
+        self.myFig.fit = box.isChecked()
+        self.chart_updater.emit()
+
+    def change_color(self):
+        box = self.sender()
+        color = box.currentText()
+        self.myFig.color = self.color_dict[color]
+        self.chart_updater.emit()
+
+    def changeEvent(self, event):
+        '''
+        ChartScheduler skips chart of minimized window until it is shown again.
+        '''
+        if event.type() == QtCore.QEvent.WindowStateChange and self.animated == True:
+            self.myFig.visible = self.isMinimized() == False
+        super().changeEvent(event)
+
+    def closeEvent(self, event):
+        '''
+        On window closing delete references to this window from masterGUI.charts to let it be handled by garbage collector
+        :return:
+        '''
+        # Chart closed
+        if self.animated == True:
+            self.masterGUI.get_chart_scheduler().remove(self.myFig)
+        self.masterGUI.charts.remove(self)
+
+class ChartScheduler(QObject):
+    '''
+    One timer redrawing all live charts. Charts of minimized windows are skipped. A chart is due when
+    new events / events_per_frame (at most 1) + seconds since its last draw / max_interval reaches 1, so a busy
+    detector is redrawn often and a quiet one rarely, and when its settings changed. Measured draw times are paid
+    from a credit growing by cpu_share of real time, so drawing doesn't take more CPU with more windows, charts are
+    just redrawn less often. The most overdue chart is drawn first.
+    '''
+
+    tick = 100 # ms between checks of charts
+    min_interval = 0.25 # s, shortest time between draws of one chart
+    max_interval = 5.0 # s, chart with at least one new event is redrawn after this time
+    events_per_frame = 10 # new events making a chart due immediately (after min_interval)
+    cpu_share = 0.2 # fraction of one core used for drawing
+    max_credit = 0.5 # s of drawing saved while charts are idle
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.charts = []
+        self.credit = 0.0
+        self.last_tick = time.perf_counter()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.run)
+
+    def add(self, chart):
+        self.charts.append(chart)
+        if self.timer.isActive() == False:
+            self.last_tick = time.perf_counter()
+            self.timer.start(self.tick)
+
+    def remove(self, chart):
+        if chart in self.charts:
+            self.charts.remove(chart)
+        if len(self.charts) == 0:
+            self.timer.stop()
+
+    def urgency(self, chart, now):
+        '''
+        :return: chart is due when >= 1
+        '''
+        if chart.visible == False:
+            return 0.0
+        if chart.settings() != chart.drawn_settings:
+            return math.inf
+        new_events = chart.new_events()
+        age = now - chart.drawn_at
+        # expensive chart alone mustn't exceed cpu_share either
+        if new_events == 0 or age < max(self.min_interval, chart.draw_cost / self.cpu_share):
+            return 0.0
+        # events count up to one frame, beyond that charts are ordered by age, so busy charts can't starve others
+        return min(new_events / self.events_per_frame, 1.0) + age / self.max_interval
+
+    def run(self):
+        now = time.perf_counter()
+        self.credit = min(self.max_credit, self.credit + (now - self.last_tick) * self.cpu_share)
+        self.last_tick = now
+        if self.credit <= 0:
+            return
+        due = [(self.urgency(chart, now), chart) for chart in self.charts]
+        due.sort(key=lambda item: item[0], reverse=True)
+        for urgency, chart in due:
+            if urgency < 1 or self.credit <= 0:
+                break
+            start = time.perf_counter()
+            chart.refresh()
+            chart.drawn_at = time.perf_counter()
+            chart.draw_cost = chart.drawn_at - start
+            self.credit -= chart.draw_cost
+
+
+class LiveChart(FigureCanvas):
+    '''
+    Chart of running detector, drawn by ChartScheduler.
+    :param detector -> see class ChartWindow, it must have snapshot()
+    '''
+
+    def __init__(self, detector):
+        FigureCanvas.__init__(self, mpl_fig.Figure())
+        self.detector = detector
+        self.visible = True # False while window is minimized
+        self.drawn_version = 0 # events in drawn chart
+        self.drawn_settings = None # settings() of drawn chart
+        self.drawn_at = 0.0 # time.perf_counter() of last draw
+        self.draw_cost = 0.0 # s, measured duration of last refresh()
+
+    def settings(self):
+        '''
+        :return: tuple of attributes changed by buttons of Chart_Window
+        '''
+        return ()
+
+    def new_events(self):
+        return published_version(self.detector) - self.drawn_version
+
+    def refresh(self):
+        snapshot = self.detector.snapshot()
+        self.drawn_version = snapshot.version
+        self.drawn_settings = self.settings()
+        self.update_chart(snapshot)
+        self.draw()
+
+
+class AnimatedChart(LiveChart):
+    '''
+    Animated Chart
+    :param mode -> see class ChartWindow
+    :param detector -> see class ChartWindow
+    '''
+    #stopped = False
+    log = False
+
+    def __init__(self, mode, detector) -> None:
+        LiveChart.__init__(self, detector)
+        self.mode = mode
+
+        self.log = False
+        self.fill = 'step'
+        self.xlabel = 'Amplitude [mV]'
+        self.adc_mode = False
+        self.color = '#31B3E8'
+        self.adc_bin = 128
+        self.amplitude_bin = 60
+        self.corrected = False
+        self.calibration = {}
+        self.fit = False
+
+        self.axes = self.figure.subplots()
+        self.figure.set_facecolor('#f7f9d4')
+        self.axes.set_facecolor('#f7f9d4')
+
+    def settings(self):
+        return (self.log, self.fill, self.xlabel, self.adc_mode, self.color, self.corrected, self.fit)
+
+    def update_chart(self, snapshot):
+        '''
+        :param snapshot: EventSnapshot of detector, see Snapshots.py
+        '''
+        self.axes.clear()
+
+        if self.log == True:
+            self.adc_binb = 128
+            self.amplitude_bin = 60
+            self.axes.set_xscale("log")
+        else:
+            self.adc_bin = 128
+            self.amplitude_bin = 60
+            self.axes.set_xscale("linear")
+
+        if self.adc_mode == False:
+            amplitudes = snapshot.column('amplitudes_list')
+            if self.corrected == True:
+                amplitudes = correct_amplitudes(amplitudes, snapshot.column('temp_list'),
+                                                self.calibration.get(snapshot.device_id))
+            self.chart = self.axes.hist(amplitudes, bins=self.amplitude_bin, color = self.color, histtype = self.fill,
+                                        log = True)
+            if self.fit == True:
+                draw_mip_fit(self.axes, amplitudes, self.chart[1])
+        else:
+            self.chart = self.axes.hist(snapshot.column('adc_list'), bins=self.adc_bin, color= self.color,
+                                        histtype=self.fill, log= True)
+
+        self.axes.set_ylabel('Number of detections')
+        self.axes.set_xlabel(self.xlabel)
+        self.axes.set_title(self.mode + ' histogram')
+
+        return self.chart
+
+class Histogram2D():
+    '''
+    Event counts in a fixed grid of bins, an event is added in O(1). Y range is fixed. When x value beyond the last
+    column comes and grow is True, neighbouring columns are merged pairwise and x bin width doubles, so the array
+    keeps its size however long the run is.
+    :param x_range: (low, high) of x axis, initial range if grow is True
+    :param x_bins: number of x bins, even
+    :param y_range: (low, high) of y axis
+    :param y_bins: number of y bins
+    :param grow: bool, extend x range instead of dropping values above it
+    '''
+
+    def __init__(self, x_range, x_bins, y_range, y_bins, grow=False):
+        self.x_low = x_range[0]
+        self.x_width = (x_range[1] - x_range[0]) / x_bins
+        self.y_low = y_range[0]
+        self.y_width = (y_range[1] - y_range[0]) / y_bins
+        self.grow = grow
+        self.counts = numpy.zeros((x_bins, y_bins)) # [x, y]
+
+    def x_high(self):
+        return self.x_low + self.x_width * self.counts.shape[0]
+
+    def merge_columns(self):
+        half = self.counts.shape[0] // 2
+        self.counts[:half] = self.counts.reshape(half, 2, -1).sum(axis=1)
+        self.counts[half:] = 0
+        self.x_width *= 2
+
+    def add(self, x, y):
+        '''
+        :param x: array of x values of new events
+        :param y: array of y values of new events, NaN values are not counted
+        '''
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        valid = numpy.isfinite(x) & numpy.isfinite(y)
+        x = x[valid]
+        y = y[valid]
+        if x.size == 0:
+            return
+        while self.grow == True and x.max() >= self.x_high():
+            self.merge_columns()
+        x_index = numpy.floor((x - self.x_low) / self.x_width).astype(int)
+        y_index = numpy.floor((y - self.y_low) / self.y_width).astype(int)
+        inside = (x_index >= 0) & (x_index < self.counts.shape[0]) & (y_index >= 0) & (y_index < self.counts.shape[1])
+        numpy.add.at(self.counts, (x_index[inside], y_index[inside]), 1)
+
+    def extent(self):
+        '''
+        :return: [x_low, x_high, y_low, y_high] for imshow
+        '''
+        return [self.x_low, self.x_high(), self.y_low, self.y_low + self.y_width * self.counts.shape[1]]
+
+
+class HeatmapChart(LiveChart):
+    '''
+    Animated 2D histogram of SiPM amplitude or ADC against elapsed time or temperature. Only events which came since
+    the last frame are added to Histogram2D and the image of one imshow gets new data, so a frame costs the same at
+    any run length. Gain drift shows as a shift of the spectrum along the x axis.
+    :param mode -> see class ChartWindow
+    :param detector -> see class ChartWindow, it must have time_list and snapshot()
+    '''
+
+    time_range = (0, 60) # [min], initial x range of time histograms, it doubles when exceeded
+    time_bins = 120
+    temp_range = (0, 50) # [C]
+    temp_bins = 100
+    amplitude_range = (0, 1000) # [mV]
+    amplitude_bins = 100
+    adc_range = (0, 1024)
+    adc_bins = 128
+
+    def __init__(self, mode, detector) -> None:
+        LiveChart.__init__(self, detector)
+        self.mode = mode
+
+        self.log = True
+        self.adc_mode = False
+        self.xlabel = 'Amplitude [mV]' # label of amplitude axis, set by Chart_Window.change_values()
+        self.temperature_mode = False # x axis Temp[C] instead of elapsed time
+        self.calibration = {}
+
+        # (adc_mode, temperature_mode) -> histogram, all of them are filled so switching doesn't need old event times
+        self.histograms = {}
+        for adc_mode, y_range, y_bins in [(False, self.amplitude_range, self.amplitude_bins),
+                                          (True, self.adc_range, self.adc_bins)]:
+            self.histograms[(adc_mode, False)] = Histogram2D(self.time_range, self.time_bins, y_range, y_bins, True)
+            self.histograms[(adc_mode, True)] = Histogram2D(self.temp_range, self.temp_bins, y_range, y_bins)
+        self.used = 0 # events of detector lists already added to histograms
+        self.first_time = None # time of first event, start of time axis
+
+        self.axes = self.figure.subplots()
+        self.figure.set_facecolor('#f7f9d4')
+        self.axes.set_facecolor('#f7f9d4')
+        histogram = self.histograms[(self.adc_mode, self.temperature_mode)]
+        self.image = self.axes.imshow(histogram.counts.T, origin='lower', aspect='auto', interpolation='nearest',
+                                      extent=histogram.extent(), cmap='viridis')
+        self.colorbar = self.figure.colorbar(self.image, ax=self.axes)
+        self.colorbar.set_label('Number of detections')
+
+    def settings(self):
+        return (self.log, self.adc_mode, self.xlabel, self.temperature_mode)
+
+    def add_new_events(self, snapshot):
+        '''
+        Adds events which came since the last call.
+        :param snapshot: EventSnapshot of detector, see Snapshots.py
+        '''
+        if snapshot.version <= self.used:
+            return
+        times = numpy.array(snapshot.column('time_list', self.used), dtype=float)
+        if self.first_time is None:
+            self.first_time = times[0]
+        minutes = (times - self.first_time) / 60
+        temperatures = numpy.array(snapshot.column('temp_list', self.used), dtype=float)
+        for adc_mode, values in [(False, snapshot.column('amplitudes_list', self.used)),
+                                 (True, snapshot.column('adc_list', self.used))]:
+            self.histograms[(adc_mode, False)].add(minutes, values)
+            self.histograms[(adc_mode, True)].add(temperatures, values)
+        self.used = snapshot.version
+
+    def update_chart(self, snapshot):
+        self.add_new_events(snapshot)
+        histogram = self.histograms[(self.adc_mode, self.temperature_mode)]
+        counts = histogram.counts.T
+        top = max(counts.max(), 1)
+        if self.log == True:
+            self.image.set_norm(mpl_colors.LogNorm(vmin=1, vmax=max(top, 10)))
+            counts = numpy.ma.masked_less(counts, 1) # empty bins stay background
+        else:
+            self.image.set_norm(mpl_colors.Normalize(vmin=0, vmax=top))
+        self.image.set_data(counts)
+        self.image.set_extent(histogram.extent())
+
+        self.axes.set_xlabel('Temperature [C]' if self.temperature_mode == True else 'Time since first event [min]')
+        self.axes.set_ylabel(self.xlabel)
+        self.axes.set_title(self.mode + ' 2D histogram')
+        return [self.image]
+
+
+class StaticChart(FigureCanvas):
+    '''
+    Static chart
+    :param mode -> see class ChartWindow
+    :param CosmicWatch -> see class ChartWindow
+    :param chart_updater -> see class ChartWindow
+    '''
+
+    # lists used as data references for chart
+    adc_list = []
+    amplitudes_list = []
+
+    def __init__(self, mode, CosmicWatch, chart_updater) -> None:
+        FigureCanvas.__init__(self, mpl_fig.Figure())
+        self.mode = mode
+        chart_updater.connect(self.update_chart)
+
+        self.log = False
+        self.fill = 'step'
+        self.xlabel = 'Amplitude [mV]'
+        self.adc_mode = False
+        self.color = '#31B3E8'
+
+        self.adc_bin = 128
+        self.amplitude_bin = 60
+
+        self.corrected = False
+        self.calibration = {}
+        self.fit = False
+
+        self.amplitudes_list.clear()
+        self.adc_list.clear()
+        self.detector = CosmicWatch
+        self.amplitudes = CosmicWatch.amplitudes_list
+        self.adc_list = CosmicWatch.adc_list
+
+        self.axes = self.figure.subplots()
+        self.figure.set_facecolor('#f7f9d4')
+        self.axes.set_facecolor('#f7f9d4')
+
+        if self.adc_mode == False:
+            self.chart = self.axes.hist(self.amplitudes, bins=128, color = self.color, histtype = self.fill, log = True)
+
+        else:
+            self.chart = self.axes.hist(self.adc_list, bins=128, color= self.color, histtype=self.fill, log= True)
+
+        self.draw()
+
+    def update_chart(self):
+
+        self.axes.clear()
+
+        if self.log == True:
+            self.adc_bin = 128
+            self.amplitude_bin = 60
+            self.axes.set_xscale("log")
+        else:
+            self.adc_bin = 128
+            self.amplitude_bin = 60
+            self.axes.set_xscale("linear")
+
+        if self.adc_mode == False:
+            amplitudes = amplitude_data(self.detector, self.corrected, self.calibration)
+            self.chart = self.axes.hist(amplitudes, bins=self.amplitude_bin, color = self.color, histtype = self.fill,
+                                        log = True)
+            if self.fit == True:
+                draw_mip_fit(self.axes, amplitudes, self.chart[1])
+        else:
+            self.chart = self.axes.hist(self.adc_list, bins=self.adc_bin, color= self.color, histtype=self.fill, log= True)
+
+        self.axes.set_ylabel('Number of detections')
+        self.axes.set_xlabel(self.xlabel)
+        self.axes.set_title(self.mode + ' histogram')
+
+        self.draw()
+
+class MultipleChart(FigureCanvas):
+    '''
+    Static chart
+    :param mode -> see class ChartWindow
+    :param CosmicWatch -> see class ChartWindow
+    :param chart_updater -> see class ChartWindow
+    '''
+
+    # lists used as data references for chart
+    adc_list = []
+    amplitudes_list = []
+
+    def __init__(self, mode, chart_window, chart_updater) -> None:
+        FigureCanvas.__init__(self, mpl_fig.Figure())
+        self.mode = mode
+        chart_updater.connect(self.update_chart)
+        self.chart_window = chart_window
+        self.color_list = ['Blue', 'Red', 'Black', 'Violet', 'Green', 'Brown', 'Chocolate', 'Orange']
+
+        self.log = False
+        self.fill = 'step'
+        self.xlabel = 'Amplitude [mV]'
+        self.adc_mode = False
+        self.color = '#31B3E8'
+
+        self.adc_bin = 128
+        self.amplitude_bin = 60
+
+        # self.amplitudes_list.clear()
+        # self.adc_list.clear()
+        # self.amplitudes = CosmicWatch.amplitudes_list
+        # self.adc_list = CosmicWatch.adc_list
+
+        self.axes = self.figure.subplots()
+        self.figure.set_facecolor('#f7f9d4')
+        self.axes.set_facecolor('#f7f9d4')
+        #
+        # if self.adc_mode == False:
+        #     self.chart = self.axes.hist(self.amplitudes, bins=128, color = self.color, histtype = self.fill, log = True)
+        # else:
+        #     self.chart = self.axes.hist(self.adc_list, bins=128, color= self.color, histtype=self.fill, log= True)
+
+        self.draw()
+
+    def update_chart(self):
+
+        self.axes.clear()
+
+        if self.log:
+            self.adc_bin = 128
+            self.amplitude_bin = 60
+            self.axes.set_xscale("log")
+        else:
+            self.adc_bin = 128
+            self.amplitude_bin = 60
+            self.axes.set_xscale("linear")
+
+        color_index = 0
+        charts = []
+        data_pack_list = self.chart_window.data_pack_list
+        for pack in data_pack_list:
+            print('Graphing number: ' + repr(color_index))
+            print(repr(pack))
+            if self.adc_mode == False:
+                chart = self.axes.hist(pack.amplitudes_list, bins=self.amplitude_bin,
+                               color = self.chart_window.color_dict[self.color_list[color_index]],
+                               histtype = self.fill, log = True)
+            else:
+                chart = self.axes.hist(pack.adc_list, bins=self.adc_bin,
+                               color= self.chart_window.color_dict[self.color_list[color_index]],
+                               histtype=self.fill, log= True)
+            color_index += 1
+            charts.append(chart)
+
+        self.axes.set_ylabel('Number of detections')
+        self.axes.set_xlabel(self.xlabel)
+        self.axes.set_title(self.mode + ' histogram')
+
+        self.draw()
+
+class RatesChart(FigureCanvas):
+    '''
+    Static chart
+    :param mode -> see class ChartWindow
+    :param CosmicWatch -> see class ChartWindow
+    :param chart_updater -> see class ChartWindow
+    '''
+
+    # lists used as data references for chart
+    distance_list = []
+    angle_list = []
+    rate_list = []
+
+    def __init__(self, mode, chart_window, chart_updater) -> None:
+        FigureCanvas.__init__(self, mpl_fig.Figure())
+        self.mode = mode
+        chart_updater.connect(self.update_chart)
+        self.chart_window = chart_window
+
+        self.log = False
+        self.fill = 'step'
+        self.xlabel = 'Distance [cm]'
+        self.adc_mode = False
+        self.color = '#31B3E8'
+
+        self.axes = self.figure.subplots()
+        self.figure.set_facecolor('#f7f9d4')
+        self.axes.set_facecolor('#f7f9d4')
+
+        self.draw()
+
+    def update_chart(self):
+
+        self.axes.clear()
+
+        if self.log == True:
+            self.axes.set_xscale("log")
+        else:
+            self.axes.set_xscale("linear")
+
+        color_index = 0
+        charts = []
+        data_pack_list = self.chart_window.data_pack_list
+        self.distance_list = [-1]*len(data_pack_list)
+        self.rate_list = [-1]*len(data_pack_list)
+        self.angle_list = [-1]*len(data_pack_list)
+
+        i = -1
+
+        for pack in data_pack_list:
+            i+=1
+            print('Graphing number: ' + repr(color_index))
+            print(repr(pack))
+            print(len(data_pack_list))
+
+            #self.distance_list[i] = pack.distance
+            #self.angle_list[i] = pack.angle
+            #
+            try:
+                self.rate_list[i] = pack.rate
+                self.distance_list[i] = pack.distance
+                self.angle_list[i] = pack.angle
+
+                print(self.distance_list)
+                print(self.rate_list)
+
+            except Exception as PackError:
+                print(repr(PackError))
+                #TODO log the error
+
+        try:
+            distance_list, rate_dist = zip(*sorted(zip(self.distance_list, self.rate_list)))
+            angle_list, rate_angle = zip(*sorted(zip(self.angle_list, self.rate_list)))
+
+            z_dist = polyfit(self.distance_list, self.rate_list, 1)
+            trendline_dist = poly1d(z_dist)
+            z_angle = polyfit(self.angle_list, self.rate_list, 1)
+            trendline_angle = poly1d(z_angle)
+
+            # plot rates
+            if self.adc_mode == True:  # True -> distance; False -> Angle
+                #chart = self.axes.scatter(self.distance_list, self.rate_list)
+                chart = self.axes.plot(distance_list, rate_dist, 'bo', linewidth = 1, linestyle = '--')
+                print(distance_list)
+                self.axes.plot(self.distance_list, trendline_dist, 'r--')
+            else:
+                chart = self.axes.plot(angle_list, rate_angle, 'bo', linewidth = 1, linestyle = '--')
+                self.axes.plot(self.angle_list, trendline_angle, 'r--')
+            #TODO hideable trendline and lines [linewidth 0?]
+            #TODO fix trendline on >2 points not apperaing and on =2 points mirrored
+            charts.append(chart)
+
+        except Exception as DrawError:
+            print(repr(DrawError))
+            #TODO log the error
+
+        self.axes.set_ylabel('Rate [N/s]')
+        self.axes.set_xlabel(self.xlabel)
+        self.axes.set_title(self.mode + ' comparison')
+
+        self.draw()
@@ -0,0 +1,216 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Offline coincidences of MASTER and SLAVE data files of one run. Events are matched by computer time within a window
+with sorted arrays and numpy.searchsorted, O((N + M) log M). Reports coincidence rate, accidental rate (expected from
+singles rates and measured in off-time windows) and correlation of amplitudes of matched pairs.
+Usage: python Coincidence.py run_folder [--window 0.01] [--offset 0] [--scan -1 1 0.001]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy
+
+from DataFiles import is_segment, MANIFEST_SUFFIX
+from IntegrityCheck import read_valid_data
+
+WINDOW = 0.01 # seconds, default half width of coincidence window
+SIDEBANDS = 20 # number of off-time windows used to measure accidental rate
+OFFSET_FILE = 'time_offset.json' # saved in run folder by TimeOffset.py
+
+
+def load_events(path):
+    '''
+    :param path: full path of data file
+    :return: times (UTC seconds, sorted), amplitudes SiPM[mV] - numpy arrays, bad rows of integrity check skipped
+    '''
+    info, data = read_valid_data(path)
+    order = numpy.argsort(data['time'], kind='stable')
+    return data['time'][order], data['sipm'][order]
+
+
+def find_run_files(run_folder):
+    '''
+    :return: paths of MASTER and SLAVE data files of run folder
+    '''
+    master = None
+    slave = None
+    for file_name in sorted(os.listdir(run_folder)):
+        if file_name.endswith(('.csv', '.txt', '.gz', '.xz', MANIFEST_SUFFIX)) == False or is_segment(file_name):
+            continue
+        if '_MASTER_' in file_name:
+            master = os.path.join(run_folder, file_name)
+        elif '_SLAVE_' in file_name:
+            slave = os.path.join(run_folder, file_name)
+    if master is None or slave is None:
+        raise FileNotFoundError('Run folder ' + str(run_folder) + ' needs both MASTER and SLAVE data file.')
+    return master, slave
+
+
+def load_time_offset(run_folder):
+    '''
+    :return: dict saved by TimeOffset.py (offset, drift_ppm, reference_time, ...) or None if run has none
+    '''
+    try:
+        with open(os.path.join(run_folder, OFFSET_FILE), 'r') as offset_file:
+            return json.load(offset_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def correct_drift(slave_times, time_offset):
+    '''
+    Removes drift of slave clock, afterwards slave - master differs by constant time_offset['offset'].
+    :param time_offset: dict, see load_time_offset()
+    '''
+    drift = time_offset['drift_ppm'] / 1e6
+    return slave_times - drift * (slave_times - time_offset['reference_time'])
+
+
+def count_coincidences(master_times, slave_times, window, offset=0.0):
+    '''
+    Number of master events with at least one slave event in [t + offset - window, t + offset + window].
+    :param master_times: sorted array
+    :param slave_times: sorted array
+    :param offset: seconds added to master times (slave clock minus master clock)
+    '''
+    shifted = master_times + offset
+    left = numpy.searchsorted(slave_times, shifted - window, 'left')
+    right = numpy.searchsorted(slave_times, shifted + window, 'right')
+    return int(numpy.count_nonzero(right > left))
+
+
+def match_events(master_times, slave_times, window, offset=0.0):
+    '''
+    Pairs every master event with the nearest slave event within window, each slave event is used at most once.
+    :return: indexes of master events, indexes of slave events, time differences slave - (master + offset)
+    '''
+    if slave_times.size == 0:
+        return numpy.empty(0, int), numpy.empty(0, int), numpy.empty(0)
+    shifted = master_times + offset
+    after = numpy.searchsorted(slave_times, shifted)
+    before = numpy.clip(after - 1, 0, slave_times.size - 1)
+    after = numpy.clip(after, 0, slave_times.size - 1)
+    use_after = numpy.abs(slave_times[after] - shifted) < numpy.abs(slave_times[before] - shifted)
+    nearest = numpy.where(use_after, after, before)
+    differences = slave_times[nearest] - shifted
+    master_index = numpy.flatnonzero(numpy.abs(differences) <= window)
+    slave_index = nearest[master_index]
+    differences = differences[master_index]
+
+    # slave event nearest to two master events: keep the closer pair
+    order = numpy.lexsort((numpy.abs(differences), slave_index))
+    first = numpy.ones(order.size, bool)
+    first[1:] = slave_index[order][1:] != slave_index[order][:-1]
+    keep = numpy.sort(order[first])
+    return master_index[keep], slave_index[keep], differences[keep]
+
+
+def pair_differences(master_times, slave_times, low, high):
+    '''
+    Time differences slave - master of all pairs with difference in [low, high], O(N log M + pairs).
+    :return: sorted array of differences
+    '''
+    left = numpy.searchsorted(slave_times, master_times + low, 'left')
+    right = numpy.searchsorted(slave_times, master_times + high, 'right')
+    counts = right - left
+    group_start = numpy.cumsum(counts) - counts
+    slave_index = numpy.arange(counts.sum()) + numpy.repeat(left - group_start, counts)
+    differences = slave_times[slave_index] - numpy.repeat(master_times, counts)
+    differences.sort()
+    return differences
+
+
+def scan_offsets(master_times, slave_times, window, offsets):
+    '''
+    Counts pairs within window for many offsets at once: differences of all pairs in scanned range are computed
+    once, each offset is then two binary searches. Counts pairs, so a master event with two slave events in window
+    counts twice (rare for short windows).
+    :param offsets: array of offsets to try
+    :return: array of coincidence counts for each offset
+    '''
+    offsets = numpy.asarray(offsets, dtype=float)
+    if offsets.size == 0:
+        return numpy.empty(0, int)
+    differences = pair_differences(master_times, slave_times, offsets.min() - window, offsets.max() + window)
+    return numpy.searchsorted(differences, offsets + window, 'right') - \
+           numpy.searchsorted(differences, offsets - window, 'left')
+
+
+def analyse_coincidences(master, slave, window=WINDOW, offset=0.0):
+    '''
+    :param master: times, amplitudes of master detector, see load_events()
+    :param slave: times, amplitudes of slave detector
+    :return: dict with counts, rates [1/s], accidental rates and amplitude correlation of matched pairs
+    '''
+    master_times, master_amplitudes = master
+    slave_times, slave_amplitudes = slave
+    start = max(master_times[0], slave_times[0] - offset) if master_times.size and slave_times.size else 0.0
+    end = min(master_times[-1], slave_times[-1] - offset) if master_times.size and slave_times.size else 0.0
+    duration = max(end - start, 0.0)
+
+    master_index, slave_index, differences = match_events(master_times, slave_times, window, offset)
+    # off-time windows far from any true coincidence measure accidentals directly
+    sidebands = scan_offsets(master_times, slave_times, window,
+                             [offset + 10 * window * (k + 1) * sign for k in range(SIDEBANDS // 2) for sign in (-1, 1)])
+
+    result = {'master_events': int(master_times.size), 'slave_events': int(slave_times.size),
+              'duration': duration, 'window': window, 'offset': offset,
+              'coincidences': int(master_index.size), 'rate': numpy.nan, 'rate_error': numpy.nan,
+              'accidental_rate_expected': numpy.nan, 'accidental_rate_measured': numpy.nan,
+              'time_difference_mean': float(differences.mean()) if differences.size else numpy.nan,
+              'time_difference_std': float(differences.std()) if differences.size else numpy.nan,
+              'amplitude_correlation': numpy.nan, 'amplitude_slope': numpy.nan}
+    if duration > 0:
+        master_rate = master_times.size / duration
+        slave_rate = slave_times.size / duration
+        result['rate'] = master_index.size / duration
+        result['rate_error'] = master_index.size**(1/2) / duration
+        result['accidental_rate_expected'] = 2 * window * master_rate * slave_rate
+        result['accidental_rate_measured'] = float(numpy.mean(sidebands)) / duration
+    pairs_master = master_amplitudes[master_index]
+    pairs_slave = slave_amplitudes[slave_index]
+    valid = numpy.isfinite(pairs_master) & numpy.isfinite(pairs_slave)
+    if numpy.count_nonzero(valid) > 2 and pairs_master[valid].std() > 0 and pairs_slave[valid].std() > 0:
+        result['amplitude_correlation'] = float(numpy.corrcoef(pairs_master[valid], pairs_slave[valid])[0, 1])
+        result['amplitude_slope'] = float(numpy.polyfit(pairs_master[valid], pairs_slave[valid], 1)[0])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Match MASTER and SLAVE events of one run.')
+    parser.add_argument('run_folder', help='folder with MASTER and SLAVE data files')
+    parser.add_argument('--window', type=float, default=WINDOW, help='half width of coincidence window [s]')
+    parser.add_argument('--offset', type=float, default=None,
+                        help='slave time minus master time [s], default: ' + OFFSET_FILE + ' of run or 0')
+    parser.add_argument('--scan', type=float, nargs=3, metavar=('FROM', 'TO', 'STEP'), default=None,
+                        help='scan offsets and use the one with most coincidences')
+    args = parser.parse_args(argv)
+
+    master_path, slave_path = find_run_files(args.run_folder)
+    master = load_events(master_path)
+    slave = load_events(slave_path)
+    offset = args.offset
+    time_offset = load_time_offset(args.run_folder)
+    if offset is None and args.scan is None and time_offset is not None:
+        slave = (correct_drift(slave[0], time_offset), slave[1])
+        offset = time_offset['offset']
+        print('Using ' + OFFSET_FILE + ': offset ' + '{:.4f}'.format(offset) + ' s, drift ' +
+              '{:.1f}'.format(time_offset['drift_ppm']) + ' ppm.')
+    offset = offset or 0.0
+    if args.scan is not None:
+        offsets = numpy.arange(args.scan[0], args.scan[1] + args.scan[2] / 2, args.scan[2])
+        counts = scan_offsets(master[0], slave[0], args.window, offsets)
+        offset = float(offsets[numpy.argmax(counts)])
+        print('Offset scan: best ' + '{:.4f}'.format(offset) + ' s with ' + str(counts.max()) + ' coincidences.')
+
+    result = analyse_coincidences(master, slave, args.window, offset)
+    for key, value in result.items():
+        print(key + ': ' + ('{:.6g}'.format(value) if isinstance(value, float) else str(value)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
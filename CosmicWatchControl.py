@@ -8,10 +8,20 @@ Contact: pawel.pietrzak7.stud@pw.edu.pl
 
 from PyQt5.QtCore import pyqtSignal, QObject
 import datetime
+import time
 from pathlib import Path
 from threading import Thread, Event
 import serial
 
+from DataFiles import DataFileWriter, RotatingFileWriter, COMPRESSIONS, MANIFEST_SUFFIX
+from Timestamping import HostClock, ArduinoClockFit
+from Livetime import LivetimeAccount
+from HDF5Store import HDF5EventWriter, HDF5_SUFFIX
+from StreamingStats import DetectorStatistics, STATS_SUFFIX
+from Integrity import IntegrityMonitor, summary
+from Anomalies import AnomalyMonitor
+from Snapshots import EventSnapshot
+
 class CosmicWatch(QObject):
     '''
     port_name: com port, string, e.g. 'com7'
@@ -28,17 +38,36 @@ class CosmicWatch(QObject):
     directory = '' # directory of measurements folder
     device_id = 'N/A'
     mode = 'N/A' # Master or Slave
-    full_path = 'N/A' # e.g. 'C:\Program Files\example.csv'
+    full_path = 'N/A' # e.g. 'C:\Program Files\example.csv', manifest 'example.manifest.json' of rotated run
+    base_path = 'N/A' # full path without suffix, e.g. 'C:\Program Files\example'
+    compression = '' # sent by GUI, '' for plain text file, 'gzip' or 'xz' for compressed file
+    rotation = {} # sent by GUI, limits of RotatingFileWriter, e.g. {'hours': 6}; empty for one file per run
+    header_lines = [] # header written to data file, repeated in every segment of rotated run
+    hdf5 = False # sent by GUI, save events also to HDF5 file
+    hdf5_file = None # HDF5EventWriter used when hdf5 is True
+    data_file = None # DataFileWriter of running measurement
+    hdf5_path = 'N/A' # e.g. 'C:\Program Files\example.h5'
+    stats_path = 'N/A' # e.g. 'C:\Program Files\example.stats.json'
     amplitude = 'N/A' # SiPM voltage of last event
     number = 'N/A' # event number
     time = 'N/A' # event time
     rate = 'N/A' # event rate/s
     rate_error = 'N/A' # +/- error of rate
     time_start = 0
+    clock = None # HostClock shared by detectors, sent by GUI
     deadtime = 0
-    fail_counter = 0 # data reading will stop after 4 failed attempts to read data
+    fail_counter = 0 # number of failed attempts to read data since last successful line
     stop = False
 
+    read_timeout = 1 # seconds, serial read timeout after header is read, a stuck read returns after this time
+    reconnect_min_delay = 0.1 # seconds, first delay between reconnect attempts, doubled after each failure
+    reconnect_max_delay = 2.0 # seconds, upper bound of delay between reconnect attempts
+    reconnects = 0 # number of successful reconnects
+    events_written = 0 # events saved to data file, read by metrics endpoint
+    last_event_time = None # UTC seconds since 1970 of last event
+    outage_start = 0 # time.monotonic() of connection loss
+    port_return_time = None # time.monotonic() when PortMonitor reported the port is back
+
     distance = '' # sent by GUI, distance between detectors
     angle = '' # sent by GUI, angle between detectors
 
@@ -49,14 +78,27 @@ class CosmicWatch(QObject):
 
     table_updater = pyqtSignal() # signal sent to GUI to update table
     chart_initializer = pyqtSignal() # signal sent to GUI to initialize chart when it's ready
+    connection_changed = pyqtSignal(bool, float) # connected, time of HostClock.elapsed(); used by acquisition process
+
+    event_ring = None # EventRing events are written to when running in acquisition process
+    version = 0 # events complete in all event lists, published after they are appended, see Snapshots.py
+    integrity_log_limit = 10 # issues of one kind written to log per run, the rest is only counted
 
 
     def __init__(self):
         # clear ampliudes and adc lists, to make sure GUI won't keep old values
         self.amplitudes_list = []
         self.adc_list = []
+        self.temp_list = []
+        self.time_list = [] # UTC seconds of events, used by 2D histograms against time
         self.amplitudes_list.clear()
         self.adc_list.clear()
+        self.port_event = Event() # set when port is available again or program is stopped
+        self.clock_fit = ArduinoClockFit() # Arduino time -> host time fit of this detector
+        self.livetime = LivetimeAccount() # pause/disconnect intervals and dead time of this detector
+        self.statistics = DetectorStatistics() # streaming statistics of ADC, SiPM, temperature, inter-arrival time
+        self.integrity = IntegrityMonitor() # event gaps, counter resets, malformed lines of this detector
+        self.anomalies = AnomalyMonitor() # rate and spectrum changes, None when GUI side checks them
 
         super().__init__()
 
@@ -124,7 +166,15 @@ class CosmicWatch(QObject):
         else:
             results_name += ('_SLAVE_')
         results_name += self.device_id
-        results_name += '.csv'
+        self.hdf5_path = self.directory + results_name + HDF5_SUFFIX
+        self.stats_path = self.directory + results_name + STATS_SUFFIX
+        self.base_path = self.directory + results_name
+        if len(self.rotation) > 0: # segments are created by RotatingFileWriter in self.data_file_writer()
+            results_name += MANIFEST_SUFFIX
+        else:
+            results_name += '.csv'
+            if self.compression != '':
+                results_name += COMPRESSIONS[self.compression][0]
         print(results_name)
 
         # MOVED TO GUI
@@ -139,122 +189,305 @@ class CosmicWatch(QObject):
 
         self.full_path = self.directory + results_name
 
-        with open(self.full_path, 'w', newline='') as results:
-            # TODO better header edition
-            # TODO editing not ignoring arduino header
-            header[-4] = '### Comp_date Comp_time Event Ardn_time[ms] ' \
-                         'ADC[0-1023] SiPM[mV] Deadtime[ms] Temp[C] Rate[N/s]\r\n'
+        # TODO better header edition
+        # TODO editing not ignoring arduino header
+        header[-4] = '### Comp_date Comp_time Event Ardn_time[ms] ' \
+                     'ADC[0-1023] SiPM[mV] Deadtime[ms] Temp[C] Rate[N/s]\r\n'
 
-            header[
-                -4] = '### Distance: ' + self.distance + ' cm; Angle: ' + self.angle + ' degrees\r\n' + header[-4]
+        header[
+            -4] = '### Distance: ' + self.distance + ' cm; Angle: ' + self.angle + ' degrees\r\n' + header[-4]
+        self.header_lines = header + ['\r\n']
 
-            #
-            for string in header:
-                results.write(string)
-            results.write('\r\n')
-            print('\r\n')
+        if len(self.rotation) == 0:
+            with DataFileWriter(self.full_path, self.compression, 'w') as results:
+                for string in self.header_lines:
+                    results.write(string)
+        print('\r\n')
+
+        if self.hdf5 == True:
+            metadata = {'distance': self.distance, 'angle': self.angle, 'device_id': self.device_id,
+                        'mode': self.mode, 'port_name': self.port_name, 'start_time': self.time_start.isoformat()}
+            try:
+                self.hdf5_file = HDF5EventWriter(self.hdf5_path, header, metadata)
+                self.masterGUI.update_log('HDF5 file for ID ' + self.device_id + ' created. Path: ' + self.hdf5_path)
+            except Exception as exc:
+                self.hdf5_file = None
+                self.masterGUI.update_log('WARNING: HDF5 file cannot be created. Exception: ' + repr(exc))
 
         self.masterGUI.update_log('Detector connected on port: ' +self.port_name + '. ID: ' + self.device_id + \
                                   '. Mode: '+ self.mode)
         self.masterGUI.update_log('Measurements file for ID ' + self.device_id + ', Mode: ' + self.mode + \
                                   ', created. Path: ' + self.full_path)
 
+    def data_file_writer(self):
+        '''
+        :return: writer of data file created by self.create_file(), RotatingFileWriter if self.rotation is set
+        '''
+        if len(self.rotation) > 0:
+            return RotatingFileWriter(self.base_path, self.compression, self.header_lines, **self.rotation)
+        return DataFileWriter(self.full_path, self.compression)
+
     def read_data(self):
         '''
-        Reads data from serial port, saves it to specified file and prints it in console.
-        Calls self.update_values() to update values tracked by GUI.
+        Reads data from serial port, saves it to self.data_file and prints it in console.
+        Calls self.update_values() to update values tracked by GUI. Returns when connection is lost or program stopped.
         '''
-        with open(self.full_path, 'a', newline='') as cosmic_file:
-            while True:
-                # reads line from the port and prints it
-                try:
-                    feedback = self.detector.readline().decode()
-                    if self.paused == True:
-                        pass
-                    elif feedback == '':
-                        pass
-                    elif feedback[0] == '#':
-                        print(feedback)
-                        cosmic_file.write(feedback)
-                    else:
-                        time_now = datetime.datetime.now(datetime.timezone.utc)
-                        comp_date = time_now.strftime('%Y-%m-%d ')
-                        comp_time = time_now.time().strftime('%H:%M:%S.%f')
-                        comp_time = comp_time[0:-3] + ' '
-                        time_delta = int((time_now - self.time_start).total_seconds() * 1000)  # milliseconds since launch
-                        record = comp_date + comp_time + feedback
-
-                        printable_record = self.update_values(record, time_delta)
-                        self.table_updater.emit()
-
-                        print(printable_record)
-                        cosmic_file.write(printable_record)
-
-                    if self.fail_counter >=4:
-                        message =  'Connection with ' + self.port_name + \
-                                  ' restored. Connected CosmicWatch ID: ' + \
-                                  self.device_id + ' Mode: ' + self.mode + '.'
-                        self.masterGUI.update_log(message)
-                    self.fail_counter = 0
-
-                except Exception as exc:
-                    if self.fail_counter <= 4:
-                        self.fail_counter += 1
-                        message = 'Port: ' + self.port_name + '. Data line cannot be read. Retrying.  Exception: ' + \
-                                  repr(exc)
-                        self.masterGUI.update_log(message)
-                    elif self.fail_counter == 4:
-                        self.fail_counter += 1
-                        message = 'Data cannot be read 4 times. Connection with ' + self.port_name + \
-                                  ' lost. Disconnected CosmicWatch ID: ' + \
-                                  self.device_id + ' Mode: ' + self.mode + '.'
-                        self.masterGUI.update_log(message)
-                    print(repr(exc))
+        cosmic_file = self.data_file
+        while True:
+            # reads line from the port and prints it
+            try:
+                feedback = self.detector.readline().decode()
+                if self.paused == True:
+                    pass
+                elif feedback == '':
+                    pass
+                elif feedback[0] == '#':
+                    print(feedback)
+                    cosmic_file.write(feedback)
+                elif self.check_line(feedback) == False:
+                    # kept as comment for inspection, readers skip it
+                    cosmic_file.write('# Skipped line: ' + feedback.strip() + '\r\n')
+                else:
+                    host_time = self.clock.now()
+                    time_delta = int(self.clock.elapsed() * 1000)  # milliseconds since launch
+                    # event time corrected with Arduino clock fit, e.g. '2021-02-10 04:17:08.348211'
+                    event_time = self.clock_fit.timestamp(float(feedback.split()[1]), host_time)
+                    record = self.clock_fit.format(event_time) + ' ' + feedback
+
+                    printable_record = self.update_values(record, time_delta)
+                    self.time_list.append(event_time)
+                    self.version += 1
+                    self.statistics.add_event(event_time, feedback.split())
+                    if self.anomalies is not None:
+                        self.check_anomalies(event_time, float(feedback.split()[3]))
+                    self.table_updater.emit()
+
+                    print(printable_record)
+                    cosmic_file.write(printable_record)
+                    self.events_written += 1
+                    self.last_event_time = event_time
+                    if self.hdf5_file is not None:
+                        self.hdf5_file.append(event_time, printable_record.split()[2:])
+                    if self.event_ring is not None:
+                        self.event_ring.append([event_time] + [float(value) for value in feedback.split()[0:6]] +
+                                               [float(self.rate)])
+
+                self.fail_counter = 0
+
+            except Exception as exc:
+                cosmic_file.flush() # keep everything read so far on disk
+                if self.stop == True:
                     break
+                self.fail_counter += 1
+                self.outage_start = time.monotonic()
+                self.livetime.disconnect(self.clock.elapsed())
+                self.connection_changed.emit(False, self.clock.elapsed())
+                message = 'Data line cannot be read. Connection with ' + self.port_name + \
+                          ' lost. Disconnected CosmicWatch ID: ' + \
+                          self.device_id + ' Mode: ' + self.mode + '. Exception: ' + repr(exc)
+                self.masterGUI.update_log(message)
+                print(repr(exc))
+                self.close_port() # reconnect() opens a new handle
+                break
+
+    def check_line(self, feedback):
+        '''
+        Integrity check of line sent by Arduino, first issues of each kind are written to log.
+        :param feedback: line sent by Arduino
+        :return: False if line is malformed or out of range and mustn't be saved as event
+        '''
+        issues = self.integrity.check_line(feedback.split())
+        logged = [issue for issue in issues if self.integrity.counts[issue] <= self.integrity_log_limit]
+        if len(logged) > 0:
+            self.masterGUI.update_log('WARNING: ' + ', '.join(logged) + ' in data of ID ' + self.device_id +
+                                      ': ' + feedback.strip())
+        return 'malformed_lines' not in issues and 'out_of_range' not in issues
+
+    def snapshot(self):
+        '''
+        :return: EventSnapshot of events read so far, safe to use from GUI thread
+        '''
+        return EventSnapshot(self)
+
+    def check_anomalies(self, event_time, amplitude):
+        '''
+        Rate and spectrum change detection, alerts are written to log and GUI highlights the detector.
+        :param amplitude: SiPM [mV]
+        '''
+        for message in self.anomalies.add_event(event_time, amplitude):
+            self.masterGUI.update_log('ALERT for ID ' + self.device_id + ': ' + message)
+
+    def open_port(self):
+        '''
+        Opens serial port and reads header. Afterwards read timeout is shortened so a silent port can't block the
+        thread for long.
+        :returns: header sent by CosmicWatch
+        '''
+        self.detector = serial.Serial(self.port_name, 9600, timeout=10)  # initialize serial port
+        try:
+            header = self.read_header()  # reads device name
+        except Exception:
+            self.close_port() # Windows COM port has one handle only, an open one would fail every next attempt
+            raise
+        self.detector.timeout = self.read_timeout
+        return header
+
+    def reconnect(self):
+        '''
+        Reopens serial port after connection was lost. Attempts are repeated with exponential backoff bounded by
+        self.reconnect_max_delay. Waiting is interrupted as soon as PortMonitor reports the port is back
+        (see self.port_available()). Outage and recovery times are saved in log.
+        :return: True if reconnected, False if program was stopped
+        '''
+        delay = self.reconnect_min_delay
+        attempts = 0
+        while self.stop == False:
+            self.port_event.wait(delay)
+            self.port_event.clear()
+            if self.stop == True:
+                return False
+            attempts += 1
+            try:
+                self.open_port()
+            except Exception as exc:
+                print('Reconnect attempt ' + str(attempts) + ' failed: ' + repr(exc))
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+
+            now = time.monotonic()
+            outage = now - self.outage_start
+            if self.port_return_time is not None and self.port_return_time > self.outage_start:
+                recovery = now - self.port_return_time # since port reappeared
+            else:
+                recovery = outage
+            self.reconnects += 1
+            self.port_return_time = None
+            self.livetime.connect(self.clock.elapsed())
+            self.connection_changed.emit(True, self.clock.elapsed())
+            if self.anomalies is not None:
+                self.anomalies.interrupt()
+            message = 'Connection with ' + self.port_name + ' restored. Connected CosmicWatch ID: ' + \
+                      self.device_id + ' Mode: ' + self.mode + '. Outage: ' + '{:.3f}'.format(outage) + \
+                      ' s. Recovery: ' + '{:.3f}'.format(recovery) + ' s. Attempts: ' + str(attempts) + '.'
+            self.masterGUI.update_log(message)
+            return True
+        return False
+
+    def pause(self, t):
+        '''
+        Ignore data until resume(). :param t: time of HostClock.elapsed()
+        '''
+        self.paused = True
+        self.livetime.pause(t)
+
+    def resume(self, t):
+        self.paused = False
+        self.livetime.resume(t)
+        if self.anomalies is not None:
+            self.anomalies.interrupt()
+
+    def port_lost(self):
+        '''
+        Called by GUI when PortMonitor reports the port disappeared. Closes the port, so a blocked readline returns
+        immediately via an exception.
+        '''
+        self.close_port()
+
+    def close_port(self):
+        '''
+        Closes serial port, errors of a port which is already closed or gone are ignored.
+        '''
+        try:
+            self.detector.close()
+        except Exception:
+            pass
+
+    def port_available(self):
+        '''
+        Called by GUI when PortMonitor reports the port (re)appeared. Wakes up reconnect().
+        '''
+        self.port_return_time = time.monotonic()
+        self.port_event.set()
 
     def run_detector(self):
         '''
         Open serial port -> read header -> Update GUI datatable -> Create file using header -> Read data
+        On connection loss reconnect and keep writing to the same file.
         '''
-        self.detector = serial.Serial(self.port_name, 9600, timeout=10)  # initialize serial port
-        header = self.read_header()  # reads device name
+        if self.clock is None:
+            self.clock = HostClock(self.time_start)
+        header = self.open_port()
         self.masterGUI.init_table(self)  # initialize
         self.table_updater.emit()
         self.chart_initializer.emit()
 
         self.create_file(header)  # gets full directory to results file
-        # while self.fail_counter < 4:
-        #     self.read_data()  # read data from cosmic_watch port into created_file file
 
-        #debug
-        event = Event()
-        while True:
-            self.read_data()  # read data from cosmic_watch port into created_file file
-            if self.stop == True:
-                break
-            try:
-                self.detector = serial.Serial(self.port_name, 9600, timeout=10)  # initialize serial port
-            except:
-                pass
-            event.wait(3.0)
+        # file stays open through reconnects, so lines buffered by the writer are not lost
+        with self.data_file_writer() as self.data_file:
+            while True:
+                self.read_data()  # read data from cosmic_watch port into created_file file
+                if self.stop == True:
+                    break
+                if self.reconnect() == False:
+                    break
+        self.close_hdf5()
+        self.save_statistics()
+        self.save_integrity()
+
+        self.masterGUI.update_log('Clock fit for ID ' + self.device_id + ': Arduino drift ' +
+                                  '{:.1f}'.format(self.clock_fit.drift_ppm()) + ' ppm, fitted on ' +
+                                  str(self.clock_fit.n) + ' events.')
+        self.masterGUI.update_log('Times for ID ' + self.device_id + '. ' +
+                                  self.livetime.summary(self.clock.elapsed()))
+        self.masterGUI.update_log('Data integrity for ID ' + self.device_id + ': ' +
+                                  summary(self.integrity.counts) + '.')
 
     def run(self):
         '''
         Open serial port -> read header -> Update GUI datatable -> Create file using header -> Read data
         '''
         #try:
-        self.detector = serial.Serial(self.port_name, 9600, timeout=10)  # initialize serial port
-        header = self.read_header()  # reads device name
+        if self.clock is None:
+            self.clock = HostClock(self.time_start)
+        header = self.open_port()
         self.masterGUI.init_table(self) # initialize
         #   self.table_updater.emit()
 
         self.create_file(header)  # gets full directory to results file
-        self.read_data()  # read data from cosmic_watch port into created_file file
+        with self.data_file_writer() as self.data_file:
+            self.read_data()  # read data from cosmic_watch port into created_file file
+        self.close_hdf5()
+        self.save_statistics()
+        self.save_integrity()
         # except Exception as exc:
         #     message = 'Port: ' + self.port_name + '. Error. Exception: ' + \
         #               repr(exc)
         #     self.masterGUI.update_log(message)
 
+    def close_hdf5(self):
+        if self.hdf5_file is not None:
+            self.hdf5_file.close()
+            self.hdf5_file = None
+
+    def save_integrity(self):
+        '''
+        Saves integrity counts of acquisition next to data file, see Integrity.py.
+        '''
+        try:
+            self.integrity.save(self.full_path)
+        except Exception as exc:
+            self.masterGUI.update_log('WARNING: Integrity report cannot be saved. Exception: ' + repr(exc))
+
+    def save_statistics(self):
+        '''
+        Saves streaming statistics next to data file, they can be merged across runs with merge_statistics().
+        '''
+        try:
+            self.statistics.save(self.stats_path)
+        except Exception as exc:
+            self.masterGUI.update_log('WARNING: Statistics cannot be saved. Exception: ' + repr(exc))
+
     def start_program(self):
         '''
         Run detector in thread.
@@ -266,11 +499,16 @@ class CosmicWatch(QObject):
         '''
         Closes the serial port to stop the program via an exception.
         '''
-        # reset data lists
-        self.detector.reset_input_buffer()
-        self.detector.close()
         self.stop = True # end thread via exception
-        #self.run_thread.
+        self.port_event.set() # end reconnect waiting
+        if self.clock is not None:
+            self.livetime.finish(self.clock.elapsed())
+        # reset data lists, port is already closed after port_lost() or failed reconnect
+        try:
+            self.detector.reset_input_buffer()
+        except Exception:
+            pass
+        self.close_port()
 
     def update_values(self, record, time_delta):
         '''
@@ -285,12 +523,11 @@ class CosmicWatch(QObject):
         self.adc = record[4]
         self.amplitude = record[5]
         
-        realtime = time_delta/1000 # in seconds
+        # times in seconds, dead time includes pauses and disconnections
+        self.livetime.arduino_event(float(record[6]))
+        realtime, livetime, self.deadtime = self.livetime.times(time_delta / 1000)
         rate = number / realtime
 
-        self.deadtime = float(record[6]) / 1000 + self.masterGUI.pause_deadtime_seconds   # in seconds, adjusted for pause
-        livetime = realtime - self.deadtime  # in seconds
-
         self.rate = str(round(rate, 3))
         self.rate_error = (number**(1/2) / livetime) / rate
                           # sqrt(number) / ( total time - dead time) in percent
@@ -299,6 +536,7 @@ class CosmicWatch(QObject):
         # data for charts
         self.adc_list.append(float(self.adc))
         self.amplitudes_list.append(float(self.amplitude))
+        self.temp_list.append(float(record[7]))
 
         #adjust record
         record[6] = int(self.deadtime * 1000)
@@ -0,0 +1,542 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Reading and writing of CosmicWatch measurement files. Supports plain text and block compressed (gzip, xz) files.
+Long runs can be rotated into numbered segments listed in a manifest, the manifest is read as one data file.
+"""
+
+import gzip
+import hashlib
+import json
+import lzma
+import io
+import os
+import re
+import time
+
+# compression name -> (file suffix, module used to compress single blocks)
+COMPRESSIONS = {
+    'gzip': ('.gz', gzip),
+    'xz': ('.xz', lzma),
+}
+
+INDEX_SUFFIX = '.idx' # block index saved next to compressed file, e.g. 'example.csv.gz.idx'
+MANIFEST_SUFFIX = '.manifest.json' # list of segments of rotated run, e.g. 'example.manifest.json'
+TAIL_BYTES = 4096 # end of plain file read for time of last data line, doubled while no data line is found
+SEGMENT_NAME = re.compile(r'\.part\d{3,}$') # end of segment name without suffix, e.g. 'example.part002'
+
+# rotation unit -> key of RotatingFileWriter limits, e.g. '6 h', '50 MB', '100000 events'
+ROTATION_UNITS = {'h': 'hours', 'mb': 'megabytes', 'events': 'events'}
+
+
+def compression_of(path):
+    '''
+    Recognizes compression of file by its suffix.
+    :param path: full path of data file
+    :return: 'gzip', 'xz' or '' for uncompressed files
+    '''
+    for name, (suffix, module) in COMPRESSIONS.items():
+        if str(path).endswith(suffix):
+            return name
+    return ''
+
+
+def strip_data_suffix(file_name):
+    '''
+    Removes compression and .csv/.txt/.h5 or manifest suffix from file name, e.g. 'run.csv.gz' -> 'run'.
+    '''
+    if file_name.endswith(MANIFEST_SUFFIX):
+        return file_name[:-len(MANIFEST_SUFFIX)]
+    compression = compression_of(file_name)
+    if compression != '':
+        file_name = file_name[:-len(COMPRESSIONS[compression][0])]
+    if file_name[-4:] in ('.csv', '.txt'):
+        file_name = file_name[:-4]
+    elif file_name[-3:] == '.h5':
+        file_name = file_name[:-3]
+    return file_name
+
+
+def is_manifest(path):
+    return str(path).endswith(MANIFEST_SUFFIX)
+
+
+def is_segment(file_name):
+    '''
+    :return: True for segment of rotated run, e.g. 'example.part002.csv.gz', it is read through the manifest
+    '''
+    return SEGMENT_NAME.search(strip_data_suffix(os.path.basename(str(file_name)))) is not None
+
+
+def segment_path(base_path, number, compression=''):
+    '''
+    :param base_path: full path of run without suffix, e.g. 'C:\\Measurements\\20210210_033024_MASTER_Bravo'
+    :return: full path of segment, e.g. '..._MASTER_Bravo.part002.csv.gz'
+    '''
+    suffix = COMPRESSIONS[compression][0] if compression != '' else ''
+    return str(base_path) + '.part' + '{:03d}'.format(number) + '.csv' + suffix
+
+
+def read_manifest(path):
+    '''
+    :param path: full path of manifest
+    :return: dict: run, compression, rotation, segments (list of dicts, see RotatingFileWriter.segment_entry())
+    '''
+    with open(path, 'r') as manifest_file:
+        return json.load(manifest_file)
+
+
+def file_state(path):
+    '''
+    Size and modification time used to recognize changed files, for manifest sum of its segments.
+    :return: [size, modification time]
+    '''
+    paths = [path]
+    if is_manifest(path):
+        folder = os.path.dirname(str(path))
+        paths += [os.path.join(folder, segment['file']) for segment in read_manifest(path)['segments']]
+    size = 0
+    modified = 0
+    for state_path in paths:
+        try:
+            status = os.stat(state_path)
+        except FileNotFoundError: # segment removed from archive
+            continue
+        size += status.st_size
+        modified = max(modified, status.st_mtime)
+    return [size, modified]
+
+
+def parse_rotation(text):
+    '''
+    :param text: e.g. '6 h', '50 MB', '100000 events'; '' or 'None' for no rotation
+    :return: dict of RotatingFileWriter limits, e.g. {'hours': 6.0}; empty for no rotation
+    '''
+    text_list = text.lower().split()
+    if len(text_list) == 0 or text_list == ['none']:
+        return {}
+    if len(text_list) != 2 or text_list[1] not in ROTATION_UNITS:
+        raise ValueError('Rotation must be a number and unit (h, MB or events), e.g. "6 h".')
+    value = float(text_list[0])
+    if value <= 0:
+        raise ValueError('Rotation limit must be positive.')
+    return {ROTATION_UNITS[text_list[1]]: value}
+
+
+def line_time(line):
+    '''
+    Reads computer timestamp of data line.
+    :param line: data line, e.g. '2021-02-10 04:17:08.348 1 3359 92 21.32 0 22.19'
+    :return: sortable string 'YYYY-MM-DD_HH:MM:SS.fff' or None if line is not a data line
+    '''
+    line_list = line.split()
+    if len(line_list) < 6 or line[0] == '#' or line_list[0][0:2] not in ('19', '20'):
+        return None
+    return line_list[0] + '_' + line_list[1]
+
+
+def read_index(path):
+    '''
+    Reads block index of compressed file.
+    :param path: full path of compressed data file
+    :return: list of [offset, length, first_time, last_time], times are None for blocks without data lines
+    '''
+    index = []
+    try:
+        with open(str(path) + INDEX_SUFFIX, 'r') as index_file:
+            for line in index_file:
+                line_list = line.split()
+                if len(line_list) != 4:
+                    continue # block entry not written completely yet
+                first_time = None if line_list[2] == '-' else line_list[2]
+                last_time = None if line_list[3] == '-' else line_list[3]
+                index.append([int(line_list[0]), int(line_list[1]), first_time, last_time])
+    except FileNotFoundError:
+        pass
+    return index
+
+
+def open_data_file(path):
+    '''
+    Opens data file for reading as text, no matter if it is compressed or not.
+    Compressed files are read only up to last indexed block, so files of running measurements can be read safely.
+    :param path: full path of data file
+    :return: text stream
+    '''
+    compression = compression_of(path)
+    if compression == '' and is_manifest(path) == False:
+        return open(path, 'r', errors='replace')
+    return io.StringIO(''.join(read_lines(path)))
+
+
+def read_lines(path, start=None, end=None):
+    '''
+    Reads lines of data file. For compressed files only blocks containing the time range are decompressed.
+    Manifest of rotated run is read as one file: header of first segment and data lines of all segments, segments
+    outside of the time range are not read.
+    Header lines are always returned.
+    :param path: full path of data file
+    :param start: 'YYYY-MM-DD_HH:MM:SS.fff' string or None, data lines before this time are skipped
+    :param end: 'YYYY-MM-DD_HH:MM:SS.fff' string or None, data lines after this time are skipped
+    :return: list of lines
+    '''
+    if is_manifest(path):
+        return read_segments(path, start, end)
+    compression = compression_of(path)
+    if compression == '':
+        with open(path, 'r', errors='replace') as data_file:  # old files may be saved in Windows encoding
+            lines = data_file.readlines()
+    else:
+        module = COMPRESSIONS[compression][1]
+        index = read_index(path)
+        lines = []
+        with open(path, 'rb') as data_file:
+            if len(index) == 0:
+                # no index, e.g. file compressed by external program
+                try:
+                    lines = module.decompress(data_file.read()).decode(errors='replace').splitlines(keepends=True)
+                except EOFError:
+                    pass
+            for offset, length, first_time, last_time in index:
+                if first_time is not None:
+                    if (start is not None and last_time < start) or (end is not None and first_time > end):
+                        continue
+                data_file.seek(offset)
+                block = module.decompress(data_file.read(length)).decode(errors='replace')
+                lines += block.splitlines(keepends=True)
+
+    if start is None and end is None:
+        return lines
+    selected = []
+    for line in lines:
+        timestamp = line_time(line)
+        if timestamp is None or ((start is None or timestamp >= start) and (end is None or timestamp <= end)):
+            selected.append(line)
+    return selected
+
+
+def read_header(path):
+    '''
+    Reads header of data file without its data lines, e.g. to select runs by their settings.
+    Plain files are read up to the first data line, of compressed files only blocks without data lines are
+    decompressed.
+    :param path: full path of data file
+    :return: header lines, time of first data line ('YYYY-MM-DD_HH:MM:SS.fff' string, None if not known)
+    '''
+    if compression_of(path) == '' and is_manifest(path) == False:
+        header = []
+        with open(path, 'r', errors='replace') as data_file:
+            for line in data_file:
+                first_time = line_time(line)
+                if first_time is not None:
+                    return header, first_time
+                header.append(line)
+        return header, None
+    if is_manifest(path):
+        times = [segment.get('first_time') for segment in read_manifest(path)['segments']]
+    else:
+        times = [first_time for offset, length, first_time, last_time in read_index(path)]
+    times = [first_time for first_time in times if first_time is not None]
+    # time range before any data line, so data blocks and segments are skipped
+    header = [line for line in read_lines(path, '0', '0') if line_time(line) is None]
+    return header, times[0] if len(times) > 0 else None
+
+
+def read_last_time(path):
+    '''
+    Reads time of last data line without reading data lines: last block of index, last segment of manifest or end
+    of plain file.
+    :param path: full path of data file
+    :return: 'YYYY-MM-DD_HH:MM:SS.fff' string, None if not known (e.g. compressed file without index)
+    '''
+    if is_manifest(path):
+        folder = os.path.dirname(str(path))
+        # running segment has no time range in manifest yet
+        times = [segment['last_time'] if 'last_time' in segment else
+                 read_last_time(os.path.join(folder, segment['file'])) for segment in read_manifest(path)['segments']]
+    elif compression_of(path) != '':
+        times = [last_time for offset, length, first_time, last_time in read_index(path)]
+    else:
+        with open(path, 'rb') as data_file:
+            size = data_file.seek(0, os.SEEK_END)
+            tail = TAIL_BYTES
+            while True:
+                data_file.seek(max(size - tail, 0))
+                lines = data_file.read().decode(errors='replace').splitlines()
+                if tail < size:
+                    lines = lines[1:] # first line may be cut
+                times = [line_time(line) for line in lines]
+                if tail >= size or any(stamp is not None for stamp in times):
+                    break
+                tail *= 2
+    times = [last_time for last_time in times if last_time is not None]
+    return times[-1] if len(times) > 0 else None
+
+
+def read_segments(path, start=None, end=None):
+    '''
+    Reads lines of rotated run, see read_lines().
+    :param path: full path of manifest
+    '''
+    folder = os.path.dirname(str(path))
+    lines = []
+    for segment in read_manifest(path)['segments']:
+        segment_lines = []
+        outside = segment.get('first_time') is not None and \
+                  ((start is not None and segment['last_time'] < start) or
+                   (end is not None and segment['first_time'] > end))
+        if outside == False:
+            segment_lines = read_lines(os.path.join(folder, segment['file']), start, end)
+        elif len(lines) == 0: # header is taken from first segment
+            segment_lines = read_lines(os.path.join(folder, segment['file']), segment['first_time'],
+                                       segment['first_time'])
+        header, data = split_header(segment_lines)
+        if len(lines) == 0 and len(segment_lines) > 0:
+            lines = header + ['\r\n']
+        if outside == False:
+            lines += data
+    return lines
+
+
+class DataFileWriter():
+    '''
+    Writes measurement file. For compression '' it is an ordinary text file, otherwise lines are buffered and saved as
+    independently compressed blocks (gzip members / xz streams). Concatenated blocks are a valid .gz/.xz file.
+    Each finished block is appended to the index file, so readers of running measurement see only complete blocks.
+    path: full path to file, compression suffix is not added automatically
+    compression: '', 'gzip' or 'xz'
+    block_lines: block is compressed after this many lines
+    block_seconds: block is compressed after this many seconds, so live readers don't wait for block_lines
+    '''
+
+    block_lines = 500
+    block_seconds = 10
+
+    def __init__(self, path, compression='', mode='a'):
+        self.path = str(path)
+        self.compression = compression
+        self.buffer = []
+        self.first_time = None
+        self.last_time = None
+        self.block_started = time.monotonic()
+        self.buffer_started = None # time.monotonic() of oldest buffered line
+        if compression == '':
+            self.file = open(self.path, mode, newline='')
+        else:
+            self.module = COMPRESSIONS[compression][1]
+            self.file = open(self.path, mode + 'b')
+            if mode == 'w':
+                open(self.path + INDEX_SUFFIX, 'w').close()
+            self.file.seek(0, os.SEEK_END)
+
+    def write(self, text):
+        '''
+        Writes text, it is expected to consist of whole lines.
+        '''
+        if self.compression == '':
+            self.file.write(text)
+            return
+        if len(self.buffer) == 0:
+            self.buffer_started = time.monotonic()
+        self.buffer.append(text)
+        timestamp = line_time(text)
+        if timestamp is not None:
+            if self.first_time is None:
+                self.first_time = timestamp
+            self.last_time = timestamp
+        if len(self.buffer) >= self.block_lines or time.monotonic() - self.block_started > self.block_seconds:
+            self.flush()
+
+    def flush(self):
+        '''
+        Compresses buffered lines into a new block and saves its position in index file.
+        '''
+        if self.compression == '':
+            self.file.flush()
+            return
+        if len(self.buffer) > 0:
+            block = self.module.compress(''.join(self.buffer).encode())
+            offset = self.file.tell()
+            self.file.write(block)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            # index entry is written only after the whole block is saved
+            with open(self.path + INDEX_SUFFIX, 'a') as index_file:
+                index_file.write(str(offset) + ' ' + str(len(block)) + ' ' + (self.first_time or '-') + ' ' +
+                                 (self.last_time or '-') + '\n')
+        self.buffer = []
+        self.buffer_started = None
+        self.first_time = None
+        self.last_time = None
+        self.block_started = time.monotonic()
+
+    def lag(self):
+        '''
+        Lines written but not yet saved to disk. Safe to call from another thread.
+        :return: number of buffered lines, seconds the oldest of them waits
+        '''
+        started = self.buffer_started
+        if started is None:
+            return 0, 0.0
+        return len(self.buffer), time.monotonic() - started
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RotatingFileWriter():
+    '''
+    Writes run as numbered segments, a new segment is started when one of limits is reached. Every segment is a data
+    file with its own header, DataFileWriter writes it. Manifest with event range, time range and SHA-256 checksum of
+    finished segments is saved after every rotation, so finished segments can be copied and analysed during the run.
+    base_path: full path of run without suffix, segments and manifest are saved next to it
+    header: header lines written at the beginning of every segment, ending with empty line
+    events: events per segment, 0 for no limit
+    megabytes: uncompressed size of segment, 0 for no limit
+    hours: duration of segment, 0 for no limit
+    '''
+
+    def __init__(self, base_path, compression='', header=(), events=0, megabytes=0, hours=0):
+        self.base_path = str(base_path)
+        self.compression = compression
+        self.header = list(header)
+        self.limits = {'events': events, 'megabytes': megabytes, 'hours': hours}
+        self.manifest_path = self.base_path + MANIFEST_SUFFIX
+        self.segments = [] # manifest entries of finished segments
+        self.writer = None
+        self.open_segment()
+
+    def open_segment(self):
+        self.path = segment_path(self.base_path, len(self.segments) + 1, self.compression)
+        self.writer = DataFileWriter(self.path, self.compression, 'w')
+        for line in self.header:
+            self.writer.write(line)
+        self.events = 0
+        self.size = 0 # characters written to segment
+        self.opened = time.monotonic()
+        self.first_event = None
+        self.last_event = None
+        self.first_time = None
+        self.last_time = None
+        self.save_manifest()
+
+    def rotation_due(self):
+        return (self.limits['events'] > 0 and self.events >= self.limits['events']) or \
+               (self.limits['megabytes'] > 0 and self.size >= self.limits['megabytes'] * 1e6) or \
+               (self.limits['hours'] > 0 and time.monotonic() - self.opened >= self.limits['hours'] * 3600)
+
+    def write(self, text):
+        '''
+        Writes whole lines, rotation happens only before event lines, so comments stay with preceding events.
+        '''
+        timestamp = line_time(text)
+        if timestamp is not None:
+            if self.events > 0 and self.rotation_due() == True:
+                self.rotate()
+            self.events += 1
+            self.last_event = text.split()[2]
+            self.last_time = timestamp
+            if self.first_time is None:
+                self.first_event = self.last_event
+                self.first_time = timestamp
+        self.size += len(text)
+        self.writer.write(text)
+
+    def segment_entry(self):
+        '''
+        Closes current segment.
+        :return: manifest entry: file, number, events, first/last event number, first/last time, size, sha256
+        '''
+        self.writer.close()
+        checksum = hashlib.sha256()
+        with open(self.path, 'rb') as segment_file:
+            for chunk in iter(lambda: segment_file.read(1 << 20), b''):
+                checksum.update(chunk)
+        return {'file': os.path.basename(self.path), 'number': len(self.segments) + 1, 'events': self.events,
+                'first_event': self.first_event, 'last_event': self.last_event, 'first_time': self.first_time,
+                'last_time': self.last_time, 'size': os.path.getsize(self.path), 'sha256': checksum.hexdigest()}
+
+    def rotate(self):
+        self.segments.append(self.segment_entry())
+        self.open_segment()
+
+    def save_manifest(self, finished=False):
+        '''
+        Saves manifest, running segment is listed without ranges and checksum. Written to temporary file first, so
+        readers never see a partial manifest.
+        '''
+        segments = list(self.segments)
+        if finished == False:
+            segments.append({'file': os.path.basename(self.path), 'number': len(self.segments) + 1,
+                             'running': True})
+        manifest = {'run': os.path.basename(self.base_path), 'compression': self.compression,
+                    'rotation': self.limits, 'finished': finished, 'segments': segments}
+        with open(self.manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def flush(self):
+        self.writer.flush()
+
+    def lag(self):
+        return self.writer.lag()
+
+    def close(self):
+        self.segments.append(self.segment_entry())
+        self.save_manifest(True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def split_header(lines):
+    '''
+    Splits lines of data file into header and data lines. Header ends with first empty line.
+    Files without empty line are treated as raw data without header.
+    :param lines: list of lines
+    :return: header_lines, data_lines
+    '''
+    for i, line in enumerate(lines):
+        if line.strip() == '':
+            return lines[:i], lines[i+1:]
+    return [], lines
+
+
+def header_info(header_lines, file_name=''):
+    '''
+    Reads measurement settings from header. Mode and ID fall back to file name, e.g. '..._MASTER_NCBJ_026.csv'.
+    :param header_lines: header as returned by split_header()
+    :param file_name: name of data file
+    :return: dict with keys distance, angle (strings, '' if not found), device_id, mode
+    '''
+    info = {'distance': '', 'angle': '', 'device_id': '', 'mode': ''}
+    for line in header_lines:
+        if line[0:13] == '### Distance:':
+            line_list = line.split(' ')
+            info['distance'] = line_list[2]
+            info['angle'] = line_list[5]
+        elif line[0:11] == 'DetectorID:':
+            info['device_id'] = line[11:].strip()
+        elif line[0:13] == 'DetectorMode:':
+            info['mode'] = line[13:].strip()
+
+    name = SEGMENT_NAME.sub('', strip_data_suffix(os.path.basename(str(file_name))))
+    for mode in ('MASTER', 'SLAVE'):
+        for separator in ('_', '-'): # old names: '2020_08_17-15_22_39-MASTER_NCBJ_021.csv'
+            if separator + mode + '_' in name:
+                if info['mode'] == '':
+                    info['mode'] = mode.capitalize()
+                if info['device_id'] == '':
+                    info['device_id'] = name.split(separator + mode + '_', 1)[1]
+    if info['device_id'] == '':
+        info['device_id'] = 'Unknown'
+    return info
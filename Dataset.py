@@ -0,0 +1,287 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Events of many runs as one pandas table. Runs are selected by metadata read from file headers (detector ID, mode,
+distance, angle, start and end time), so data lines of other runs are never read. Tables are built only when asked
+for, with the selected columns only: to_pandas() concatenates runs, iter_runs() yields one run at a time for data
+which doesn't fit into memory. Only selected columns are parsed when integrity report of the file is up to date
+(python IntegrityCheck.py), otherwise the file is checked with all its columns first. Detector ID, mode and file are
+categorical columns.
+Usage: python Dataset.py [measurements_folder] [--mode Slave] [--angle 45] [--distance 5] [--since 2021-02-01]
+       [--until 2021-03-01] [--columns time sipm] [--output events.csv] - prints selected runs and their events
+"""
+
+import argparse
+import datetime
+import math
+import sys
+
+import numpy
+
+from DataFiles import read_header, read_last_time, header_info
+from FileFormats import COLUMNS
+from IntegrityCheck import read_valid_data
+from TemperatureCalibration import find_data_files
+
+# pandas is optional, it is imported by import_pandas() when a table is built
+pandas = None
+
+EVENT_COLUMNS = ['time'] + COLUMNS # 'time' is UTC seconds since 1970
+METADATA = ['file', 'device_id', 'mode', 'distance', 'angle', 'start_time', 'end_time'] # per run, from header
+CATEGORICAL = ['file', 'device_id', 'mode'] # metadata columns stored as pandas categoricals
+
+
+class DatasetError(Exception):
+    pass
+
+
+def import_pandas():
+    global pandas
+    if pandas is not None:
+        return
+    try:
+        import pandas as pandas_module
+    except ImportError:
+        raise DatasetError('pandas is not installed, events cannot be read as table.')
+    pandas = pandas_module
+
+
+def to_seconds(value):
+    '''
+    :param value: UTC seconds, datetime (naive is UTC), 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' string
+    :return: UTC seconds since 1970
+    '''
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def stamp_seconds(stamp):
+    '''
+    :param stamp: 'YYYY-MM-DD_HH:MM:SS.fff' or old 'YYYY-MM-DD_HH-MM-SS-ffffff' string of DataFiles.line_time()
+    :return: UTC seconds, NaN if stamp can't be read
+    '''
+    date, clock = stamp.split('_', 1)
+    if ':' not in clock:
+        clock = clock.replace('-', ':', 2).replace('-', '.')
+    seconds, _, fraction = clock.partition('.')
+    try:
+        start = datetime.datetime.strptime(date + ' ' + seconds, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return math.nan
+    return start.replace(tzinfo=datetime.timezone.utc).timestamp() + float('0.' + (fraction or '0'))
+
+
+def to_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+def run_metadata(path):
+    '''
+    Reads metadata of run from header and time of last event (see DataFiles.read_last_time()), data lines are not
+    read.
+    :param path: full path of data file
+    :return: dict: METADATA -> value; distance, angle, start_time and end_time are NaN if not known
+    '''
+    header, first_time = read_header(path)
+    last_time = read_last_time(path)
+    info = header_info(header, path)
+    return {'file': path, 'device_id': info['device_id'], 'mode': info['mode'].capitalize(),
+            'distance': to_number(info['distance']), 'angle': to_number(info['angle']),
+            'start_time': stamp_seconds(first_time) if first_time is not None else math.nan,
+            'end_time': stamp_seconds(last_time) if last_time is not None else math.nan}
+
+
+def matches(value, wanted):
+    '''
+    :param wanted: single value or list, tuple or set of values; strings are compared without case
+    '''
+    if isinstance(wanted, (list, tuple, set)) == False:
+        wanted = [wanted]
+    if isinstance(value, str):
+        return value.lower() in [str(option).lower() for option in wanted]
+    return any(value == option for option in wanted)
+
+
+class Dataset():
+    '''
+    Selection of runs and columns. filter() and select() return new Dataset without reading events.
+    :param source: measurements folder or list of data file paths
+    :param columns: event columns (EVENT_COLUMNS) and metadata columns (METADATA) of tables, None for all
+    :param since: first UTC time of events (see to_seconds()), None for no limit
+    :param until: UTC time after last event, None for no limit
+    '''
+
+    def __init__(self, source='Measurements', columns=None, since=None, until=None):
+        self.paths = find_data_files(source) if isinstance(source, str) else list(source)
+        self.columns = list(columns) if columns is not None else EVENT_COLUMNS + METADATA
+        unknown = [name for name in self.columns if name not in EVENT_COLUMNS + METADATA]
+        if len(unknown) > 0:
+            raise DatasetError('Unknown columns: ' + ', '.join(unknown) + '.')
+        self.since = to_seconds(since) if since is not None else None
+        self.until = to_seconds(until) if until is not None else None
+        self.metadata_cache = None # list of run_metadata() of paths, read on first use
+
+    def __len__(self):
+        return len(self.paths)
+
+    def copy(self, paths=None, columns=None):
+        dataset = Dataset(self.paths if paths is None else paths, self.columns if columns is None else columns)
+        dataset.since = self.since
+        dataset.until = self.until
+        if self.metadata_cache is not None:
+            metadata = {run['file']: run for run in self.metadata_cache}
+            dataset.metadata_cache = [metadata[path] for path in dataset.paths]
+        return dataset
+
+    def runs(self):
+        '''
+        :return: list of metadata dicts of runs, see run_metadata()
+        '''
+        if self.metadata_cache is None:
+            self.metadata_cache = [run_metadata(path) for path in self.paths]
+        return self.metadata_cache
+
+    def filter(self, since=None, until=None, function=None, **values):
+        '''
+        Selects runs by metadata, e.g. filter(mode='Slave', angle=45, distance=5, since='2021-02-01',
+        until='2021-03-01'). Runs which ended before since or started at or after until are skipped, events outside
+        of since..until are dropped when table is built.
+        :param function: optional function: metadata dict -> bool, for other conditions
+        :param values: METADATA name -> value or list of accepted values
+        :return: new Dataset
+        '''
+        unknown = [name for name in values if name not in METADATA]
+        if len(unknown) > 0:
+            raise DatasetError('Unknown metadata: ' + ', '.join(unknown) + '.')
+        since = to_seconds(since) if since is not None else None
+        until = to_seconds(until) if until is not None else None
+        paths = []
+        for run in self.runs():
+            if all(matches(run[name], wanted) for name, wanted in values.items()) == False:
+                continue
+            # runs without start or end time are kept, their events are filtered by time
+            if (since is not None and run['end_time'] < since) or \
+                    (until is not None and run['start_time'] >= until):
+                continue
+            if function is not None and function(run) == False:
+                continue
+            paths.append(run['file'])
+        dataset = self.copy(paths)
+        if since is not None:
+            dataset.since = since if dataset.since is None else max(dataset.since, since)
+        if until is not None:
+            dataset.until = until if dataset.until is None else min(dataset.until, until)
+        return dataset
+
+    def select(self, *columns):
+        '''
+        :param columns: names of EVENT_COLUMNS and METADATA, only these are read into tables
+        :return: new Dataset
+        '''
+        return self.copy(columns=columns)
+
+    def metadata(self):
+        '''
+        :return: DataFrame with row of metadata per run, no events are read
+        '''
+        import_pandas()
+        return self.categorical(pandas.DataFrame(self.runs(), columns=METADATA))
+
+    def categories(self, name):
+        '''
+        :return: sorted values of CATEGORICAL column in all runs, tables of runs with same categories are
+                 concatenated without conversion to strings
+        '''
+        return sorted(set(run[name] for run in self.runs()))
+
+    def categorical(self, frame):
+        for name in CATEGORICAL:
+            if name in frame:
+                frame[name] = pandas.Categorical(frame[name], categories=self.categories(name))
+        return frame
+
+    def read_run(self, run):
+        '''
+        :param run: metadata dict of run
+        :return: DataFrame of events of run with selected columns, bad rows of integrity report are skipped
+        '''
+        info, data = read_valid_data(run['file'], [name for name in self.columns if name in EVENT_COLUMNS])
+        times = data['time']
+        keep = numpy.ones(times.size, bool)
+        if self.since is not None:
+            keep &= times >= self.since
+        if self.until is not None:
+            keep &= times < self.until
+        events = int(keep.sum())
+        frame = pandas.DataFrame({name: data[name][keep] for name in self.columns if name in EVENT_COLUMNS})
+        for name in self.columns:
+            if name in CATEGORICAL:
+                categories = self.categories(name)
+                frame[name] = pandas.Categorical.from_codes(numpy.full(events, categories.index(run[name])),
+                                                            categories=categories)
+            elif name in METADATA:
+                frame[name] = numpy.full(events, run[name])
+        return frame
+
+    def iter_runs(self):
+        '''
+        Reads one run at a time, so memory is needed for the largest run only.
+        :return: generator of (metadata dict, DataFrame of events)
+        '''
+        import_pandas()
+        for run in self.runs():
+            yield run, self.read_run(run)
+
+    def to_pandas(self):
+        '''
+        :return: DataFrame of events of all runs with selected columns
+        '''
+        import_pandas()
+        frames = [frame for run, frame in self.iter_runs()]
+        if len(frames) == 0:
+            return self.categorical(pandas.DataFrame({name: [] for name in self.columns}))
+        return pandas.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Select runs by metadata and read their events as one table.')
+    parser.add_argument('measurements', nargs='?', default='Measurements', help='folder with measurements')
+    parser.add_argument('--device-id', nargs='+', default=None, help='detector IDs')
+    parser.add_argument('--mode', nargs='+', default=None, help='Master and/or Slave')
+    parser.add_argument('--distance', nargs='+', type=float, default=None, help='[cm]')
+    parser.add_argument('--angle', nargs='+', type=float, default=None, help='[degrees]')
+    parser.add_argument('--since', default=None, help='UTC date, e.g. 2021-02-01')
+    parser.add_argument('--until', default=None, help='UTC date, end of selection, e.g. 2021-03-01')
+    parser.add_argument('--columns', nargs='+', default=None, help='columns of table, default: all; one of ' +
+                                                                   ', '.join(EVENT_COLUMNS + METADATA))
+    parser.add_argument('--output', default=None, help='save table as .csv or .parquet')
+    args = parser.parse_args(argv)
+
+    values = {name: getattr(args, name) for name in ['device_id', 'mode', 'distance', 'angle']
+              if getattr(args, name) is not None}
+    try:
+        dataset = Dataset(args.measurements, args.columns).filter(args.since, args.until, **values)
+        print(dataset.metadata().to_string())
+        table = dataset.to_pandas()
+    except DatasetError as exc:
+        print(str(exc))
+        return 1
+    print(str(len(dataset)) + ' runs, ' + str(len(table)) + ' events, ' +
+          '{:.1f}'.format(table.memory_usage(deep=True).sum() / 2**20) + ' MB')
+    if args.output is not None:
+        if args.output.endswith('.parquet'):
+            table.to_parquet(args.output)
+        else:
+            table.to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Live event stream for remote viewers. GUI publishes batches of new events of each detector, EventServer sends them as
+JSON lines over TCP to any number of subscribers. Every subscriber has its own sending thread and bounded queue,
+a slow subscriber gets coalesced summaries (latest rate, livetime, number of skipped events) instead of all events,
+so it can never stall acquisition or other subscribers.
+Usage of example viewer: python EventStream.py [host] [port]
+"""
+
+import json
+import socket
+import sys
+from threading import Condition, Thread
+
+STREAM_PORT = 5005
+
+# message fields with event lists, dropped when messages are coalesced into a summary
+EVENT_FIELDS = ['sipm', 'adc', 'temp']
+
+
+class Subscriber():
+    '''
+    Connected client of EventServer.
+    max_pending: messages queued before they are coalesced into one summary per detector
+    send_timeout: seconds, client not accepting data for this long is disconnected
+    '''
+
+    max_pending = 50
+    send_timeout = 30
+
+    def __init__(self, connection, address, server):
+        self.connection = connection
+        self.address = address
+        self.server = server
+        self.pending = []
+        self.condition = Condition()
+        self.closed = False
+        self.connection.settimeout(self.send_timeout)
+        Thread(target=self.run, daemon=True).start()
+
+    def put(self, message):
+        '''
+        Queues message, never blocks for longer than a list operation.
+        '''
+        with self.condition:
+            if len(self.pending) < self.max_pending:
+                self.pending.append(message)
+            else:
+                self.pending = coalesce(self.pending + [message])
+            self.condition.notify()
+
+    def run(self):
+        '''
+        Sends queued messages until client disconnects or server stops.
+        '''
+        while True:
+            with self.condition:
+                while len(self.pending) == 0 and self.closed == False:
+                    self.condition.wait()
+                if self.closed == True:
+                    break
+                messages = self.pending
+                self.pending = []
+            data = ''.join(json.dumps(message) + '\n' for message in messages).encode()
+            try:
+                self.connection.sendall(data)
+            except OSError: # disconnected or timed out
+                break
+        self.close()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        try:
+            self.connection.close()
+        except OSError:
+            pass
+        self.server.remove(self)
+
+
+def coalesce(messages):
+    '''
+    Replaces messages by one summary per detector: latest values of status fields, event lists are left out and
+    counted in 'skipped'.
+    :param messages: list of message dicts, see EventServer.publish()
+    :return: list of summary dicts
+    '''
+    summaries = {}
+    for message in messages:
+        if 'detector' not in message:
+            continue
+        summary = summaries.setdefault(message['detector'], {'type': 'summary', 'skipped': 0})
+        summary['skipped'] += message.get('skipped', 0) + len(message.get('sipm', []))
+        for key, value in message.items():
+            if key not in EVENT_FIELDS and key not in ['type', 'skipped']:
+                summary[key] = value
+    return list(summaries.values())
+
+
+class EventServer():
+    '''
+    TCP server publishing detector events as JSON lines.
+    :param host: '127.0.0.1' for local viewers only, '' or '0.0.0.0' for LAN
+    :param port: TCP port
+    '''
+
+    def __init__(self, host='127.0.0.1', port=STREAM_PORT):
+        self.host = host
+        self.port = port
+        self.subscribers = []
+        self.socket = None
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen()
+        Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                connection, address = self.socket.accept()
+            except OSError: # server stopped
+                break
+            self.subscribers.append(Subscriber(connection, address, self))
+
+    def remove(self, subscriber):
+        try:
+            self.subscribers.remove(subscriber)
+        except ValueError:
+            pass
+
+    def publish(self, message):
+        '''
+        Queues message for all subscribers.
+        :param message: dict, e.g. {'type': 'events', 'detector': device_id, 'mode': 'Master', 'number': 42,
+                        'rate': 0.7, 'livetime': 60.2, 'deadtime': 0.3, 'sipm': [...], 'adc': [...], 'temp': [...]}
+        '''
+        for subscriber in list(self.subscribers):
+            subscriber.put(message)
+
+    def stop(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+
+
+def main(argv=None):
+    '''
+    Example viewer: prints received messages.
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    host = argv[0] if len(argv) > 0 else '127.0.0.1'
+    port = int(argv[1]) if len(argv) > 1 else STREAM_PORT
+    with socket.create_connection((host, port)) as connection:
+        for line in connection.makefile('r'):
+            message = json.loads(line)
+            print(message['type'] + ' ' + str(message.get('detector')) + ': number ' + str(message.get('number')) +
+                  ', rate ' + str(message.get('rate')) + ', new events ' + str(len(message.get('sipm', []))) +
+                  ', skipped ' + str(message.get('skipped', 0)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Layouts of data files written by different versions of the program. Schema is detected from the first lines of a
+file, then all data lines are parsed at once with numpy by the parser of that schema. Lines not matching the
+schema (partial or glued lines, messages of Arduino) are counted and skipped.
+Usage: python FileFormats.py [measurements_folder] - prints schema of every data file
+"""
+
+import collections
+import os
+import re
+import sys
+
+import numpy
+
+from DataFiles import read_lines, open_data_file, header_info, is_segment, MANIFEST_SUFFIX
+from Integrity import is_number
+
+PREFIX_LINES = 64 # lines read to detect schema
+
+# schema name -> columns of data line after Comp_date and Comp_time
+SCHEMAS = {
+    'legacy_ms': ['comp_ms', 'event', 'ardn_time', 'adc', 'sipm', 'deadtime', 'temp'], # Aug 2020, Comp_time[ms]
+    'no_event': ['ardn_time', 'adc', 'sipm', 'deadtime', 'temp'], # Sep 2020 test version without Event
+    'basic': ['event', 'ardn_time', 'adc', 'sipm', 'deadtime', 'temp'],
+    'rate': ['event', 'ardn_time', 'adc', 'sipm', 'deadtime', 'temp', 'rate'], # since Apr 2021
+}
+
+# columns returned by read_data_file(), besides 'time'; NaN when schema has no such column
+COLUMNS = ['event', 'ardn_time', 'adc', 'sipm', 'deadtime', 'temp', 'rate']
+
+DATA_LINE = re.compile(r'\d{4}-\d\d-\d\d \d\d[:-]\d\d[:-]\d\d') # start of data line, e.g. '2021-02-10 04:17:08'
+NOT_DATA_SUFFIXES = ('.idx', '.json', '.npz', '.h5') # files next to data files
+GLUED = re.compile(r'(?=\d{4}-\d\d-\d\d \d\d[:-]\d\d[:-]\d\d)') # data lines written without line end
+
+
+class FormatError(Exception):
+    pass
+
+
+def detect_schema(lines):
+    '''
+    :param lines: first lines of file (PREFIX_LINES are enough)
+    :return: dict: schema (name in SCHEMAS, 'empty' when there is no data line), time_format ('colon' for
+             'HH:MM:SS.fff', 'dash' for old 'HH-MM-SS-ffffff'), data_start (index of first data line),
+             glued (bool, data lines are not separated by line ends)
+    '''
+    data_start = None
+    for i, line in enumerate(lines):
+        if DATA_LINE.match(line) is None:
+            continue
+        if data_start is None:
+            data_start = i # header ends here even without empty line
+        pieces = [piece for piece in GLUED.split(line) if piece != '']
+        fields = pieces[0].split()
+        if all(is_number(field) for field in fields[2:]) == False:
+            continue # Arduino message with timestamp, e.g. '2021-02-10 01:23:39.068 DetectorID: Detektor A'
+        time_format = 'colon' if ':' in fields[1] else 'dash'
+        schema = None
+        if len(fields) == 7:
+            schema = 'no_event'
+        elif len(fields) == 8:
+            schema = 'basic'
+        elif len(fields) == 9:
+            # Comp_time[ms] files name it in header, 6th field is ADC (integer) there and SiPM[mV] in Rate files
+            legacy = any('Comp_time[ms]' in header_line for header_line in lines[:data_start]) or \
+                     '.' not in fields[5]
+            schema = 'legacy_ms' if legacy else 'rate'
+        if schema is None:
+            raise FormatError('Data line with ' + str(len(fields)) + ' fields has no known layout: ' + line[:80])
+        return {'schema': schema, 'time_format': time_format, 'data_start': data_start, 'glued': len(pieces) > 1}
+    return {'schema': 'empty', 'time_format': 'colon', 'data_start': data_start or len(lines), 'glued': False}
+
+
+def detect_file_schema(path):
+    '''
+    Detects schema reading only the beginning of a plain text file.
+    '''
+    lines = []
+    with open_data_file(path) as data_file:
+        for line in data_file:
+            lines.append(line)
+            if len(lines) >= PREFIX_LINES:
+                break
+    return detect_schema(lines)
+
+
+def parse_times(dates, times, time_format='colon'):
+    '''
+    Converts computer timestamps to seconds, vectorized.
+    :param dates: list of 'YYYY-MM-DD'
+    :param times: list of 'HH:MM:SS.fff' (time_format 'colon') or 'HH-MM-SS-ffffff' ('dash')
+    :return: numpy array of UTC seconds since 1970, NaN for unreadable timestamps
+    '''
+    if time_format == 'dash':
+        times = [time.replace('-', ':', 2).replace('-', '.') for time in times]
+    stamps = numpy.char.add(numpy.char.add(numpy.array(dates, dtype=str), 'T'), numpy.array(times, dtype=str)) \
+        if len(dates) > 0 else numpy.array([], dtype=str)
+    try:
+        return numpy.array(stamps, dtype='datetime64[us]').astype('int64') / 1e6
+    except ValueError: # corrupted line, convert one by one
+        seconds = numpy.full(len(stamps), numpy.nan)
+        for i, stamp in enumerate(stamps):
+            try:
+                seconds[i] = numpy.datetime64(stamp, 'us').astype('int64') / 1e6
+            except ValueError:
+                pass
+        return seconds
+
+
+def parse_lines(lines, schema, time_format, names=None):
+    '''
+    Parser of one schema: lines with the schema's number of fields are converted at once.
+    :param lines: data lines
+    :param names: COLUMNS to convert, None for all; other fields are not converted (rows of a line with a field
+                  which is not a number are dropped only if that field is converted)
+    :return: dict: 'time' and COLUMNS (or names) -> numpy arrays ('rate' NaN if schema has none), number of skipped
+             lines ('#' comments are not counted)
+    '''
+    columns = SCHEMAS[schema]
+    fields = len(columns) + 2
+    names = COLUMNS if names is None else [name for name in COLUMNS if name in names]
+    selected = [columns.index(name) for name in names if name in columns]
+    rows = [line.split() for line in lines if line[0:1] != '#']
+    not_comments = len(rows)
+    rows = [row for row in rows if len(row) == fields]
+    values = numpy.array([[row[2 + i] for i in selected] for row in rows], dtype=str)
+    values = values.reshape(len(rows), len(selected))
+    try:
+        values = values.astype(float)
+    except ValueError: # e.g. '23.1#' of glued line, drop rows which are not numbers
+        numeric = numpy.array([all(is_number(value) for value in row) for row in values], dtype=bool)
+        values = values[numeric].astype(float)
+        rows = [row for row, good in zip(rows, numeric) if good]
+    times = parse_times([row[0] for row in rows], [row[1] for row in rows], time_format)
+
+    valid = numpy.isfinite(times)
+    data = {'time': times[valid]}
+    for name in names:
+        data[name] = values[valid, selected.index(columns.index(name))] if name in columns else \
+            numpy.full(int(valid.sum()), numpy.nan)
+    return data, not_comments - int(valid.sum())
+
+
+def read_data_file(path, names=None):
+    '''
+    Reads data file of any known schema.
+    :param path: full path of data file (plain or compressed)
+    :param names: COLUMNS to read, None for all, see parse_lines()
+    :return: info dict (schema, time_format, skipped lines, header, plus header_info() keys),
+             dict: 'time' and COLUMNS (or names) -> numpy arrays
+    '''
+    lines = read_lines(path)
+    info = detect_schema(lines[:PREFIX_LINES])
+    header = lines[:info['data_start']]
+    info['header'] = header
+    info.update(header_info(header, path))
+    data_lines = [line for line in lines[info['data_start']:] if line.strip() != '']
+    if info['glued'] == True:
+        data_lines = [piece for line in data_lines for piece in GLUED.split(line) if piece.strip() != '']
+    if info['schema'] == 'empty':
+        data, skipped = parse_lines([], 'basic', 'colon', names)
+    else:
+        data, skipped = parse_lines(data_lines, info['schema'], info['time_format'], names)
+    info['skipped'] = skipped
+    return info, data
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    measurements = argv[0] if len(argv) > 0 else 'Measurements'
+    counts = collections.Counter()
+    for folder, subfolders, files in os.walk(measurements):
+        for file_name in sorted(files):
+            if file_name.endswith(('.csv', '.txt', '.gz', '.xz')) == False and \
+                    ('MASTER' in file_name or 'SLAVE' in file_name) == False:
+                continue
+            if file_name == 'log.txt' or is_segment(file_name) or \
+                    (file_name.endswith(NOT_DATA_SUFFIXES) and file_name.endswith(MANIFEST_SUFFIX) == False):
+                continue
+            path = os.path.join(folder, file_name)
+            try:
+                schema = detect_file_schema(path)
+                label = schema['schema'] + '/' + schema['time_format']
+            except FormatError as exc:
+                label = 'unknown'
+                print(path + ': ' + str(exc))
+            counts[label] += 1
+            print(label + ' ' + path)
+    for label, count in counts.most_common():
+        print(label + ': ' + str(count) + ' files')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,28 +6,30 @@ GUI for CosmicWatch data collection. Uses CosmicWatchControl.py
 Contact: pawel.pietrzak7.stud@pw.edu.pl
 """
 
+import multiprocessing
 import os
 import sys
 import time
 import webbrowser
 
-import matplotlib.animation as anim
-import matplotlib.figure as mpl_fig
 import serial.tools.list_ports
 from PyQt5 import QtCore
 from PyQt5.QtCore import Qt, QTimer, QDate
 from PyQt5.QtGui import QPixmap, QFont, QColor, QIntValidator
-from PyQt5.QtWidgets import (QApplication, QButtonGroup, QComboBox,
+from PyQt5.QtWidgets import (QApplication, QCheckBox, QComboBox,
                              QFileDialog, QGridLayout, QGroupBox, QHBoxLayout, QLabel, QLineEdit,
-                             QPushButton, QRadioButton,
+                             QPushButton,
                              QVBoxLayout, QWidget, QTableWidget, QTableWidgetItem)
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from numpy import polyfit, poly1d
-from numpy import array
 
+# charts (matplotlib, NumPy), temperature calibration and acquisition processes are imported on first use
 
 from CosmicWatchControl import *
+from DataFiles import strip_data_suffix, parse_rotation
+from PortMonitor import PortMonitor
+from EventStream import EventServer, STREAM_PORT
+from Metrics import MetricsServer, render_metrics, METRICS_PORT
+from Timestamping import HostClock
+from HDF5Store import hdf5_available, read_hdf5, HDF5_SUFFIX
 
 
 class CosmicWatchError(Exception):
@@ -41,11 +43,14 @@ class InvalidCOMError(CosmicWatchError):
 
 class FakeCosmicWatch():
     '''
-    Empty class with 2 attributes - amplitudes_list and adc_list that pretends to be CosmicWatch for StaticChart purpose
+    Empty class with 3 lists - amplitudes_list, adc_list and temp_list that pretends to be CosmicWatch for StaticChart
+    purpose
     '''
     def __init__(self):
         self.amplitudes_list = []  # list of all amplitudes
         self.adc_list = []  # list of all digital amplitudes
+        self.temp_list = []  # list of all temperatures
+        self.device_id = 'Unknown'
         self.angle = 0
         self.distance = 0
         self.rate = 0
@@ -61,10 +66,18 @@ class GUIControl(QWidget):
     selected_ports = []
 
     paused = False
-    pause_deadtime_seconds = 0
 
     charts = [] # List to store Chart_Window objects in, if not referenced they are cleared by garbage collector
 
+    event_server = None # EventServer when live stream is on
+    stream_host = '127.0.0.1' # '' to publish live stream to LAN
+    stream_port = STREAM_PORT
+    stream_interval = 500 # ms between published batches
+    metrics_server = None # MetricsServer when metrics endpoint is on
+    metrics_host = '127.0.0.1' # '' to allow scraping from LAN
+    metrics_port = METRICS_PORT
+    clock = None # HostClock of running measurement
+
     file_path = ''
     directory = os.getcwd()
     print(directory)
@@ -82,11 +95,17 @@ class GUIControl(QWidget):
     distance_background_rgb ='#FFFFFF'
     odd_rgb = QColor('#31B3E8')
     even_rgb = QColor('#FFE135')
+    alert_rgb = QColor('#EB8D96') # row of detector with rate or spectrum alert, see Anomalies.py
     title_color = '#2D3843'
 
     def __init__(self):
         super().__init__()
 
+        self.calibration = None # temperature coefficients, loaded by get_calibration()
+        self.chart_scheduler = None # redraws live charts, created by get_chart_scheduler()
+        self.stream_positions = {} # port name -> number of events already published
+        self.table_versions = {} # row -> (version, device_id, mode) shown in data_table
+
         self.init_ui()
 
     def init_ui(self):
@@ -112,6 +131,12 @@ class GUIControl(QWidget):
 
         self.display_ports()
 
+        # watch for plugged/unplugged detectors
+        self.port_monitor = PortMonitor()
+        self.port_monitor.port_added.connect(self.handle_port_added)
+        self.port_monitor.port_removed.connect(self.handle_port_removed)
+        self.port_monitor.start_monitor()
+
     def create_log_file(self):
         '''
         :return:
@@ -150,6 +175,10 @@ class GUIControl(QWidget):
         times_timer.start(1000)
         times_timer.timeout.connect(self.refresh_timers)
 
+        stream_timer = QTimer(self)
+        stream_timer.start(self.stream_interval)
+        stream_timer.timeout.connect(self.publish_events)
+
 
     def refresh_timers(self):
         '''
@@ -163,27 +192,43 @@ class GUIControl(QWidget):
                 updated = True
         if len(self.detectors) > 0 and updated == False:
             self.update_timers(self.detectors[0])
+        self.check_anomalies()
+
+    def check_anomalies(self):
+        '''
+        Silence check of running detectors, rows of detectors with recent alert are highlighted. Ticks every second.
+        '''
+        if len(self.detectors) == 0:
+            return
+        now = self.clock.now()
+        for detector in self.detectors:
+            if detector.anomalies is None:
+                continue
+            if detector.paused == False and detector.fail_counter == 0:
+                message = detector.anomalies.check_silence(now)
+                if message is not None:
+                    self.update_log('ALERT for ID ' + detector.device_id + ': ' + message)
+            try:
+                self.format_table(detector.row, detector.anomalies.alert_active(now))
+            except AttributeError: # row not initialized yet
+                pass
 
 
     def update_timers(self, detector):
         '''
-        Updates realtime, deadtime, livetime timers. Ticks every seconds. Updates self.pause_deadtime_seconds on pause.
+        Updates realtime, deadtime, livetime timers. Ticks every seconds. Times are read from detector.livetime,
+        which records pauses and disconnections itself, so missed ticks don't matter.
         :param detector: CosmicWatch detectors
         '''
-        now = datetime.datetime.now(datetime.timezone.utc)
-        if self.paused == True:
-            self.pause_deadtime_seconds = self.pause_deadtime_seconds + 1
-        realtime = now - detector.time_start
-        deadtime = datetime.timedelta(seconds=detector.deadtime)
-        #TODO make sure its not needed
-        #deadtime_pause = datetime.timedelta(seconds=self.pause_deadtime_seconds)
-        livetime = realtime - deadtime #- deadtime_pause
+        realtime, livetime, deadtime = detector.livetime.times(self.clock.elapsed())
+        if realtime <= 0:
+            return
 
-        deadtime_fraction = (deadtime.total_seconds() + self.pause_deadtime_seconds)/ realtime.total_seconds()
+        deadtime_fraction = deadtime / realtime
         deadtime_percentage = "{:.3%}".format(deadtime_fraction)
 
-        self.realtime_label.setText('Real Time: ' + str(realtime)[:-7])
-        self.livetime_label.setText('Live Time: ' + str(livetime)[:-7])
+        self.realtime_label.setText('Real Time: ' + str(datetime.timedelta(seconds=int(realtime))))
+        self.livetime_label.setText('Live Time: ' + str(datetime.timedelta(seconds=int(livetime))))
         self.deadtime_label.setText('Dead Time: ' + str(deadtime_percentage))
 
 
@@ -268,10 +313,10 @@ class GUIControl(QWidget):
         '''
         Set self.paused and detector.paused for each detector to True. Disable pause button. Enable resume button.
         '''
-        self.pause_time = datetime.datetime.now()
+        pause_time = self.clock.elapsed()
         self.paused = True
         for detector in self.detectors:
-            detector.paused = True
+            detector.pause(pause_time)
         self.resume_button.setDown(False)
         self.resume_button.setEnabled(True)
         self.pause_button.setDown(True)
@@ -283,9 +328,10 @@ class GUIControl(QWidget):
         '''
         Set self.paused and detector.paused for each detector to False. Disable resume button. Enable pause button.
         '''
+        resume_time = self.clock.elapsed()
         self.paused = False
         for detector in self.detectors:
-            detector.paused = False
+            detector.resume(resume_time)
         self.resume_button.setDown(True)
         self.resume_button.setEnabled(False)
         self.pause_button.setDown(False)
@@ -327,9 +373,13 @@ class GUIControl(QWidget):
         self.create_chart = QPushButton('Open data file')
         self.create_chart.clicked.connect(self.open_in_notepad)
 
+        calibrate_button = QPushButton('Calibrate temperature')
+        calibrate_button.clicked.connect(self.calibrate_temperature)
+
         file_reading_layout.addWidget(file_select)
         file_reading_layout.addWidget(multiple_charts)
         file_reading_layout.addWidget(self.create_chart)
+        file_reading_layout.addWidget(calibrate_button)
         file_reading_layout.addStretch()
         ###
         first_column = QVBoxLayout()
@@ -345,10 +395,32 @@ class GUIControl(QWidget):
         show_charts_button = QPushButton('Show charts')
         show_charts_button.clicked.connect(self.show_live_charts)
         charts_layout.addWidget(show_charts_button)
+        show_histograms_button = QPushButton('Show 2D histograms')
+        show_histograms_button.setToolTip('Amplitude against time and temperature.')
+        show_histograms_button.clicked.connect(self.show_live_histograms)
+        charts_layout.addWidget(show_histograms_button)
+        show_statistics_button = QPushButton('Show statistics')
+        show_statistics_button.clicked.connect(self.show_statistics)
+        charts_layout.addWidget(show_statistics_button)
         charts_layout.addStretch()
 
+        stream_group = QGroupBox('Remote access')
+        stream_layout = QVBoxLayout()
+        stream_group.setLayout(stream_layout)
+        stream_box = QCheckBox('Publish events')
+        stream_box.setToolTip('Stream events to viewers connecting to ' + (self.stream_host or 'any address') + ':' +
+                              str(self.stream_port) + ' (python EventStream.py).')
+        stream_box.toggled.connect(self.toggle_stream)
+        stream_layout.addWidget(stream_box)
+        metrics_box = QCheckBox('Metrics endpoint')
+        metrics_box.setToolTip('Serve Prometheus metrics at http://' + (self.metrics_host or 'localhost') + ':' +
+                               str(self.metrics_port) + '/metrics')
+        metrics_box.toggled.connect(self.toggle_metrics)
+        stream_layout.addWidget(metrics_box)
+
         second_column.addStretch()
         second_column.addWidget(charts_group)
+        second_column.addWidget(stream_group)
         second_column.addStretch()
 
         # Times
@@ -413,11 +485,45 @@ class GUIControl(QWidget):
         '''
         #self.get_multiple_file_paths()
         try:
+            from Charts import Chart_Window
             chart = Chart_Window('Multiple files ', FakeCosmicWatch(), False, True, self, len(self.charts))
             self.charts.append(chart)
         except Exception as ChartError:
             self.warning_info_panel('Chart creation failed. Function: chart_multiple_files. Error: ' +repr(ChartError))
 
+    def calibrate_temperature(self):
+        '''
+        Fits amplitude vs temperature of every detector over all files in measurements directory and saves the
+        coefficients used by "Temperature corrected" chart option.
+        '''
+        try:
+            from TemperatureCalibration import CALIBRATION_FILE, save_calibration, calibrate, find_data_files
+            self.calibration = calibrate(find_data_files(self.directory))
+            save_calibration(self.calibration, self.directory + CALIBRATION_FILE)
+        except Exception as CalibrationError:
+            self.warning_info_panel('Temperature calibration failed. Error: ' + repr(CalibrationError))
+            return
+        message = 'Temperature calibration saved for: ' + ', '.join(sorted(self.calibration)) + '.'
+        self.update_info_panel(message)
+
+    def get_chart_scheduler(self):
+        '''
+        :return: ChartScheduler drawing all live charts, created with the first live chart
+        '''
+        if self.chart_scheduler is None:
+            from Charts import ChartScheduler
+            self.chart_scheduler = ChartScheduler(self)
+        return self.chart_scheduler
+
+    def get_calibration(self):
+        '''
+        :return: dict: device_id -> temperature coefficients, read from measurements directory on first call
+        '''
+        if self.calibration is None:
+            from TemperatureCalibration import CALIBRATION_FILE, load_calibration
+            self.calibration = load_calibration(self.directory + CALIBRATION_FILE)
+        return self.calibration
+
     def add_comment_log(self):
         '''
         Add custom comment in log
@@ -442,9 +548,9 @@ class GUIControl(QWidget):
 
     def get_file_path(self):
         '''
-        Opens dialog box for file select of .txt and .csv and saves it full path to self.file_path.
+        Opens dialog box for file select of .txt, .csv and compressed files and saves it full path to self.file_path.
         '''
-        open_file = QFileDialog.getOpenFileName(self, 'Open measurements file', '', 'Text files (*.txt *.csv)')
+        open_file = QFileDialog.getOpenFileName(self, 'Open measurements file', '', 'Data files (*.txt *.csv *.gz *.xz *.h5 *.manifest.json)')
         self.file_path = open_file[0]
         if self.file_path == '':
             self.update_info_panel('No file was selected.')
@@ -455,13 +561,14 @@ class GUIControl(QWidget):
         '''
         Opens selected .txt or .csv file as chart. Requires empty line after header or no header (raw data).
         '''
-        file_name = self.file_path.split('/')[-1][:-4]
+        file_name = strip_data_suffix(self.file_path.split('/')[-1])
         try:
             data_pack = self.prepare_data(self.file_path)
         except Exception as DataReadingError:
             self.warning_info_panel('Data reading failed. Error: ' + repr(DataReadingError))
             return
         try:
+            from Charts import Chart_Window
             chart = Chart_Window(file_name, data_pack, False, False, self, len(self.charts))
             self.charts.append(chart)
         except Exception as ChartReadingError:
@@ -469,8 +576,8 @@ class GUIControl(QWidget):
 
     def prepare_data(self, path):
         '''
-        Reads file. If it has no header or header is separated by empty line reads it into list of lists of specific
-        columns. Currently only read adc and amplitudes column but can be modified to read others, like temperature.
+        Reads adc, amplitudes and temperature columns of data file of any layout known to FileFormats.py.
+        Compressed files (.gz, .xz) are opened transparently. HDF5 files (.h5) are read with read_hdf5().
         :param path: full path of text file with data
         :return data pack = list of two lists: adc_list and amplitudes_list
         '''
@@ -479,53 +586,36 @@ class GUIControl(QWidget):
         distance = -1
         rate = -1
 
-        with open(path, 'r') as og_file:
-            lines = og_file.readlines()
-        # Ignore header
-        i = 0
-        empty_line_found = False
-        for line in lines:
-            #TODO distance reading
-            try:
-                if len(line) > 15:
-                    if line[0:13] == '### Distance:':
-                        line_list = line.split(' ')
-                        distance = line_list[2]
-                        angle = line_list[5]
-            except:
-                pass
-
-            if line.strip() == '':
-                empty_line_found = True
-                break
-            i += 1
-        if empty_line_found == True:
-            lines = lines[i+1:]
-        elif len(lines[0].split()) < 6:
-            print(lines[0].split())
-            raise
-
-        # Read data to lists
-        # TODO maybe read to numpy arrays?
-        for line in lines:
-            line_list = line.split(' ')
-            # other columns can be added in a same way. NOTE: it requires modification of FakeCosmicWatch class
-            data_pack.adc_list.append(float(line_list[4]))
-            data_pack.amplitudes_list.append(float(line_list[5]))
-
-        # reading rate
-        # TODO read rate from time and number
-        # reads rate assuming it's 9th element of data line
-        try:
-            last_line = lines[-1]
-            last_line = last_line.split(' ')
-            if len(last_line) > 8:
-                rate = float(last_line[8])
-                if rate > 10:
-                    self.warning_info_panel('ERROR: Read rate [9th element] bigger than 10. Suspicious value.')
-                    raise InvalidInputError
-        except:
-            pass
+        if path.endswith(HDF5_SUFFIX):
+            data = read_hdf5(path, ['adc', 'sipm', 'temp', 'rate'])
+            data_pack.adc_list = list(data['adc'].astype(float))
+            data_pack.amplitudes_list = list(data['sipm'].astype(float))
+            data_pack.temp_list = list(data['temp'].astype(float))
+            data_pack.device_id = str(data['attrs'].get('device_id', data_pack.device_id))
+            data_pack.angle = float(data['attrs'].get('angle', angle))
+            data_pack.distance = float(data['attrs'].get('distance', distance))
+            data_pack.rate = float(data['rate'][-1]) if len(data['rate']) > 0 else rate
+            return data_pack
+
+        # file layout is detected and parsed by FileFormats.py
+        from FileFormats import read_data_file
+        info, data = read_data_file(path)
+        if info['skipped'] > 0:
+            self.update_info_panel('Skipped ' + str(info['skipped']) + ' malformed lines. File layout: ' +
+                                   info['schema'] + '.')
+        data_pack.device_id = info['device_id']
+        if info['distance'] != '':
+            distance = info['distance']
+            angle = info['angle']
+        data_pack.adc_list = data['adc'].tolist()
+        data_pack.amplitudes_list = data['sipm'].tolist()
+        data_pack.temp_list = data['temp'].tolist()
+
+        # rate of last event, only files with Rate column have it
+        if len(data['rate']) > 0 and data['rate'][-1] == data['rate'][-1]: # not NaN
+            rate = float(data['rate'][-1])
+            if rate > 10:
+                self.warning_info_panel('ERROR: Read rate [9th element] bigger than 10. Suspicious value.')
 
         data_pack.angle = float(angle)
         data_pack.distance = float(distance)
@@ -629,10 +719,17 @@ class GUIControl(QWidget):
         return com_group
 
     def fill_com_combobox(self, combobox):
+        '''
+        Refills combobox with self.port_list. Keeps current selection if the port is still available.
+        '''
+        selected = combobox.currentText()
         combobox.clear()
         combobox.addItem('')
         for port in self.port_list:
             combobox.addItem(port)
+        index = combobox.findText(selected)
+        if index > 0:
+            combobox.setCurrentIndex(index)
 
     def create_data_table(self):
         '''
@@ -698,13 +795,52 @@ class GUIControl(QWidget):
         distance_layout.addWidget(distance_label)
         distance_layout.addWidget(distance_line)
         distance_layout.addStretch()
+        # Compression box
+        compression_layout = QVBoxLayout()
+        compression_label = QLabel()
+        compression_label.setText('Compression')
+        compression_box = QComboBox()
+        compression_box.addItem('None')
+        compression_box.addItem('gzip')
+        compression_box.addItem('xz')
+        compression_box.setFixedWidth(70)
+        compression_layout.addWidget(compression_label)
+        compression_layout.addWidget(compression_box)
+        hdf5_box = QCheckBox('HDF5')
+        if hdf5_available() == False:
+            hdf5_box.setEnabled(False)
+            hdf5_box.setToolTip('Install h5py to save HDF5 files.')
+        compression_layout.addWidget(hdf5_box)
+        process_box = QCheckBox('Processes')
+        process_box.setToolTip('Read each detector in a separate process.')
+        compression_layout.addWidget(process_box)
+        compression_layout.addStretch()
+        # Rotation box
+        rotation_layout = QVBoxLayout()
+        rotation_label = QLabel()
+        rotation_label.setText('File rotation')
+        rotation_box = QComboBox()
+        rotation_box.setEditable(True) # any limit can be typed, e.g. '12 h'
+        for rotation in ['None', '1 h', '6 h', '24 h', '10 MB', '100 MB', '100000 events']:
+            rotation_box.addItem(rotation)
+        rotation_box.setToolTip('Start a new numbered file after this time, size or number of events.')
+        rotation_box.setFixedWidth(110)
+        rotation_layout.addWidget(rotation_label)
+        rotation_layout.addWidget(rotation_box)
+        rotation_layout.addStretch()
         # Stitch input group
         input_layout.addLayout(angle_layout)
         input_layout.addLayout(distance_layout)
+        input_layout.addLayout(compression_layout)
+        input_layout.addLayout(rotation_layout)
         input_group.setLayout(input_layout)
 
         self.angle_input = angle_box
         self.distance_input = distance_line
+        self.compression_input = compression_box
+        self.rotation_input = rotation_box
+        self.hdf5_input = hdf5_box
+        self.process_input = process_box
         return input_group
 
     def create_first_row(self):
@@ -772,8 +908,14 @@ class GUIControl(QWidget):
         # TODO: connecting all detectors as master, without audio cable and then doing the coincidence mode in the program
         # TODO: would allow for more detectors working in the cooincidence mode at the same time, also doesnt require audio jack
 
+        # each reader in its own process or in a thread of GUI process
+        detector_class = CosmicWatch
+        if self.process_input.isChecked():
+            from AcquisitionProcess import DetectorProcess
+            detector_class = DetectorProcess
+
         if com1 != '':
-            Albert = CosmicWatch()
+            Albert = detector_class()
             Albert.port_name = com1
             Albert.row = 0
             self.detectors.append(Albert)
@@ -781,18 +923,25 @@ class GUIControl(QWidget):
             Albert.chart_initializer.connect(lambda: self.add_live_chart(Albert))
 
         if com2 != '':
-            Bernard = CosmicWatch()
+            Bernard = detector_class()
             Bernard.port_name = com2
             Bernard.row = 1
             self.detectors.append(Bernard)
             Bernard.table_updater.connect(lambda: self.modify_table(Bernard))
             Bernard.chart_initializer.connect(lambda: self.add_live_chart(Bernard))
 
+        compression = str(self.compression_input.currentText())
+        if compression == 'None':
+            compression = ''
+
         for detector in self.detectors:
             detector.masterGUI = self
             detector.directory = self.directory
             detector.angle = angle
             detector.distance = distance
+            detector.compression = compression
+            detector.rotation = parse_rotation(str(self.rotation_input.currentText()))
+            detector.hdf5 = self.hdf5_input.isChecked()
 
     def start_detectors(self):
         '''
@@ -815,10 +964,12 @@ class GUIControl(QWidget):
         self.start.setEnabled(False)
         self.pause_button.setDown(False)
         self.pause_button.setEnabled(True)
-        self.pause_deadtime_seconds = 0
         self.paused = False
 
         self.time_start = datetime.datetime.now(datetime.timezone.utc)
+        self.clock = HostClock(self.time_start) # common monotonic time base of all detectors
+        self.stream_positions.clear()
+        self.table_versions.clear()
 
         try: self.create_log_file()  #TUTEJ
         except: pass
@@ -827,6 +978,7 @@ class GUIControl(QWidget):
             time.sleep(0.2) # To force detector2 into slave mode by initializing master earlier
             # Thread(target=detector.start_program()).start()
             detector.time_start = self.time_start
+            detector.clock = self.clock
             detector.start_program()
 
     def add_live_chart(self, detector):
@@ -834,9 +986,26 @@ class GUIControl(QWidget):
         Opens live chart showing detector data
         :param detector: detector of wchich data will be displayed
         '''
+        if self.raise_live_chart(detector, False) == True:
+            return
+        from Charts import Chart_Window
         chart = Chart_Window(detector.mode, detector, True, False, self, len(self.charts))
         self.charts.append(chart) # it has to be referenced not to be deleted by garbage collector
 
+    def raise_live_chart(self, detector, heatmap):
+        '''
+        Brings open live chart of detector to front, so repeated clicks don't stack animated windows.
+        :param heatmap: bool, 2D histogram window instead of histogram
+        :return: True if the chart was open
+        '''
+        for chart in self.charts:
+            if getattr(chart, 'animated', False) == True and chart.detector is detector and chart.heatmap == heatmap:
+                chart.showNormal()
+                chart.raise_()
+                chart.activateWindow()
+                return True
+        return False
+
     def show_live_charts(self):
         '''
         Opens live charts of all detectors by calling self.add_live_chart()
@@ -845,6 +1014,94 @@ class GUIControl(QWidget):
         for detector in self.detectors:
             self.add_live_chart(detector)
 
+    def show_live_histograms(self):
+        '''
+        Opens live 2D histograms of all detectors.
+        '''
+        from Charts import Chart_Window
+        self.update_info_panel('"Show 2D histograms" button pressed.')
+        for detector in self.detectors:
+            if self.raise_live_chart(detector, True) == True:
+                continue
+            chart = Chart_Window(detector.mode, detector, True, False, self, len(self.charts), heatmap=True)
+            self.charts.append(chart) # it has to be referenced not to be deleted by garbage collector
+
+    def show_statistics(self):
+        '''
+        Opens live statistics window for each detector.
+        '''
+        self.update_info_panel('"Show statistics" button pressed.')
+        for detector in self.detectors:
+            window = StatisticsWindow(detector, self)
+            self.charts.append(window) # it has to be referenced not to be deleted by garbage collector
+
+    def toggle_stream(self, checked):
+        '''
+        Starts or stops EventServer.
+        :param checked: bool, state of 'Publish events' checkbox
+        '''
+        if checked == True:
+            try:
+                self.event_server = EventServer(self.stream_host, self.stream_port)
+                self.event_server.start()
+            except OSError as exc:
+                self.event_server = None
+                self.warning_info_panel('ERROR: Live stream could not be started. ' + str(exc))
+                return
+            self.update_info_panel('Live stream started on port ' + str(self.stream_port) + '.')
+        elif self.event_server is not None:
+            self.event_server.stop()
+            self.event_server = None
+            self.update_info_panel('Live stream stopped.')
+
+    def toggle_metrics(self, checked):
+        '''
+        Starts or stops MetricsServer.
+        :param checked: bool, state of 'Metrics endpoint' checkbox
+        '''
+        if checked == True:
+            try:
+                self.metrics_server = MetricsServer(self.render_metrics, self.metrics_host, self.metrics_port)
+                self.metrics_server.start()
+            except OSError as exc:
+                self.metrics_server = None
+                self.warning_info_panel('ERROR: Metrics endpoint could not be started. ' + str(exc))
+                return
+            self.update_info_panel('Metrics endpoint started on port ' + str(self.metrics_port) + '.')
+        elif self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+            self.update_info_panel('Metrics endpoint stopped.')
+
+    def render_metrics(self):
+        '''
+        Called from MetricsServer thread, only reads detector values.
+        '''
+        subscribers = len(self.event_server.subscribers) if self.event_server is not None else 0
+        return render_metrics(list(self.detectors), self.clock, subscribers)
+
+    def publish_events(self):
+        '''
+        Publishes events read since last call, one message per detector. Ticks every stream_interval ms.
+        '''
+        if self.event_server is None:
+            return
+        for detector in self.detectors:
+            start = self.stream_positions.get(detector.port_name, 0)
+            snapshot = detector.snapshot()
+            end = snapshot.version
+            self.stream_positions[detector.port_name] = end
+            if len(self.event_server.subscribers) == 0: # new subscribers get only new events
+                continue
+            realtime, livetime, deadtime = detector.livetime.times(self.clock.elapsed())
+            self.event_server.publish({'type': 'events', 'detector': detector.device_id, 'mode': detector.mode,
+                                       'number': detector.number, 'rate': detector.rate,
+                                       'rate_error': detector.rate_error, 'realtime': realtime,
+                                       'livetime': livetime, 'deadtime': deadtime,
+                                       'sipm': list(snapshot.column('amplitudes_list', start)),
+                                       'adc': list(snapshot.column('adc_list', start)),
+                                       'temp': list(snapshot.column('temp_list', start))})
+
     def validate_input(self):
         '''
         User input validation. Raises predicted errors and displays them on info panel.
@@ -869,6 +1126,12 @@ class GUIControl(QWidget):
             self.warning_info_panel('ERROR: First digit of the distance is 0.')
             raise InvalidInputError
 
+        try:
+            parse_rotation(str(self.rotation_input.currentText()))
+        except ValueError as exc:
+            self.warning_info_panel('ERROR: ' + str(exc))
+            raise InvalidInputError
+
     def read_inputs(self):
         '''
         Reads data given by user.
@@ -916,11 +1179,15 @@ class GUIControl(QWidget):
 
     def modify_table(self, detector):
         '''
-        Updates table row of given detector.
+        Updates table row of given detector, nothing is done when no event came since last update.
         :param detector:
         :return: CosmicWatch() class
         '''
         row = detector.row
+        shown = (detector.version, detector.device_id, detector.mode)
+        if self.table_versions.get(row) == shown:
+            return
+        self.table_versions[row] = shown
 
         self.data_table.setItem(row, 0, QTableWidgetItem(detector.device_id))
         self.data_table.setItem(row, 1, QTableWidgetItem(detector.mode))
@@ -938,14 +1205,16 @@ class GUIControl(QWidget):
         # self.data_table.item(row, 6).setText(str(detector.number))
 
         try:
-            self.format_table(row)
+            alert = detector.anomalies is not None and detector.anomalies.alert_active(self.clock.now())
+            self.format_table(row, alert)
         except:
             pass
 
-    def format_table(self, row):
+    def format_table(self, row, alert=False):
         '''
         Format table row.
         :param row: int
+        :param alert: highlight row of detector with recent alert
         :return:
         '''
 
@@ -956,7 +1225,9 @@ class GUIControl(QWidget):
         # Color background
         for column in range(self.data_table.columnCount()):
             item = self.data_table.item(row, column)
-            if row% 2 == 1:
+            if alert == True:
+                item.setBackground(self.alert_rgb)
+            elif row% 2 == 1:
                 item.setBackground(self.odd_rgb)
             else:
                 item.setBackground(self.even_rgb)
@@ -984,572 +1255,119 @@ class GUIControl(QWidget):
         self.fill_com_combobox(self.COM2)
         self.update_info_panel(message)
 
+    def handle_port_added(self, port):
+        '''
+        Called by PortMonitor when a port appears. Updates port list and wakes up reconnection of its detector.
+        :param port: port name, e.g. 'COM7'
+        '''
+        if port not in self.port_list:
+            self.port_list.append(port)
+            self.fill_com_combobox(self.COM1)
+            self.fill_com_combobox(self.COM2)
+        self.update_info_panel('Port connected: ' + port + '.')
+        for detector in self.detectors:
+            if detector.port_name == port:
+                detector.port_available()
+
+    def handle_port_removed(self, port):
+        '''
+        Called by PortMonitor when a port disappears. Updates port list and stops blocked reading of its detector.
+        :param port: port name, e.g. 'COM7'
+        '''
+        if port in self.port_list:
+            self.port_list.remove(port)
+            self.fill_com_combobox(self.COM1)
+            self.fill_com_combobox(self.COM2)
+        for detector in self.detectors:
+            if detector.port_name == port:
+                detector.port_lost()
+        self.warning_info_panel('Port disconnected: ' + port + '.')
+        try:
+            self.update_log('Port disconnected: ' + port + '.')
+        except: pass
+
 
-class Chart_Window(QWidget):
+class StatisticsWindow(QWidget):
     '''
-    Secondary window displaying chart. Can run StaticChart or AnimatedChart.
-    :param mode = Title of window or chart.
-    :param detector = CosmicWatch() class or FakeCosmicWatch() class. It must have attributes used by charts.
-    :param animated = bool
-    :param multiple = bool
+    Secondary window with live streaming statistics of detector. Refreshed every second.
+    :param detector = CosmicWatch() class
     :param masterGUI = GUIControl() class, the master GUI
-    :param chart_list_index = int, index of this window on chart_list of GUI. Used for memory clearing.
     '''
 
-    chart_updater = pyqtSignal() # signal used to update chart on button change
-
-    color_dict = {
-        'Blue': '#31B3E8',
-        'Red': '#ff0000',
-        'Black': '#000000',
-        'Violet': '#ee82ee',
-        'Green': '#228b22',
-        'Brown': '#a52a3a',
-        'Chocolate': '#d2691e',
-        'Orange': '#ffa500'
-    }
+    columns = ['N', 'Mean', 'Std', 'Median', '95th pct.', 'Min', 'Max']
+    keys = ['n', 'mean', 'std', 'median', 'p95', 'min', 'max']
 
-    def __init__(self, mode, detector, animated, multiple, masterGUI, chart_list_index):
+    def __init__(self, detector, masterGUI):
         super().__init__()
         self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
-
-        self.data_pack_list = []
+        self.detector = detector
         self.masterGUI = masterGUI
-        self.multiple = multiple
-        self.chart_list_index = chart_list_index
+        self.setWindowTitle(detector.mode + ' ' + detector.device_id + ' statistics [Online]')
+
         layout = QVBoxLayout()
         self.setLayout(layout)
-
-
-        if multiple == True:
-            self.setWindowTitle(mode)
-            #self.myFig = MultipleChart(mode, self, self.chart_updater)
-            self.myFig = RatesChart(mode, self, self.chart_updater)
-        elif animated == False:
-            self.setWindowTitle(mode)
-            self.myFig = StaticChart(mode, detector, self.chart_updater)
-        else:
-            self.setWindowTitle(mode + ' [Online]')
-            self.myFig = AnimatedChart(mode, detector)
-
-        toolbar = NavigationToolbar(self.myFig, self)
-        layout.addWidget(toolbar)
-        layout.addWidget(self.myFig)
-
-        if multiple == True:
-            buttons = self.create_buttons_rates()
-        else:
-            buttons = self.create_buttons()
-
-        layout.addLayout(buttons)
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.columns))
+        self.table.setRowCount(len(detector.statistics.quantities))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setVerticalHeaderLabels(list(detector.statistics.quantities.values()))
+        self.table.setMinimumWidth(750)
+        self.table.setStyleSheet("background-color:" + masterGUI.info_background_rgb)
+        layout.addWidget(self.table)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_table)
+        self.timer.start(1000)
+        self.update_table()
 
         self.setStyleSheet('background-color: #f7f9d4')
         self.show()
 
-    def create_buttons_rates(self):
-        '''
-         Creates radio buttons
-         Scales: linear vs log
-         Xscale: distance vs angle
-         Bars: empty vs filled
-          '''
-        #.adc = x scale unit
-
-        # button settings
-        buttons = QGridLayout()
-        scales = QButtonGroup(self)
-        values = QButtonGroup(self)
-        buttons.setAlignment(Qt.AlignHCenter)
-
-        linear_scale = QRadioButton('Linear scale')
-        linear_scale.log = False
-        linear_scale.setChecked(True)
-        linear_scale.toggled.connect(self.change_scale)
-        scales.addButton(linear_scale)
-        buttons.addWidget(linear_scale, 1, 0)
-
-        log_scale = QRadioButton('Log scale')
-        log_scale.log = True
-        log_scale.toggled.connect(self.change_scale)
-        scales.addButton(log_scale)
-        buttons.addWidget(log_scale, 0, 0)
-
-        distance_values = QRadioButton('Compare distances')
-        distance_values.adc = True  # x axis distance
-        distance_values.xlabel = 'Distance [cm]'
-        distance_values.toggled.connect(self.change_values)
-        values.addButton(distance_values)
-        buttons.addWidget(distance_values, 0, 1)
-
-        angle_values = QRadioButton('Compare angles')
-        angle_values.adc = False  # x axis = angle
-        angle_values.xlabel = 'Angle [deg]'
-        angle_values.toggled.connect(self.change_values)
-        angle_values.setChecked(True)
-        values.addButton(angle_values)
-        buttons.addWidget(angle_values, 1, 1)
-
-        add_chart_button = QPushButton('Add graph')
-        add_chart_button.clicked.connect(self.add_chart)
-
-        edit_chart_button = QPushButton('Edit graph')
-        edit_chart_button.clicked.connect(self.edit_chart)
-
-        buttons.addWidget(add_chart_button, 1, 3)
-        buttons.addWidget(edit_chart_button, 0, 3)
-
-        return buttons
-
-    def create_buttons(self):
-        '''
-        Creates radio buttons
-        Scales: linear vs log
-        Xscale: amplitudes vs adc
-        Bars: empty vs filled
-        '''
-        # button settings
-        buttons = QGridLayout()
-        scales = QButtonGroup(self)
-        values = QButtonGroup(self)
-        buttons.setAlignment(Qt.AlignHCenter)
-
-        linear_scale = QRadioButton('Linear scale')
-        linear_scale.log = False
-        linear_scale.setChecked(True)
-        linear_scale.toggled.connect(self.change_scale)
-        scales.addButton(linear_scale)
-        buttons.addWidget(linear_scale, 1, 0)
-
-        log_scale = QRadioButton('Log scale')
-        log_scale.log = True
-        log_scale.toggled.connect(self.change_scale)
-        scales.addButton(log_scale)
-        buttons.addWidget(log_scale, 0, 0)
-
-        digital_values = QRadioButton('Digital values')
-        digital_values.adc = True
-        digital_values.xlabel = 'ADC [0-1023]'
-        digital_values.toggled.connect(self.change_values)
-        values.addButton(digital_values)
-        buttons.addWidget(digital_values, 0, 1)
-
-        analog_values = QRadioButton('Analog amplitudes')
-        analog_values.adc = False
-        analog_values.xlabel = 'Amplitude [mV]'
-        analog_values.toggled.connect(self.change_values)
-        analog_values.setChecked(True)
-        values.addButton(analog_values)
-        buttons.addWidget(analog_values, 1, 1)
-
-        filling = QButtonGroup()
-
-        filled = QRadioButton('Bars filled')
-        filled.fill = 'stepfilled'
-        filled.toggled.connect(self.change_fill)
-        filling.addButton(filled)
-        buttons.addWidget(filled, 0, 2)
-
-        empty = QRadioButton('Bars empty')
-        empty.fill = 'step'
-        empty.setChecked(True)
-        empty.toggled.connect(self.change_fill)
-        filling.addButton(empty)
-        buttons.addWidget(empty, 1, 2)
-
-        if self.multiple == False:
-            color_box = QComboBox()
-            color_list = sorted(self.color_dict.keys())
-            for color in color_list:
-                color_box.addItem(color)
-            color_box.setCurrentIndex(1)
-            color_box.currentIndexChanged.connect(self.change_color)
-            buttons.addWidget(color_box, 1, 3)
-
-            color_label = QLabel()
-            color_label.setText('Color selection:')
-            buttons.addWidget(color_label, 0, 3)
-        else:
-            add_chart_button = QPushButton('Add graph')
-            add_chart_button.clicked.connect(self.add_chart)
-
-            edit_chart_button = QPushButton('Edit graph')
-            edit_chart_button.clicked.connect(self.edit_chart)
-
-            buttons.addWidget(add_chart_button, 1, 3)
-            buttons.addWidget(edit_chart_button, 0, 3)
-
-        return buttons
-
-    def add_chart(self):
-        '''
-        Opens dialog box for file select of .txt and .csv and saves it full path to self.file_path.
-        Opens selected .txt or .csv file as chart. Requires empty line after header or no header (raw data).
-        '''
-        open_file = QFileDialog.getOpenFileName(self, 'Open measurements file', '', 'Text files (*.txt *.csv)')
-        file_path = open_file[0]
-        if file_path == '':
-            self.masterGUI.update_info_panel('No file was selected.')
-        else:
-            self.masterGUI.update_info_panel('Selected file: ' + file_path)
-            #Opens selected .txt or .csv file as chart. Requires empty line after header or no header (raw data).
-            try:
-                data_pack = self.masterGUI.prepare_data(file_path)
-                self.data_pack_list.append(data_pack)
-            except Exception as DataReadingError:
-                self.masterGUI.warning_info_panel('Data reading failed. Error: ' + repr(DataReadingError))
-        self.chart_updater.emit()
-
-    def edit_chart(self):
-        pass
-
-    def change_scale(self):
-        button = self.sender()
-        if button.isChecked():
-            self.myFig.log = button.log
-            self.chart_updater.emit()
-
-    def change_values(self):
-        button = self.sender()
-        if button.isChecked():
-            self.myFig.adc_mode = button.adc
-            self.myFig.xlabel = button.xlabel
-            self.chart_updater.emit()
-
-    def change_fill(self):
-        button = self.sender()
-        if button.isChecked():
-            self.myFig.fill = button.fill
-            self.chart_updater.emit()
-
-    def change_color(self):
-        box = self.sender()
-        color = box.currentText()
-        self.myFig.color = self.color_dict[color]
-        self.chart_updater.emit()
+    def update_table(self):
+        for row, name in enumerate(self.detector.statistics.quantities):
+            summary = self.detector.statistics.summary(name)
+            for column, key in enumerate(self.keys):
+                value = summary[key]
+                text = str(value) if key == 'n' else '{:.4g}'.format(value)
+                if summary['n'] == 0 and key != 'n':
+                    text = 'N/A'
+                item = QTableWidgetItem(text)
+                item.setTextAlignment(Qt.AlignCenter)
+                self.table.setItem(row, column, item)
 
     def closeEvent(self, event):
-        '''
-        On window closing delete references to this window from masterGUI.charts to let it be handled by garbage collector
-        :return:
-        '''
-        # Chart closed
+        self.timer.stop()
         self.masterGUI.charts.remove(self)
 
-class AnimatedChart(FigureCanvas, anim.FuncAnimation):
-    '''
-    Animated Chart
-    :param mode -> see class ChartWindow
-    :param detector -> see class ChartWindow
-    '''
-    #stopped = False
-    log = False
-
-    def __init__(self, mode, detector) -> None:
-        FigureCanvas.__init__(self, mpl_fig.Figure())
-        self.mode = mode
-        self.detector = detector
-
-        self.log = False
-        self.fill = 'step'
-        self.xlabel = 'Amplitude [mV]'
-        self.adc_mode = False
-        self.color = '#31B3E8'
-        self.adc_bin = 128
-        self.amplitude_bin = 60
-
-        self.axes = self.figure.subplots()
-        self.figure.set_facecolor('#f7f9d4')
-        self.axes.set_facecolor('#f7f9d4')
-
-        self.axes.set_ylabel('Number of detections')
-        self.axes.set_xlabel(self.xlabel)
-        self.axes.set_title(self.mode + ' histogram')
-
-        if self.adc_mode == False:
-            self.chart = self.axes.hist(self.detector.amplitudes_list, bins=self.amplitude_bin, color = self.color, histtype = self.fill, log = True)
-        else:
-            self.chart = self.axes.hist(self.detector.adc_list, bins=self.adc_bin, color= self.color, histtype=self.fill, log= True)
-
-        self.draw()
-        self.animation = anim.FuncAnimation.__init__(self, self.figure, self.update_chart, interval=1000)
-
-    def update_chart(self, i):
-        self.axes.clear()
-
-        if self.log == True:
-            self.adc_binb = 128
-            self.amplitude_bin = 60
-            self.axes.set_xscale("log")
-        else:
-            self.adc_bin = 128
-            self.amplitude_bin = 60
-            self.axes.set_xscale("linear")
-
-        if self.adc_mode == False:
-            self.chart = self.axes.hist(self.detector.amplitudes_list, bins=self.amplitude_bin, color = self.color, histtype = self.fill, log = True)
-        else:
-            self.chart = self.axes.hist(self.detector.adc_list, bins=self.adc_bin, color= self.color, histtype=self.fill, log= True)
-
-        self.axes.set_ylabel('Number of detections')
-        self.axes.set_xlabel(self.xlabel)
-        self.axes.set_title(self.mode + ' histogram')
-
-        return self.chart
-
-class StaticChart(FigureCanvas):
-    '''
-    Static chart
-    :param mode -> see class ChartWindow
-    :param CosmicWatch -> see class ChartWindow
-    :param chart_updater -> see class ChartWindow
-    '''
-
-    # lists used as data references for chart
-    adc_list = []
-    amplitudes_list = []
-
-    def __init__(self, mode, CosmicWatch, chart_updater) -> None:
-        FigureCanvas.__init__(self, mpl_fig.Figure())
-        self.mode = mode
-        chart_updater.connect(self.update_chart)
 
-        self.log = False
-        self.fill = 'step'
-        self.xlabel = 'Amplitude [mV]'
-        self.adc_mode = False
-        self.color = '#31B3E8'
 
-        self.adc_bin = 128
-        self.amplitude_bin = 60
-
-        self.amplitudes_list.clear()
-        self.adc_list.clear()
-        self.amplitudes = CosmicWatch.amplitudes_list
-        self.adc_list = CosmicWatch.adc_list
-
-        self.axes = self.figure.subplots()
-        self.figure.set_facecolor('#f7f9d4')
-        self.axes.set_facecolor('#f7f9d4')
-
-        if self.adc_mode == False:
-            self.chart = self.axes.hist(self.amplitudes, bins=128, color = self.color, histtype = self.fill, log = True)
-
-        else:
-            self.chart = self.axes.hist(self.adc_list, bins=128, color= self.color, histtype=self.fill, log= True)
-
-        self.draw()
-
-    def update_chart(self):
-
-        self.axes.clear()
-
-        if self.log == True:
-            self.adc_bin = 128
-            self.amplitude_bin = 60
-            self.axes.set_xscale("log")
-        else:
-            self.adc_bin = 128
-            self.amplitude_bin = 60
-            self.axes.set_xscale("linear")
-
-        if self.adc_mode == False:
-            self.chart = self.axes.hist(self.amplitudes, bins=self.amplitude_bin, color = self.color, histtype = self.fill, log = True)
-        else:
-            self.chart = self.axes.hist(self.adc_list, bins=self.adc_bin, color= self.color, histtype=self.fill, log= True)
-
-        self.axes.set_ylabel('Number of detections')
-        self.axes.set_xlabel(self.xlabel)
-        self.axes.set_title(self.mode + ' histogram')
-
-        self.draw()
-
-class MultipleChart(FigureCanvas):
+def report_startup(app):
     '''
-    Static chart
-    :param mode -> see class ChartWindow
-    :param CosmicWatch -> see class ChartWindow
-    :param chart_updater -> see class ChartWindow
+    Prints modules loaded until the window became interactive and quits, used by StartupBenchmark.py.
     '''
+    heavy = [name for name in ['matplotlib', 'numpy', 'h5py'] if name in sys.modules]
+    print('STARTUP READY ' + ','.join(heavy), flush=True)
+    app.quit()
 
-    # lists used as data references for chart
-    adc_list = []
-    amplitudes_list = []
-
-    def __init__(self, mode, chart_window, chart_updater) -> None:
-        FigureCanvas.__init__(self, mpl_fig.Figure())
-        self.mode = mode
-        chart_updater.connect(self.update_chart)
-        self.chart_window = chart_window
-        self.color_list = ['Blue', 'Red', 'Black', 'Violet', 'Green', 'Brown', 'Chocolate', 'Orange']
-
-        self.log = False
-        self.fill = 'step'
-        self.xlabel = 'Amplitude [mV]'
-        self.adc_mode = False
-        self.color = '#31B3E8'
-
-        self.adc_bin = 128
-        self.amplitude_bin = 60
-
-        # self.amplitudes_list.clear()
-        # self.adc_list.clear()
-        # self.amplitudes = CosmicWatch.amplitudes_list
-        # self.adc_list = CosmicWatch.adc_list
-
-        self.axes = self.figure.subplots()
-        self.figure.set_facecolor('#f7f9d4')
-        self.axes.set_facecolor('#f7f9d4')
-        #
-        # if self.adc_mode == False:
-        #     self.chart = self.axes.hist(self.amplitudes, bins=128, color = self.color, histtype = self.fill, log = True)
-        # else:
-        #     self.chart = self.axes.hist(self.adc_list, bins=128, color= self.color, histtype=self.fill, log= True)
-
-        self.draw()
-
-    def update_chart(self):
-
-        self.axes.clear()
-
-        if self.log:
-            self.adc_bin = 128
-            self.amplitude_bin = 60
-            self.axes.set_xscale("log")
-        else:
-            self.adc_bin = 128
-            self.amplitude_bin = 60
-            self.axes.set_xscale("linear")
-
-        color_index = 0
-        charts = []
-        data_pack_list = self.chart_window.data_pack_list
-        for pack in data_pack_list:
-            print('Graphing number: ' + repr(color_index))
-            print(repr(pack))
-            if self.adc_mode == False:
-                chart = self.axes.hist(pack.amplitudes_list, bins=self.amplitude_bin,
-                               color = self.chart_window.color_dict[self.color_list[color_index]],
-                               histtype = self.fill, log = True)
-            else:
-                chart = self.axes.hist(pack.adc_list, bins=self.adc_bin,
-                               color= self.chart_window.color_dict[self.color_list[color_index]],
-                               histtype=self.fill, log= True)
-            color_index += 1
-            charts.append(chart)
-
-        self.axes.set_ylabel('Number of detections')
-        self.axes.set_xlabel(self.xlabel)
-        self.axes.set_title(self.mode + ' histogram')
 
-        self.draw()
-
-class RatesChart(FigureCanvas):
+def main(argv=None):
     '''
-    Static chart
-    :param mode -> see class ChartWindow
-    :param CosmicWatch -> see class ChartWindow
-    :param chart_updater -> see class ChartWindow
+    Starts GUI.
+    :param argv: command line arguments, '--startup-time' closes the window as soon as it is shown
+    :return: exit code
     '''
+    argv = sys.argv if argv is None else argv
+    app = QApplication(argv)
+    app.setStyle('Fusion')
+    a_window = GUIControl()
 
-    # lists used as data references for chart
-    distance_list = []
-    angle_list = []
-    rate_list = []
-
-    def __init__(self, mode, chart_window, chart_updater) -> None:
-        FigureCanvas.__init__(self, mpl_fig.Figure())
-        self.mode = mode
-        chart_updater.connect(self.update_chart)
-        self.chart_window = chart_window
-
-        self.log = False
-        self.fill = 'step'
-        self.xlabel = 'Distance [cm]'
-        self.adc_mode = False
-        self.color = '#31B3E8'
-
-        self.axes = self.figure.subplots()
-        self.figure.set_facecolor('#f7f9d4')
-        self.axes.set_facecolor('#f7f9d4')
-
-        self.draw()
-
-    def update_chart(self):
-
-        self.axes.clear()
-
-        if self.log == True:
-            self.axes.set_xscale("log")
-        else:
-            self.axes.set_xscale("linear")
-
-        color_index = 0
-        charts = []
-        data_pack_list = self.chart_window.data_pack_list
-        self.distance_list = [-1]*len(data_pack_list)
-        self.rate_list = [-1]*len(data_pack_list)
-        self.angle_list = [-1]*len(data_pack_list)
-
-        i = -1
-
-        for pack in data_pack_list:
-            i+=1
-            print('Graphing number: ' + repr(color_index))
-            print(repr(pack))
-            print(len(data_pack_list))
-
-            #self.distance_list[i] = pack.distance
-            #self.angle_list[i] = pack.angle
-            #
-            try:
-                self.rate_list[i] = pack.rate
-                self.distance_list[i] = pack.distance
-                self.angle_list[i] = pack.angle
-
-                print(self.distance_list)
-                print(self.rate_list)
-
-            except Exception as PackError:
-                print(repr(PackError))
-                #TODO log the error
-
-        try:
-            distance_list, rate_dist = zip(*sorted(zip(self.distance_list, self.rate_list)))
-            angle_list, rate_angle = zip(*sorted(zip(self.angle_list, self.rate_list)))
-
-            z_dist = polyfit(self.distance_list, self.rate_list, 1)
-            trendline_dist = poly1d(z_dist)
-            z_angle = polyfit(self.angle_list, self.rate_list, 1)
-            trendline_angle = poly1d(z_angle)
-
-            # plot rates
-            if self.adc_mode == True:  # True -> distance; False -> Angle
-                #chart = self.axes.scatter(self.distance_list, self.rate_list)
-                chart = self.axes.plot(distance_list, rate_dist, 'bo', linewidth = 1, linestyle = '--')
-                print(distance_list)
-                self.axes.plot(self.distance_list, trendline_dist, 'r--')
-            else:
-                chart = self.axes.plot(angle_list, rate_angle, 'bo', linewidth = 1, linestyle = '--')
-                self.axes.plot(self.angle_list, trendline_angle, 'r--')
-            #TODO hideable trendline and lines [linewidth 0?]
-            #TODO fix trendline on >2 points not apperaing and on =2 points mirrored
-            charts.append(chart)
-
-        except Exception as DrawError:
-            print(repr(DrawError))
-            #TODO log the error
-
-        self.axes.set_ylabel('Rate [N/s]')
-        self.axes.set_xlabel(self.xlabel)
-        self.axes.set_title(self.mode + ' comparison')
-
-        self.draw()
-
-
+    if '--startup-time' in argv:
+        QTimer.singleShot(0, lambda: report_startup(app)) # first event loop iteration, window is interactive
+    else:
+        app.aboutToQuit.connect(a_window.stop_detectors) # on program exit stop detectors
+    return app.exec_()
 
-app = QApplication(sys.argv)
-app.setStyle('Fusion')
-a_window = GUIControl()
 
-app.aboutToQuit.connect(a_window.stop_detectors) # on program exit stop detectors
-sys.exit(app.exec_())
+if __name__ == '__main__': # acquisition processes import this module too
+    multiprocessing.freeze_support() # PyInstaller build
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Optional HDF5 output (requires h5py). Events are appended in chunks during measurement, one extensible dataset per
+column. File is opened in SWMR (single writer, multiple readers) mode, so analysis can read a running measurement.
+"""
+
+import importlib.util
+import time
+
+# HDF5 output is optional. h5py and NumPy are imported by import_h5py() when HDF5 file is used, they take long to load
+h5py = None
+numpy = None
+
+HDF5_SUFFIX = '.h5'
+
+# dataset name, dtype, index in data line after Comp_date and Comp_time
+COLUMNS = [
+    ('event', 'int64', 0),
+    ('ardn_time', 'int64', 1), # [ms]
+    ('adc', 'int16', 2), # [0-1023]
+    ('sipm', 'float32', 3), # [mV]
+    ('deadtime', 'int64', 4), # [ms]
+    ('temp', 'float32', 5), # [C]
+    ('rate', 'float32', 6), # [N/s]
+]
+
+
+class HDF5Error(Exception):
+    pass
+
+
+def hdf5_available():
+    return importlib.util.find_spec('h5py') is not None
+
+
+def import_h5py(message):
+    '''
+    Imports h5py and NumPy on first call.
+    :param message: text of HDF5Error raised when h5py is not installed
+    '''
+    global h5py, numpy
+    if h5py is not None:
+        return
+    try:
+        import h5py as h5py_module
+        import numpy as numpy_module
+    except ImportError:
+        raise HDF5Error(message)
+    h5py = h5py_module
+    numpy = numpy_module
+
+
+class HDF5EventWriter():
+    '''
+    Appends events to HDF5 file. Datasets: 'time' (UTC seconds since 1970, float64) and one per COLUMNS entry.
+    path: full path to .h5 file
+    header: list of header lines, saved as 'header' attribute
+    metadata: dict saved as attributes, e.g. distance, angle, device_id, mode, start_time
+    chunk_events: events buffered before they are written, also HDF5 chunk size
+    chunk_seconds: buffered events are written after this many seconds, so readers see live data
+    '''
+
+    chunk_events = 1024
+    chunk_seconds = 5
+
+    def __init__(self, path, header, metadata):
+        import_h5py('h5py is not installed, HDF5 output is not available.')
+        self.path = path
+        self.file = h5py.File(path, 'w', libver='latest')
+        self.file.attrs['header'] = ''.join(header)
+        for key, value in metadata.items():
+            self.file.attrs[key] = value
+        self.datasets = {'time': self.file.create_dataset('time', shape=(0,), maxshape=(None,), dtype='float64',
+                                                          chunks=(self.chunk_events,), compression='gzip')}
+        for name, dtype, index in COLUMNS:
+            self.datasets[name] = self.file.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype,
+                                                           chunks=(self.chunk_events,), compression='gzip')
+        self.file.swmr_mode = True # from now on readers can open the file
+        self.buffer = {name: [] for name in self.datasets}
+        self.chunk_started = time.monotonic()
+
+    def append(self, event_time, values):
+        '''
+        :param event_time: UTC seconds since 1970
+        :param values: list of strings of data line without date and time, e.g. ['1', '3359', '92', '21.32', ...]
+        '''
+        self.buffer['time'].append(event_time)
+        for name, dtype, index in COLUMNS:
+            self.buffer[name].append(float(values[index]) if index < len(values) else numpy.nan)
+        if len(self.buffer['time']) >= self.chunk_events or \
+                time.monotonic() - self.chunk_started > self.chunk_seconds:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes buffered events at the end of datasets.
+        '''
+        count = len(self.buffer['time'])
+        if count > 0:
+            for name, dataset in self.datasets.items():
+                size = dataset.shape[0]
+                dataset.resize((size + count,))
+                dataset[size:] = numpy.array(self.buffer[name]).astype(dataset.dtype)
+                self.buffer[name] = []
+            self.file.flush()
+        self.chunk_started = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_hdf5(path, columns=None, start=0, stop=None):
+    '''
+    Reads events of HDF5 file, also of a running measurement.
+    :param path: full path to .h5 file
+    :param columns: list of dataset names, None for all
+    :param start: index of first event
+    :param stop: index after last event, None for all
+    :return: dict: dataset name -> numpy array, plus 'attrs' -> dict of file attributes
+    '''
+    import_h5py('h5py is not installed, HDF5 files cannot be read.')
+    data = {}
+    with h5py.File(path, 'r', libver='latest', swmr=True) as hdf5_file:
+        names = columns if columns is not None else list(hdf5_file.keys())
+        for name in names:
+            dataset = hdf5_file[name]
+            dataset.refresh() # see events appended since file was opened
+            data[name] = dataset[start:stop]
+        data['attrs'] = dict(hdf5_file.attrs)
+    return data
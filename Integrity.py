@@ -0,0 +1,118 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Integrity of detector data: dropped events (gaps of event number), counter resets (event number, Arduino time and
+dead time restarting after reconnect), computer time regressions, duplicated, malformed and out of range rows.
+IntegrityMonitor checks lines during acquisition in O(1), IntegrityCheck.py checks archived files with numpy. Both
+write the same compact report next to data file.
+"""
+
+import json
+import os
+
+from DataFiles import strip_data_suffix
+
+REPORT_SUFFIX = '.integrity.json' # report saved next to data file, e.g. 'example.integrity.json'
+ADC_RANGE = (0, 1023) # 10 bit ADC of Arduino
+SIPM_RANGE = (0, 3300) # [mV], SiPM voltage cannot exceed 3.3 V supply
+TEMP_RANGE = (-40, 85) # Temp[C] outside of this range is treated as corrupted line
+ARDUINO_FIELDS = 6 # Event Ardn_time[ms] ADC[0-1023] SiPM[mV] Deadtime[ms] Temp[C]
+
+# issues counted in report
+ISSUES = ['malformed_lines', 'missing_events', 'event_gaps', 'event_resets', 'arduino_time_resets',
+          'deadtime_resets', 'time_regressions', 'duplicates', 'out_of_range']
+
+
+def is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def report_path(path):
+    '''
+    :return: path of report of data file, e.g. 'example.csv.gz' -> 'example.integrity.json'
+    '''
+    return os.path.join(os.path.dirname(path), strip_data_suffix(os.path.basename(path)) + REPORT_SUFFIX)
+
+
+def load_report(path):
+    '''
+    :param path: full path of data file
+    :return: report dict, {} if file has none
+    '''
+    try:
+        with open(report_path(path), 'r') as report_file:
+            return json.load(report_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_report(path, report):
+    '''
+    Saves report of data file, counts of acquisition (see IntegrityMonitor) already in the file are kept.
+    '''
+    saved = load_report(path)
+    if 'acquisition' in saved and 'acquisition' not in report:
+        report['acquisition'] = saved['acquisition']
+    with open(report_path(path), 'w') as report_file:
+        json.dump(report, report_file)
+
+
+def summary(report):
+    '''
+    :return: one line description of issues, e.g. '3 missing_events, 1 event_gaps'; 'OK' when there are none
+    '''
+    issues = [str(report[name]) + ' ' + name for name in ISSUES if report.get(name, 0) > 0]
+    return ', '.join(issues) if len(issues) > 0 else 'OK'
+
+
+class IntegrityMonitor():
+    '''
+    Checks lines sent by Arduino during acquisition, one line in O(1).
+    '''
+
+    def __init__(self):
+        self.counts = {name: 0 for name in ISSUES}
+        self.last = None # numbers of previous valid line
+
+    def check_line(self, fields):
+        '''
+        :param fields: split line sent by Arduino
+        :return: list of issue names of the line (see ISSUES), 'malformed_lines' and 'out_of_range' lines shouldn't
+                 be saved as events
+        '''
+        if len(fields) != ARDUINO_FIELDS or all(is_number(field) for field in fields) == False:
+            self.counts['malformed_lines'] += 1
+            return ['malformed_lines']
+        event, ardn_time, adc, sipm, deadtime, temp = [float(field) for field in fields]
+        if (ADC_RANGE[0] <= adc <= ADC_RANGE[1] and SIPM_RANGE[0] <= sipm <= SIPM_RANGE[1] and
+                TEMP_RANGE[0] <= temp <= TEMP_RANGE[1]) == False:
+            self.counts['out_of_range'] += 1
+            return ['out_of_range']
+
+        issues = []
+        if self.last is not None:
+            last_event, last_ardn_time, last_deadtime = self.last
+            if event > last_event + 1:
+                issues.append('event_gaps')
+                self.counts['missing_events'] += int(event - last_event - 1)
+            elif event <= last_event:
+                issues.append('event_resets')
+            if ardn_time < last_ardn_time:
+                issues.append('arduino_time_resets')
+            if deadtime < last_deadtime:
+                issues.append('deadtime_resets')
+        for issue in issues:
+            self.counts[issue] += 1
+        self.last = (event, ardn_time, deadtime)
+        return issues
+
+    def save(self, path):
+        '''
+        Saves counts of acquisition to report of data file, archive check is added later by IntegrityCheck.py.
+        '''
+        report = load_report(path)
+        report['acquisition'] = self.counts
+        save_report(path, report)
@@ -0,0 +1,134 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Integrity check of archived data files, see Integrity.py. All columns of a file are checked at once with numpy.
+Reports are saved next to data files by this script only and reused while data file doesn't change, read_valid_data()
+uses them to skip bad rows without checking again; loaders never write into the archive.
+Usage: python IntegrityCheck.py [measurements_folder] [--force]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy
+
+from DataFiles import file_state
+from FileFormats import read_data_file
+from Integrity import load_report, save_report, summary, ADC_RANGE, SIPM_RANGE, TEMP_RANGE
+from TemperatureCalibration import find_data_files
+
+TIME_TOLERANCE = 0.5 # seconds, computer time going back less than this is jitter of line timestamps
+
+
+def out_of_range(values, limits):
+    '''
+    :return: bool array, True for values outside of limits; NaN is out of range
+    '''
+    with numpy.errstate(invalid='ignore'):
+        return ~((values >= limits[0]) & (values <= limits[1]))
+
+
+def check_data(data, skipped=0):
+    '''
+    Checks columns of one file at once.
+    :param data: dict of columns returned by FileFormats.read_data_file()
+    :param skipped: lines the reader could not parse
+    :return: report dict: rows, counts of Integrity.ISSUES, bad_rows (sorted indexes of rows to skip)
+    '''
+    rows = data['time'].size
+    report = {'rows': rows, 'malformed_lines': int(skipped)}
+
+    # rows to skip
+    ranges = out_of_range(data['adc'], ADC_RANGE) | out_of_range(data['sipm'], SIPM_RANGE) | \
+             out_of_range(data['temp'], TEMP_RANGE)
+    regressions = numpy.zeros(rows, bool)
+    regressions[1:] = data['time'][1:] < numpy.maximum.accumulate(data['time'])[:-1] - TIME_TOLERANCE
+    duplicates = numpy.zeros(rows, bool)
+    event_steps = numpy.diff(data['event']) # NaN when schema has no Event column
+    with numpy.errstate(invalid='ignore'):
+        duplicates[1:] = (event_steps == 0) & (numpy.diff(data['ardn_time']) == 0)
+
+        # counters, not skipped: rows after gap or reset are valid events
+        gaps = event_steps > 1
+        report['missing_events'] = int((event_steps[gaps] - 1).sum())
+        report['event_gaps'] = int(numpy.count_nonzero(gaps))
+        report['event_resets'] = int(numpy.count_nonzero(event_steps < 0) +
+                                     numpy.count_nonzero((event_steps == 0) & ~duplicates[1:]))
+        report['arduino_time_resets'] = int(numpy.count_nonzero(numpy.diff(data['ardn_time']) < 0))
+        report['deadtime_resets'] = int(numpy.count_nonzero(numpy.diff(data['deadtime']) < 0))
+    report['time_regressions'] = int(numpy.count_nonzero(regressions))
+    report['duplicates'] = int(numpy.count_nonzero(duplicates))
+    report['out_of_range'] = int(numpy.count_nonzero(ranges))
+    report['bad_rows'] = numpy.flatnonzero(ranges | regressions | duplicates).tolist()
+    return report
+
+
+def check_file(path, force=False, save=False):
+    '''
+    Checks data file, saved report is reused while the file doesn't change.
+    :param path: full path of data file
+    :param force: check again even if report is up to date
+    :param save: save report next to data file, only IntegrityCheck CLI writes into the archive
+    :return: info and data as returned by read_data_file() (None, None if report was up to date), report
+    '''
+    report = load_report(path)
+    if force == False and report.get('state') == file_state(path):
+        return None, None, report
+    info, data = read_data_file(path)
+    report.update(check_data(data, info['skipped']))
+    report['state'] = file_state(path)
+    report['schema'] = info['schema']
+    if save == True:
+        try:
+            save_report(path, report)
+        except OSError: # read-only archive, report is used without saving
+            pass
+    return info, data, report
+
+
+def read_valid_data(path, names=None):
+    '''
+    read_data_file() without bad rows of integrity report. Saved report is used if up to date, otherwise the file
+    is checked and report is not saved.
+    :param path: full path of data file
+    :param names: COLUMNS to read, None for all; only these are parsed if saved report is up to date, checking
+                  needs all of them
+    :return: info dict (with 'integrity' report), dict of columns
+    '''
+    info, data, report = check_file(path)
+    if data is None:
+        info, data = read_data_file(path, names)
+        if names is not None and report['rows'] != data['time'].size:
+            # line with text in a column which was not parsed, rows don't match report
+            info, data = read_data_file(path)
+    if names is not None:
+        data = {name: column for name, column in data.items() if name == 'time' or name in names}
+    if len(report['bad_rows']) > 0 and report['rows'] == data['time'].size:
+        good = numpy.ones(data['time'].size, bool)
+        good[report['bad_rows']] = False
+        data = {name: column[good] for name, column in data.items()}
+    info['integrity'] = report
+    return info, data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check integrity of archived data files.')
+    parser.add_argument('measurements', nargs='?', default='Measurements', help='folder with measurements')
+    parser.add_argument('--force', action='store_true', help='check files with up to date report again')
+    args = parser.parse_args(argv)
+
+    files = 0
+    bad_files = 0
+    for path in find_data_files(args.measurements):
+        info, data, report = check_file(path, args.force, save=True)
+        files += 1
+        if summary(report) != 'OK':
+            bad_files += 1
+            print(os.path.relpath(path, args.measurements) + ': ' + summary(report) + '; ' +
+                  str(len(report['bad_rows'])) + ' of ' + str(report['rows']) + ' rows skipped.')
+    print(str(files) + ' files checked, ' + str(bad_files) + ' with issues.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Real time, live time and dead time accounting of a detector. Pause and disconnection intervals are recorded with
+monotonic timestamps (HostClock.elapsed()) and merged with Deadtime[ms] column sent by Arduino.
+"""
+
+import datetime
+import os
+
+from DataFiles import read_lines, split_header
+
+
+class LivetimeAccount():
+    '''
+    Time accounting of one detector. Every query is O(1).
+    Dead time = paused time + disconnected time + Arduino dead time measured outside of these intervals.
+    start: time of measurement start in seconds of HostClock.elapsed()
+    intervals: list of finished intervals [kind, start, end], kind is 'pause' or 'disconnect'
+    '''
+
+    def __init__(self, start=0.0):
+        self.start = start
+        self.stop_time = None
+        self.intervals = []
+        self.open_intervals = {} # kind -> start of interval that is not finished yet
+        self.excluded = 0.0 # seconds in finished intervals, overlapping intervals counted once
+        self.excluded_since = None # start of current excluded period
+        self.arduino_deadtime = 0.0 # seconds, merged over Arduino counter resets
+        self.last_arduino = 0.0 # last Deadtime[ms] value in seconds, None after excluded period
+
+    def begin(self, kind, t):
+        if kind in self.open_intervals:
+            return
+        self.open_intervals[kind] = t
+        if self.excluded_since is None:
+            self.excluded_since = t
+
+    def end(self, kind, t):
+        if kind not in self.open_intervals:
+            return
+        self.intervals.append([kind, self.open_intervals.pop(kind), t])
+        if len(self.open_intervals) == 0:
+            self.excluded += t - self.excluded_since
+            self.excluded_since = None
+            # next Arduino dead time increment spans the excluded period, which is already counted
+            self.last_arduino = None
+
+    def pause(self, t):
+        self.begin('pause', t)
+
+    def resume(self, t):
+        self.end('pause', t)
+
+    def disconnect(self, t):
+        self.begin('disconnect', t)
+
+    def connect(self, t):
+        self.end('disconnect', t)
+
+    def finish(self, t):
+        '''
+        Closes open intervals and stops the clock of this account.
+        '''
+        for kind in list(self.open_intervals):
+            self.end(kind, t)
+        self.stop_time = t
+
+    def arduino_event(self, deadtime_ms):
+        '''
+        Adds Deadtime[ms] value of an event. Arduino value is cumulative and resets when detector restarts.
+        '''
+        value = deadtime_ms / 1000
+        if self.last_arduino is not None:
+            if value >= self.last_arduino:
+                self.arduino_deadtime += value - self.last_arduino
+            else:
+                self.arduino_deadtime += value # Arduino restarted, counter started again from 0
+        self.last_arduino = value
+
+    def arduino_events(self, deadtime_ms):
+        '''
+        arduino_event() of a batch of events.
+        :param deadtime_ms: numpy array of Deadtime[ms] values
+        '''
+        if len(deadtime_ms) == 0:
+            return
+        self.arduino_event(float(deadtime_ms[0]))
+        values = deadtime_ms / 1000
+        steps = values[1:] - values[:-1]
+        # increments, and after a reset the value counted since the restart
+        self.arduino_deadtime += float(steps[steps >= 0].sum() + values[1:][steps < 0].sum())
+        self.last_arduino = float(values[-1])
+
+    def times(self, now):
+        '''
+        :param now: current time in seconds of HostClock.elapsed(), ignored after finish()
+        :return: realtime, livetime, deadtime in seconds
+        '''
+        end = now if self.stop_time is None else self.stop_time
+        realtime = end - self.start
+        excluded = self.excluded
+        if self.excluded_since is not None:
+            excluded += end - self.excluded_since
+        deadtime = excluded + self.arduino_deadtime
+        return realtime, realtime - deadtime, deadtime
+
+    def total(self, kind):
+        '''
+        :return: seconds spent in finished intervals of given kind, 'pause' or 'disconnect'
+        '''
+        return sum(end - start for interval_kind, start, end in self.intervals if interval_kind == kind)
+
+    def summary(self, now):
+        '''
+        :return: one line description for log file
+        '''
+        realtime, livetime, deadtime = self.times(now)
+        return 'Real time: ' + '{:.3f}'.format(realtime) + ' s. Live time: ' + '{:.3f}'.format(livetime) + \
+               ' s. Dead time: ' + '{:.3f}'.format(deadtime) + ' s (paused ' + '{:.3f}'.format(self.total('pause')) + \
+               ' s, disconnected ' + '{:.3f}'.format(self.total('disconnect')) + ' s, Arduino ' + \
+               '{:.3f}'.format(self.arduino_deadtime) + ' s).'
+
+
+def parse_time(date, comp_time):
+    '''
+    Reads computer timestamp of data line, supports 'HH:MM:SS.fff', 'HH:MM:SS.ffffff' and old 'HH-MM-SS-ffffff'.
+    :param date: e.g. '2021-02-10'
+    :param comp_time: e.g. '04:17:08.348'
+    :return: UTC time in seconds since 1970
+    '''
+    comp_time = comp_time.replace('-', ':', 2).replace('-', '.')
+    clock, _, fraction = comp_time.partition('.')
+    moment = datetime.datetime.strptime(date + ' ' + clock, '%Y-%m-%d %H:%M:%S')
+    moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp() + (float('0.' + fraction) if fraction != '' else 0)
+
+
+def reconstruct_times(path):
+    '''
+    Reconstructs real, live and dead time of archived data file. Measurement start is read from file name
+    (e.g. '20210210_033024_MASTER_Detektor A.csv', UTC) or first event. Deadtime column already contains pauses,
+    its resets after reconnection are merged.
+    :param path: full path of data file
+    :return: realtime, livetime, deadtime in seconds
+    '''
+    header, data = split_header(read_lines(path))
+    start = None
+    end = None
+    deadtime = 0.0
+    segment_base = 0.0
+    last_value = 0.0
+    for line in data:
+        line_list = line.split()
+        if len(line_list) < 7 or line[0] == '#':
+            continue
+        try:
+            event_time = parse_time(line_list[0], line_list[1])
+            value = float(line_list[6]) / 1000
+        except ValueError:
+            continue
+        if start is None:
+            start = event_time
+        end = event_time
+        if value < last_value:
+            segment_base += last_value # Arduino restarted
+        last_value = value
+        deadtime = segment_base + value
+
+    name = os.path.basename(str(path))
+    try:
+        start = datetime.datetime.strptime(name[0:15], '%Y%m%d_%H%M%S').replace(
+            tzinfo=datetime.timezone.utc).timestamp()
+    except ValueError:
+        pass
+    if start is None or end is None:
+        return 0.0, 0.0, 0.0
+    realtime = end - start
+    return realtime, realtime - deadtime, deadtime
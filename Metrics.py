@@ -0,0 +1,151 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Metrics endpoint in Prometheus text format. Detectors only increase plain counters (single writer, no locks), values
+are read and formatted when the endpoint is scraped, e.g. http://localhost:9105/metrics
+"""
+
+import math
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+METRICS_PORT = 9105
+
+# name, type, help
+DETECTOR_METRICS = [
+    ('cosmicwatch_events_total', 'counter', 'Events written to data file.'),
+    ('cosmicwatch_rate', 'gauge', 'Event rate [1/s].'),
+    ('cosmicwatch_rate_relative_error', 'gauge', 'Relative statistical error of rate.'),
+    ('cosmicwatch_realtime_seconds', 'counter', 'Time since measurement start, pauses and disconnections included.'),
+    ('cosmicwatch_livetime_seconds', 'counter', 'Real time minus dead time: pauses, disconnections and Arduino dead '
+                                                'time.'),
+    ('cosmicwatch_deadtime_fraction', 'gauge', 'Dead time divided by real time.'),
+    ('cosmicwatch_read_failures', 'gauge', 'Failed reads since last successful line.'),
+    ('cosmicwatch_reconnects_total', 'counter', 'Successful reconnects.'),
+    ('cosmicwatch_last_event_age_seconds', 'gauge', 'Seconds since last event, NaN before first event.'),
+    ('cosmicwatch_writer_pending_lines', 'gauge', 'Lines buffered by file writer and not yet on disk.'),
+    ('cosmicwatch_writer_lag_seconds', 'gauge', 'Age of oldest line buffered by file writer.'),
+    ('cosmicwatch_paused', 'gauge', '1 when reading is paused.'),
+    ('cosmicwatch_alerts_total', 'counter', 'Rate, silence and spectrum change alerts.'),
+]
+
+
+def number(value):
+    '''
+    :param value: number or text shown in GUI, e.g. '0.731', '1.234%' or 'N/A'
+    :return: float, NaN if value is not a number
+    '''
+    try:
+        if isinstance(value, str) and value.endswith('%'):
+            return float(value[:-1]) / 100
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def detector_values(detector, clock):
+    '''
+    :param detector: CosmicWatch() or DetectorProcess()
+    :param clock: HostClock of measurement, None before start
+    :return: dict: metric name -> float
+    '''
+    now = clock.elapsed() if clock is not None else 0.0
+    realtime, livetime, deadtime = detector.livetime.times(now)
+    pending_lines, lag = detector.data_file.lag() if detector.data_file is not None else (0, 0.0)
+    last_event_age = clock.now() - detector.last_event_time \
+        if clock is not None and detector.last_event_time is not None else math.nan
+    return {
+        'cosmicwatch_events_total': detector.events_written,
+        'cosmicwatch_rate': number(detector.rate),
+        'cosmicwatch_rate_relative_error': number(detector.rate_error),
+        'cosmicwatch_realtime_seconds': realtime,
+        'cosmicwatch_livetime_seconds': livetime,
+        'cosmicwatch_deadtime_fraction': deadtime / realtime if realtime > 0 else 0.0,
+        'cosmicwatch_read_failures': detector.fail_counter,
+        'cosmicwatch_reconnects_total': detector.reconnects,
+        'cosmicwatch_last_event_age_seconds': last_event_age,
+        'cosmicwatch_writer_pending_lines': pending_lines,
+        'cosmicwatch_writer_lag_seconds': lag,
+        'cosmicwatch_paused': 1 if detector.paused == True else 0,
+        'cosmicwatch_alerts_total': detector.anomalies.alerts if detector.anomalies is not None else 0,
+    }
+
+
+def label_value(value):
+    '''
+    Escapes label value as Prometheus text format requires, e.g. for device ID read from detector header.
+    '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value))
+
+
+def render_metrics(detectors, clock, stream_subscribers=0):
+    '''
+    :param detectors: list of detectors
+    :param clock: HostClock of measurement or None
+    :param stream_subscribers: number of live stream viewers
+    :return: metrics page in Prometheus text format 0.0.4
+    '''
+    values = []
+    for detector in detectors:
+        labels = '{detector="' + label_value(detector.device_id) + '",mode="' + label_value(detector.mode) + \
+                 '",port="' + label_value(detector.port_name) + '"}'
+        values.append((labels, detector_values(detector, clock)))
+
+    lines = ['# HELP cosmicwatch_detectors Running detectors.', '# TYPE cosmicwatch_detectors gauge',
+             'cosmicwatch_detectors ' + str(len(detectors)),
+             '# HELP cosmicwatch_stream_subscribers Connected live stream viewers.',
+             '# TYPE cosmicwatch_stream_subscribers gauge',
+             'cosmicwatch_stream_subscribers ' + str(stream_subscribers)]
+    for name, kind, description in DETECTOR_METRICS:
+        lines.append('# HELP ' + name + ' ' + description)
+        lines.append('# TYPE ' + name + ' ' + kind)
+        for labels, detector_metrics in values:
+            lines.append(name + labels + ' ' + format_value(detector_metrics[name]))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        try:
+            body = self.server.render().encode()
+        except Exception as exc: # detector state changed while rendering, scrape again
+            self.send_error(500, repr(exc))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # scrapes are not printed to console
+
+
+class MetricsServer():
+    '''
+    HTTP server of metrics endpoint, runs in a daemon thread.
+    :param render: function without arguments returning metrics page, see render_metrics()
+    :param host: '127.0.0.1' for local scraper only, '' for LAN
+    :param port: TCP port
+    '''
+
+    def __init__(self, render, host='127.0.0.1', port=METRICS_PORT):
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.render = render
+
+    def start(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,59 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Hot-plug monitoring of serial (COM) ports. Used by GUI to refresh port list and to reconnect detectors.
+"""
+
+from threading import Thread, Event
+
+import serial.tools.list_ports
+from PyQt5.QtCore import pyqtSignal, QObject
+
+
+class PortMonitor(QObject):
+    '''
+    Polls list of serial ports in a thread and emits signal when a port appears or disappears.
+    interval: time between scans in seconds
+    ports: set of currently available port names, e.g. {'COM7', 'COM8'}
+    '''
+
+    interval = 0.5
+
+    port_added = pyqtSignal(str) # signal sent to GUI when port appears
+    port_removed = pyqtSignal(str) # signal sent to GUI when port disappears
+
+    def __init__(self):
+        super().__init__()
+        self.ports = self.scan()
+        self.stop = False
+        self.stop_event = Event()
+
+    def scan(self):
+        '''
+        :return: set of names of available serial ports
+        '''
+        return set(port.device for port in serial.tools.list_ports.comports())
+
+    def start_monitor(self):
+        '''
+        Run monitor in thread.
+        '''
+        self.monitor_thread = Thread(target=self.run, daemon=True)
+        self.monitor_thread.start()
+
+    def stop_monitor(self):
+        self.stop = True
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop:
+            self.stop_event.wait(self.interval)
+            try:
+                ports = self.scan()
+            except Exception as exc:
+                print('WARNING: Port scan failed. ' + repr(exc))
+                continue
+            for port in sorted(self.ports - ports):
+                self.port_removed.emit(port)
+            for port in sorted(ports - self.ports):
+                self.port_added.emit(port)
+            self.ports = ports
@@ -0,0 +1,332 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Headless reports of archived measurements. Binned data of runs (histograms, counts and temperature in time bins) come
+from the BatchAnalysis.py cache, so only new or changed runs are read. Figures are rendered with the matplotlib Agg
+backend without Qt in worker processes. One HTML page, and optionally one PDF, is written per measurement campaign,
+i.e. runs grouped by month, day or all together. Figures of unchanged runs are reused, PDF pages of runs are made of
+the same PNG figures.
+Usage: python Reports.py [measurements_folder] [--output folder] [--analysis folder] [--group month] [--jobs N] [--pdf]
+       [--force]
+"""
+
+import argparse
+import collections
+import datetime
+import html
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imread
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from BatchAnalysis import analyse_archive, histogram_path, file_start_time, MIP_MODEL, OUTPUT_FOLDER, TIME_BIN
+from DataFiles import strip_data_suffix
+from SpectrumFit import curve
+
+REPORT_FOLDER = 'reports' # created in measurements folder
+GROUPS = ['month', 'day', 'all'] # runs of one campaign
+BACKGROUND = '#f7f9d4' # colors of GUI charts
+COLOR = '#31B3E8'
+FIT_COLOR = '#E8663A'
+TABLE_COLUMNS = ['device_id', 'mode', 'distance', 'angle', 'events', 'realtime', 'rate', 'rate_error', 'mip_peak',
+                 'temp_mean', 'integrity']
+
+
+def campaign_name(path, group):
+    '''
+    :param group: one of GROUPS
+    :return: e.g. '2021-02' for month, '2021-02-10' for day, 'all'; 'unknown' if file name has no date
+    '''
+    if group == 'all':
+        return 'all'
+    start = file_start_time(path)
+    if start is None:
+        return 'unknown'
+    date = datetime.datetime.fromtimestamp(start, datetime.timezone.utc)
+    return date.strftime('%Y-%m') if group == 'month' else date.strftime('%Y-%m-%d')
+
+
+def new_figure(size):
+    '''
+    Figure drawn by Agg canvas, pyplot and GUI backends are not used.
+    '''
+    figure = Figure(figsize=size)
+    FigureCanvasAgg(figure)
+    figure.set_facecolor(BACKGROUND)
+    return figure
+
+
+def run_figure(row, histograms):
+    '''
+    :param row: summary row of BatchAnalysis.py
+    :param histograms: content of .npz file of run
+    :return: Figure with SiPM and ADC histograms, rate and temperature against time
+    '''
+    figure = new_figure((11, 7.5))
+    (sipm_axes, adc_axes), (rate_axes, temp_axes) = figure.subplots(2, 2)
+    for axes in [sipm_axes, adc_axes, rate_axes, temp_axes]:
+        axes.set_facecolor(BACKGROUND)
+
+    for axes, name, label in [(sipm_axes, 'sipm', 'Amplitude [mV]'), (adc_axes, 'adc', 'ADC [0-1023]')]:
+        bins = histograms[name + '_bins']
+        if histograms[name].sum() > 0:
+            axes.hist(bins[:-1], bins, weights=histograms[name], color=COLOR, histtype='step', log=True)
+        axes.set_xlabel(label)
+        axes.set_ylabel('Number of detections')
+    parameters = histograms.get('mip_parameters')
+    if parameters is not None and numpy.isfinite(parameters).all():
+        bins = histograms['sipm_bins']
+        x = numpy.linspace(bins[0], bins[-1], 1001)
+        sipm_axes.plot(x, curve(MIP_MODEL, parameters[None, :], x, bins[1] - bins[0]), color=FIT_COLOR,
+                       label='MIP peak ' + '{:.1f}'.format(row['mip_peak']) + ' +/- ' +
+                             '{:.1f}'.format(row['mip_peak_error']) + ' mV')
+        sipm_axes.set_ylim(bottom=0.5)
+        sipm_axes.legend()
+
+    edges = histograms['time_edges']
+    if edges.size > 1:
+        hours = (edges - edges[0]) / 3600
+        centers = (hours[1:] + hours[:-1]) / 2
+        counts = histograms['time_counts']
+        widths = numpy.diff(edges) # last bin ends at last event
+        rate_axes.errorbar(centers, counts / widths, yerr=numpy.sqrt(counts) / widths, fmt='.', color=COLOR)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            temperatures = histograms['temp_sums'] / histograms['temp_counts']
+        temp_axes.plot(centers, temperatures, '.-', color=COLOR)
+    rate_axes.set_xlabel('Time since first event [h]')
+    rate_axes.set_ylabel('Rate [1/s] in ' + str(TIME_BIN // 60) + ' min bins')
+    temp_axes.set_xlabel('Time since first event [h]')
+    temp_axes.set_ylabel('Temperature [C]')
+
+    figure.suptitle(str(row['device_id']) + ' ' + str(row['mode']) + ': ' + os.path.basename(row['file']) + ', ' +
+                    str(row['events']) + ' events, rate ' + '{:.4f}'.format(row['rate']) + ' +/- ' +
+                    '{:.4f}'.format(row['rate_error']) + ' 1/s')
+    figure.tight_layout()
+    return figure
+
+
+def campaign_figure(campaign, rows):
+    '''
+    :return: Figure with rate, MIP peak and temperature of all runs of campaign against run start, one series per
+             detector
+    '''
+    figure = new_figure((11, 10))
+    rate_axes, peak_axes, temp_axes = figure.subplots(3, 1, sharex=True)
+    series = collections.defaultdict(list)
+    for row in rows:
+        start = file_start_time(row['file'])
+        if start is not None:
+            series[str(row['device_id']) + ' ' + str(row['mode'])].append((start, row))
+    for label, points in sorted(series.items()):
+        points.sort(key=lambda point: point[0])
+        dates = [datetime.datetime.fromtimestamp(start, datetime.timezone.utc) for start, row in points]
+        rate_axes.errorbar(dates, [row['rate'] for start, row in points],
+                           yerr=[row['rate_error'] for start, row in points], fmt='o', label=label)
+        peak_axes.errorbar(dates, [row.get('mip_peak', numpy.nan) for start, row in points],
+                           yerr=[row.get('mip_peak_error', numpy.nan) for start, row in points], fmt='o', label=label)
+        temp_axes.errorbar(dates, [row['temp_mean'] for start, row in points],
+                           yerr=[row['temp_std'] for start, row in points], fmt='o', label=label)
+    for axes in [rate_axes, peak_axes, temp_axes]:
+        axes.set_facecolor(BACKGROUND)
+        if len(series) > 0:
+            axes.legend()
+    rate_axes.set_ylabel('Rate [1/s]')
+    peak_axes.set_ylabel('MIP peak [mV]')
+    temp_axes.set_ylabel('Temperature [C]')
+    temp_axes.set_xlabel('Run start (UTC)')
+    figure.autofmt_xdate()
+    figure.suptitle('Campaign ' + campaign + ': ' + str(len(rows)) + ' runs')
+    return figure
+
+
+def load_histograms(npz_path):
+    with numpy.load(npz_path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def render_run(job):
+    '''
+    Worker: saves figure of one run as PNG.
+    :param job: (row, .npz path, .png path)
+    :return: .png path, error message ('' on success)
+    '''
+    row, npz_path, png_path = job
+    try:
+        os.makedirs(os.path.dirname(png_path), exist_ok=True)
+        run_figure(row, load_histograms(npz_path)).savefig(png_path, dpi=80, facecolor=BACKGROUND)
+    except Exception as exc:
+        return png_path, repr(exc)
+    return png_path, ''
+
+
+def image_figure(png_path):
+    '''
+    :return: Figure showing already rendered PNG over the whole page
+    '''
+    image = imread(png_path)
+    figure = new_figure((image.shape[1] / 80, image.shape[0] / 80)) # run figures are saved with dpi=80
+    axes = figure.add_axes([0, 0, 1, 1])
+    axes.imshow(image)
+    axes.set_axis_off()
+    return figure
+
+
+def render_campaign(job):
+    '''
+    Worker: saves overview figure of campaign as PNG and, if pdf_path is given, PDF with overview and all runs.
+    Run pages are the PNG figures of render_run(), runs are not drawn again.
+    :param job: (campaign, rows, run .png paths, .png path, .pdf path or None)
+    :return: campaign, error message ('' on success)
+    '''
+    campaign, rows, run_png_paths, png_path, pdf_path = job
+    try:
+        overview = campaign_figure(campaign, rows)
+        overview.savefig(png_path, dpi=80, facecolor=BACKGROUND)
+        if pdf_path is not None:
+            with PdfPages(pdf_path) as pdf:
+                pdf.savefig(overview, facecolor=BACKGROUND)
+                for run_png_path in run_png_paths:
+                    if os.path.exists(run_png_path): # failed figure is reported by render_run()
+                        pdf.savefig(image_figure(run_png_path), facecolor=BACKGROUND)
+    except Exception as exc:
+        return campaign, repr(exc)
+    return campaign, ''
+
+
+def format_cell(row, name):
+    value = row[name]
+    if name == 'realtime':
+        return str(datetime.timedelta(seconds=int(value)))
+    if isinstance(value, float):
+        return '{:.4g}'.format(value)
+    return str(value)
+
+
+def write_html(path, campaign, rows, png_paths, overview_path, pdf_path, measurements):
+    '''
+    Campaign page: overview figure, table of runs and figure of every run. Images are linked relative to page.
+    '''
+    folder = os.path.dirname(path)
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>Campaign ' + html.escape(campaign) +
+             '</title></head>', '<body style="background-color:' + BACKGROUND + '; font-family:sans-serif">',
+             '<h1>Campaign ' + html.escape(campaign) + '</h1>',
+             '<p>' + str(len(rows)) + ' runs. Generated ' +
+             datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S') + ' UTC.</p>']
+    if pdf_path is not None:
+        lines.append('<p><a href="' + html.escape(os.path.relpath(pdf_path, folder)) + '">PDF</a></p>')
+    lines.append('<img src="' + html.escape(os.path.relpath(overview_path, folder)) + '">')
+    lines.append('<table border="1" cellspacing="0" cellpadding="3"><tr><th>file</th>' +
+                 ''.join('<th>' + name + '</th>' for name in TABLE_COLUMNS) + '</tr>')
+    for row in rows:
+        relative = os.path.relpath(row['file'], measurements)
+        lines.append('<tr><td><a href="#' + html.escape(relative) + '">' + html.escape(relative) + '</a></td>' +
+                     ''.join('<td>' + html.escape(format_cell(row, name)) + '</td>' for name in TABLE_COLUMNS) +
+                     '</tr>')
+    lines.append('</table>')
+    for row, png_path in zip(rows, png_paths):
+        relative = os.path.relpath(row['file'], measurements)
+        lines.append('<h2 id="' + html.escape(relative) + '">' + html.escape(relative) + '</h2>')
+        lines.append('<img src="' + html.escape(os.path.relpath(png_path, folder)) + '">')
+    lines.append('</body></html>')
+    with open(path, 'w', encoding='utf-8') as html_file:
+        html_file.write('\n'.join(lines) + '\n')
+
+
+def write_index(output, campaigns):
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>Reports</title></head>',
+             '<body style="background-color:' + BACKGROUND + '; font-family:sans-serif">', '<h1>Campaigns</h1>',
+             '<ul>']
+    for campaign, rows in sorted(campaigns.items()):
+        lines.append('<li><a href="' + html.escape(campaign) + '.html">' + html.escape(campaign) + '</a>: ' +
+                     str(len(rows)) + ' runs</li>')
+    lines.append('</ul></body></html>')
+    with open(os.path.join(output, 'index.html'), 'w', encoding='utf-8') as html_file:
+        html_file.write('\n'.join(lines) + '\n')
+
+
+def figure_path(output, measurements, path):
+    '''
+    :return: path of PNG of data file, sub-folders of measurements folder are kept
+    '''
+    relative = os.path.relpath(path, measurements)
+    return os.path.join(output, 'figures', os.path.dirname(relative),
+                        strip_data_suffix(os.path.basename(relative)) + '.png')
+
+
+def is_up_to_date(png_path, npz_path):
+    return os.path.exists(png_path) and os.path.getmtime(png_path) >= os.path.getmtime(npz_path)
+
+
+def generate_reports(measurements, output=None, group='month', jobs=None, pdf=False, force=False, analysis=None):
+    '''
+    Analyses new and changed runs (see BatchAnalysis.py), renders figures in parallel and writes campaign pages.
+    :param output: report folder, default measurements/reports
+    :param analysis: output folder of BatchAnalysis.py, default measurements/analysis, or output/analysis if output
+                     is given, so nothing is written into measurements folder then
+    :param group: one of GROUPS
+    :param jobs: number of worker processes, default number of CPUs
+    :param pdf: write PDF of every campaign too
+    :param force: analyse runs and render figures again
+    :return: dict: campaign -> summary rows, number of rendered run figures
+    '''
+    if analysis is None:
+        analysis = os.path.join(output or measurements, OUTPUT_FOLDER)
+    output = output or os.path.join(measurements, REPORT_FOLDER)
+    os.makedirs(output, exist_ok=True)
+    rows, analysed, failed = analyse_archive(measurements, analysis, jobs, force)
+
+    campaigns = collections.defaultdict(list)
+    for row in rows:
+        campaigns[campaign_name(row['file'], group)].append(row)
+    npz_paths = {row['file']: histogram_path(analysis, measurements, row['file']) for row in rows}
+    png_paths = {row['file']: figure_path(output, measurements, row['file']) for row in rows}
+
+    run_jobs = [(row, npz_paths[row['file']], png_paths[row['file']]) for row in rows
+                if force == True or is_up_to_date(png_paths[row['file']], npz_paths[row['file']]) == False]
+    campaign_jobs = [(campaign, campaign_rows, [png_paths[row['file']] for row in campaign_rows],
+                      os.path.join(output, campaign + '_overview.png'),
+                      os.path.join(output, campaign + '.pdf') if pdf == True else None)
+                     for campaign, campaign_rows in campaigns.items()]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for png_path, error in executor.map(render_run, run_jobs, chunksize=4):
+            if error != '':
+                print('Figure ' + png_path + ' failed: ' + error)
+        # PDF pages of runs are read from PNG figures, so campaigns are rendered after runs
+        for campaign, error in executor.map(render_campaign, campaign_jobs):
+            if error != '':
+                print('Campaign ' + campaign + ' figures failed: ' + error)
+
+    for campaign, campaign_rows, campaign_png, overview_path, pdf_path in campaign_jobs:
+        write_html(os.path.join(output, campaign + '.html'), campaign, campaign_rows,
+                   [png_paths[row['file']] for row in campaign_rows], overview_path, pdf_path, measurements)
+    write_index(output, campaigns)
+    return campaigns, len(run_jobs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write HTML/PDF reports of archived measurements without GUI.')
+    parser.add_argument('measurements', nargs='?', default='Measurements', help='folder with measurements')
+    parser.add_argument('--output', default=None, help='default: <measurements>/' + REPORT_FOLDER)
+    parser.add_argument('--analysis', default=None, help='output folder of BatchAnalysis.py, default: <measurements>/' +
+                                                         OUTPUT_FOLDER + ', or <output>/' + OUTPUT_FOLDER +
+                                                         ' with --output')
+    parser.add_argument('--group', choices=GROUPS, default='month', help='runs of one campaign report')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, default: number of CPUs')
+    parser.add_argument('--pdf', action='store_true', help='write PDF of every campaign too')
+    parser.add_argument('--force', action='store_true', help='analyse runs and render figures again')
+    args = parser.parse_args(argv)
+
+    campaigns, rendered = generate_reports(args.measurements, args.output, args.group, args.jobs, args.pdf,
+                                           args.force, args.analysis)
+    runs = sum(len(rows) for rows in campaigns.values())
+    print(str(len(campaigns)) + ' campaigns, ' + str(runs) + ' runs, ' + str(rendered) + ' run figures rendered, ' +
+          str(runs - rendered) + ' reused.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
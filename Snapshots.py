@@ -0,0 +1,41 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Versioned snapshots of event lists of a detector. The reading thread (or poll() of DetectorProcess) only appends to
+the lists and publishes the number of complete events as detector.version after all lists were appended. A snapshot
+reads the version first, so the first version values of every list are complete and never change. Taking a snapshot
+costs O(1) without locks, and charts and the table compare versions to skip work when no event came.
+"""
+
+# event lists of detector, column() takes one of them
+EVENT_LISTS = ['amplitudes_list', 'adc_list', 'temp_list', 'time_list']
+
+
+def published_version(detector):
+    '''
+    :param detector: CosmicWatch(), DetectorProcess() or FakeCosmicWatch()
+    :return: number of complete events; lists of FakeCosmicWatch don't change, so their shortest length is used
+    '''
+    version = getattr(detector, 'version', None)
+    if version is not None:
+        return version
+    return min([len(getattr(detector, name)) for name in EVENT_LISTS if hasattr(detector, name)] or [0])
+
+
+class EventSnapshot():
+    '''
+    Consistent view of the first version events of a detector.
+    :param detector: see published_version()
+    '''
+
+    def __init__(self, detector):
+        self.version = published_version(detector) # read before the lists, later appends are beyond it
+        self.device_id = detector.device_id
+        self.lists = {name: getattr(detector, name) for name in EVENT_LISTS if hasattr(detector, name)}
+
+    def column(self, name, start=0):
+        '''
+        :param name: one of EVENT_LISTS
+        :param start: index of first event, e.g. number of events already used by the caller
+        :return: values of events start..version-1, new list or numpy view of EventBuffer (AcquisitionProcess.py)
+        '''
+        return self.lists[name][start:self.version]
@@ -0,0 +1,278 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Fit of MIP peak of binned SiPM amplitude spectra, e.g. to follow detector gain over months. Models: Landau (Moyal
+approximation) convolved with Gauss by Gauss-Hermite quadrature, or Gauss peak, both on exponential background of
+noise near threshold. Poisson likelihood is minimised by Levenberg-Marquardt for all spectra at once, parameters,
+Jacobians and normal equations are arrays with one row per spectrum. Fits of archive are split between processes.
+Usage: python SpectrumFit.py [measurements_folder] [--model landau_gauss] [--jobs N] - fits spectra cached by
+BatchAnalysis.py and prints peak of every run
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+FIT_RANGE = (20, 400) # [mV], lower bins are cut by threshold
+AMPLITUDE_BINS = numpy.linspace(0, 1000, 201) # [mV], same as SIPM_BINS of BatchAnalysis.py
+HERMITE_NODES, HERMITE_WEIGHTS = numpy.polynomial.hermite.hermgauss(32)
+SIGMA_RATIO = 3 # Gauss sigma is smoothly limited to SIGMA_RATIO * eta, wider Gauss shows quadrature nodes as bumps
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-6 # relative change of likelihood at which fit is converged
+CHUNK = 256 # spectra per process
+MIN_EVENTS = 100 # in fit range, fewer events are not fitted
+STARTS = (0.6, 0.9, 1.2) # peak positions of fit starts, times mean amplitude in fit range
+PEAK_BINS = 2 # bin widths, least FWHM of a valid peak and its least distance from ends of fit range
+
+# model -> names of parameters; amplitudes and widths are fitted as logarithms, so they stay positive
+PARAMETERS = {
+    'landau_gauss': ['log_peak_counts', 'mpv', 'log_eta', 'log_sigma', 'log_background', 'log_slope'],
+    'gauss_exp': ['log_peak_counts', 'mean', 'log_sigma', 'log_background', 'log_slope'],
+}
+RESULTS = ['peak', 'peak_error', 'fwhm', 'chi2_ndf', 'converged', 'valid'] # besides PARAMETERS
+
+
+def moyal(z):
+    '''
+    Moyal density, approximation of Landau density with mode at z = 0.
+    '''
+    with numpy.errstate(over='ignore'):
+        return numpy.exp(-(z + numpy.exp(-z)) / 2) / numpy.sqrt(2 * numpy.pi)
+
+
+def peak_density(model, parameters, x):
+    '''
+    :param parameters: array (spectra, len(PARAMETERS[model]))
+    :param x: array of amplitudes [mV]
+    :return: array (spectra, x.size), events per mV of peak without background
+    '''
+    p = parameters[:, :, None]
+    if model == 'landau_gauss':
+        counts, mpv, eta, sigma = numpy.exp(p[:, 0]), p[:, 1], numpy.exp(p[:, 2]), numpy.exp(p[:, 3])
+        sigma = sigma * SIGMA_RATIO * eta / numpy.hypot(sigma, SIGMA_RATIO * eta)
+        # Landau(x - s) averaged over s ~ Gauss(0, sigma)
+        shifts = numpy.sqrt(2) * sigma[..., None] * HERMITE_NODES
+        z = (x[None, :, None] - mpv[..., None] - shifts) / eta[..., None]
+        return counts / eta * (moyal(z) * HERMITE_WEIGHTS).sum(axis=2) / numpy.sqrt(numpy.pi)
+    counts, mean, sigma = numpy.exp(p[:, 0]), p[:, 1], numpy.exp(p[:, 2])
+    return counts * numpy.exp(-(x - mean)**2 / (2 * sigma**2)) / (numpy.sqrt(2 * numpy.pi) * sigma)
+
+
+def density(model, parameters, x):
+    '''
+    :return: array (spectra, x.size), events per mV of peak and background
+    '''
+    p = parameters[:, -2:, None]
+    background = numpy.exp(p[:, 0]) * numpy.exp(-numpy.exp(p[:, 1]) * (x - FIT_RANGE[0]))
+    return peak_density(model, parameters, x) + background
+
+
+def poisson_nll(counts, expected):
+    return (expected - counts * numpy.log(expected)).sum(axis=1)
+
+
+def initial_parameters(model, x, widths, counts, start):
+    '''
+    Start of fit from moments of spectra: half of events in peak at start * mean amplitude.
+    '''
+    total = counts.sum(axis=1) + 1
+    mean = (counts * x).sum(axis=1) / total
+    spread = numpy.sqrt(numpy.maximum((counts * (x - mean[:, None])**2).sum(axis=1) / total, widths[0]**2))
+    first = numpy.maximum(counts[:, 0], 1) / widths[0]
+    background = [numpy.log(first / 2), numpy.log(1 / spread)]
+    if model == 'landau_gauss':
+        columns = [numpy.log(total / 2), mean * start, numpy.log(spread / 4), numpy.log(spread / 4)] + background
+    else:
+        columns = [numpy.log(total / 2), mean * start, numpy.log(spread / 2)] + background
+    return numpy.column_stack(columns)
+
+
+def jacobian(expected, parameters, mu):
+    '''
+    Forward differences, one model evaluation per parameter for all spectra.
+    :return: array (spectra, bins, parameters)
+    '''
+    result = numpy.empty(mu.shape + (parameters.shape[1],))
+    for i in range(parameters.shape[1]):
+        step = 1e-6 * (1 + numpy.abs(parameters[:, i]))
+        shifted = parameters.copy()
+        shifted[:, i] += step
+        result[:, :, i] = (expected(shifted) - mu) / step[:, None]
+    return result
+
+
+def minimise(expected, counts, parameters):
+    '''
+    Levenberg-Marquardt minimisation of Poisson likelihood, every spectrum has its own damping and stops on its own.
+    :param expected: function: parameters (spectra, P) -> expected counts (spectra, bins)
+    :return: parameters, negative log-likelihood, converged (arrays with row per spectrum)
+    '''
+    parameters = parameters.copy()
+    spectra, size = parameters.shape
+    nll = poisson_nll(counts, expected(parameters))
+    damping = numpy.full(spectra, 1e-3)
+    active = counts.sum(axis=1) >= MIN_EVENTS # spectra still fitted
+    converged = numpy.zeros(spectra, bool)
+    eye = numpy.eye(size)
+    for iteration in range(MAX_ITERATIONS):
+        if active.any() == False:
+            break
+        indexes = numpy.flatnonzero(active)
+        p = parameters[indexes]
+        n = counts[indexes]
+        mu = expected(p)
+        derivatives = jacobian(expected, p, mu)
+        gradient = numpy.einsum('sb,sbp->sp', 1 - n / mu, derivatives)
+        fisher = numpy.einsum('sb,sbp,sbq->spq', 1 / mu, derivatives, derivatives)
+        damped = fisher + damping[indexes, None, None] * fisher * eye + 1e-9 * eye
+        trial = p - numpy.linalg.solve(damped, gradient[:, :, None])[:, :, 0]
+        with numpy.errstate(invalid='ignore'):
+            trial_nll = poisson_nll(n, expected(trial))
+        better = numpy.isfinite(trial_nll) & (trial_nll < nll[indexes])
+
+        done = better & (nll[indexes] - trial_nll < TOLERANCE * numpy.abs(nll[indexes]) + 1e-9)
+        parameters[indexes[better]] = trial[better]
+        nll[indexes[better]] = trial_nll[better]
+        damping[indexes[better]] /= 10
+        damping[indexes[~better]] *= 10
+        converged[indexes[done]] = True
+        active[indexes[done | (damping[indexes] > 1e10)]] = False
+    return parameters, nll, converged
+
+
+def fit_spectra(counts, edges, model='landau_gauss', fit_range=FIT_RANGE):
+    '''
+    Fits all spectra at once, from every start of STARTS the best fit is kept.
+    :param counts: array (spectra, bins) or (bins,) of histogram counts
+    :param edges: bin edges [mV], common for all spectra
+    :param model: one of PARAMETERS
+    :return: dict: PARAMETERS[model] and RESULTS -> arrays with value of every spectrum, NaN if spectrum has less
+             than MIN_EVENTS; peak [mV] is mode of peak density, fwhm its full width at half maximum; valid is False
+             if fit did not converge or found no peak: peak within PEAK_BINS of end of fit range, fwhm narrower than
+             PEAK_BINS (noise slope fitted as peak) or peak_error not smaller than fwhm
+    '''
+    counts = numpy.atleast_2d(numpy.asarray(counts, dtype=float))
+    edges = numpy.asarray(edges, dtype=float)
+    inside = (edges[:-1] >= fit_range[0]) & (edges[1:] <= fit_range[1])
+    x = ((edges[1:] + edges[:-1]) / 2)[inside]
+    widths = numpy.diff(edges)[inside]
+    counts = counts[:, inside]
+    names = PARAMETERS[model]
+    spectra = counts.shape[0]
+
+    def expected(parameters):
+        # trial steps may overflow, such steps are rejected by their likelihood
+        with numpy.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            return numpy.maximum(density(model, parameters, x) * widths, 1e-12)
+
+    # all starts are fitted together as more spectra
+    starts = numpy.concatenate([initial_parameters(model, x, widths, counts, start) for start in STARTS])
+    fitted, nll, converged = minimise(expected, numpy.tile(counts, (len(STARTS), 1)), starts)
+    best = numpy.argmin(numpy.where(numpy.isfinite(nll), nll, numpy.inf).reshape(len(STARTS), spectra), axis=0)
+    chosen = best * spectra + numpy.arange(spectra)
+    parameters = fitted[chosen]
+
+    results = {name: parameters[:, i] for i, name in enumerate(names)}
+    results.update(peak_properties(model, parameters, counts, expected, fit_range))
+    results['converged'] = converged[chosen]
+    few = counts.sum(axis=1) < MIN_EVENTS
+    for name in names + ['peak', 'peak_error', 'fwhm', 'chi2_ndf']:
+        results[name] = numpy.where(few, numpy.nan, results[name])
+    margin = PEAK_BINS * widths.max()
+    with numpy.errstate(invalid='ignore'):
+        results['valid'] = results['converged'] & (results['peak'] >= fit_range[0] + margin) & \
+                           (results['peak'] <= fit_range[1] - margin) & (results['fwhm'] >= margin) & \
+                           (results['peak_error'] < results['fwhm'])
+    return results
+
+
+def peak_properties(model, parameters, counts, expected, fit_range):
+    '''
+    :return: dict: peak, peak_error (from inverse Fisher matrix of peak position parameter), fwhm, chi2_ndf
+             (Poisson deviance per degree of freedom)
+    '''
+    grid = numpy.linspace(fit_range[0], fit_range[1], 4 * int(fit_range[1] - fit_range[0]) + 1)
+    peak = peak_density(model, parameters, grid)
+    top = peak.max(axis=1)
+    above = peak >= top[:, None] / 2
+    first = numpy.argmax(above, axis=1)
+    last = above.shape[1] - 1 - numpy.argmax(above[:, ::-1], axis=1)
+    fwhm = numpy.where(above.any(axis=1), grid[last] - grid[first], numpy.nan)
+
+    mu = expected(parameters)
+    derivatives = jacobian(expected, parameters, mu)
+    fisher = numpy.einsum('sb,sbp,sbq->spq', 1 / mu, derivatives, derivatives) + \
+             1e-9 * numpy.eye(parameters.shape[1])
+    with numpy.errstate(invalid='ignore'):
+        peak_error = numpy.sqrt(numpy.linalg.inv(fisher)[:, 1, 1])
+        deviance = 2 * (mu - counts + numpy.where(counts > 0, counts * numpy.log(numpy.maximum(counts, 1) / mu),
+                                                   0)).sum(axis=1)
+    return {'peak': grid[numpy.argmax(peak, axis=1)], 'peak_error': peak_error, 'fwhm': fwhm,
+            'chi2_ndf': deviance / max(counts.shape[1] - parameters.shape[1], 1)}
+
+
+def fit_amplitudes(amplitudes, model='landau_gauss'):
+    '''
+    Fits one list of SiPM amplitudes, e.g. of a chart.
+    :return: dict: name -> value, see fit_spectra(); parameters array for curve()
+    '''
+    counts = numpy.histogram(numpy.asarray(amplitudes, dtype=float), AMPLITUDE_BINS)[0]
+    results = fit_spectra(counts, AMPLITUDE_BINS, model)
+    parameters = numpy.array([[results[name][0] for name in PARAMETERS[model]]])
+    return {name: results[name][0] for name in results}, parameters
+
+
+def curve(model, parameters, x, bin_width):
+    '''
+    :return: fitted counts per bin of bin_width [mV] at x, to draw over a histogram
+    '''
+    return density(model, parameters, numpy.asarray(x, dtype=float))[0] * bin_width
+
+
+def fit_chunk(job):
+    '''
+    Worker: fits spectra of a chunk of runs.
+    :param job: (list of .npz paths, model)
+    :return: list of paths, results dict
+    '''
+    paths, model = job
+    counts = []
+    for path in paths:
+        with numpy.load(path) as npz:
+            counts.append(npz['sipm'])
+            edges = npz['sipm_bins']
+    return paths, fit_spectra(numpy.array(counts), edges, model)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit MIP peak of SiPM spectra of analysed runs.')
+    parser.add_argument('measurements', nargs='?', default='Measurements', help='folder with measurements')
+    parser.add_argument('--analysis', default=None, help='output folder of BatchAnalysis.py, default: '
+                                                         '<measurements>/analysis')
+    parser.add_argument('--model', choices=sorted(PARAMETERS), default='landau_gauss')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, default: number of CPUs')
+    args = parser.parse_args(argv)
+
+    analysis = args.analysis or os.path.join(args.measurements, 'analysis')
+    paths = sorted(os.path.join(folder, name) for folder, subfolders, files in os.walk(analysis)
+                   for name in files if name.endswith('.npz'))
+    jobs = [(paths[start:start + CHUNK], args.model) for start in range(0, len(paths), CHUNK)]
+    fitted = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for chunk_paths, results in executor.map(fit_chunk, jobs):
+            for i, path in enumerate(chunk_paths):
+                if results['valid'][i] == False:
+                    continue
+                fitted += 1
+                print(os.path.relpath(path, analysis) + ': peak ' + '{:.1f}'.format(results['peak'][i]) + ' +/- ' +
+                      '{:.1f}'.format(results['peak_error'][i]) + ' mV, FWHM ' +
+                      '{:.1f}'.format(results['fwhm'][i]) + ' mV, chi2/ndf ' +
+                      '{:.2f}'.format(results['chi2_ndf'][i]))
+    print(str(fitted) + ' of ' + str(len(paths)) + ' spectra fitted.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
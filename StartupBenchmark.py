@@ -0,0 +1,54 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Cold start benchmark of GUI. Starts GUI several times with --startup-time and measures time from process start
+until the window is interactive. Also works with PyInstaller build: --command dist\\GUI\\GUI.exe
+Usage: python StartupBenchmark.py [--runs 5] [--command "python GUI.py"]
+"""
+
+import argparse
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+
+def measure(command):
+    '''
+    :param command: list, command starting GUI
+    :return: seconds until GUI reported it is ready, list of heavy modules loaded by then
+    '''
+    start = time.perf_counter()
+    process = subprocess.Popen(command + ['--startup-time'], stdout=subprocess.PIPE, universal_newlines=True)
+    modules = None
+    for line in process.stdout:
+        if line.startswith('STARTUP READY'):
+            modules = line.split()[2:]
+            break
+    elapsed = time.perf_counter() - start
+    process.stdout.close()
+    process.wait()
+    if modules is None:
+        raise RuntimeError('GUI exited without reporting startup, exit code ' + str(process.returncode))
+    return elapsed, modules[0].split(',') if len(modules) > 0 else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure GUI cold start time.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--command', default=None, help='default: current python with GUI.py')
+    args = parser.parse_args(argv)
+
+    command = shlex.split(args.command) if args.command else [sys.executable, 'GUI.py']
+    times = []
+    for run in range(args.runs):
+        elapsed, modules = measure(command)
+        times.append(elapsed)
+        print('Run ' + str(run + 1) + ': ' + '{:.3f}'.format(elapsed) + ' s, loaded: ' + (', '.join(modules) or '-'))
+    print('Startup min ' + '{:.3f}'.format(min(times)) + ' s, median ' + '{:.3f}'.format(statistics.median(times)) +
+          ' s over ' + str(args.runs) + ' runs.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,352 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Constant memory statistics of detector data. Mean and variance with Welford's algorithm, quantiles with t-digest.
+Statistics are updated per event in O(1) (amortized), saved next to data file and can be merged across runs.
+"""
+
+import json
+import math
+import threading
+
+STATS_SUFFIX = '.stats.json' # statistics saved next to data file, e.g. 'example.stats.json'
+
+
+class RunningStats():
+    '''
+    Count, mean, variance, minimum and maximum of a stream of values (Welford's algorithm).
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared differences from mean
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def add_values(self, values):
+        '''
+        Adds a batch of values at once, e.g. numpy array of events read together.
+        '''
+        if len(values) == 0:
+            return
+        batch = RunningStats()
+        batch.n = len(values)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean)**2).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        self.merge(batch)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def merge(self, other):
+        '''
+        Adds statistics of other RunningStats (Chan's parallel algorithm).
+        '''
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self):
+        return {'n': self.n, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min if self.n > 0 else None, 'max': self.max if self.n > 0 else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.n = data['n']
+        stats.mean = data['mean']
+        stats.m2 = data['m2']
+        if stats.n > 0:
+            stats.min = data['min']
+            stats.max = data['max']
+        return stats
+
+
+class TDigest():
+    '''
+    Mergeable quantile sketch (merging t-digest). Values are buffered and merged into at most ~compression
+    centroids, small centroids are kept near the tails so extreme quantiles stay accurate.
+    compression: accuracy parameter, memory is O(compression)
+    Reading thread adds values while GUI thread reads quantiles, so buffer and centroids are changed under lock.
+    '''
+
+    compression = 100
+    buffer_size = 500
+
+    def __init__(self):
+        self.means = []
+        self.weights = []
+        self.buffer = []
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.lock = threading.Lock()
+
+    def add(self, x, weight=1.0):
+        with self.lock:
+            self.buffer.append((x, weight))
+            self.total += weight
+            if x < self.min:
+                self.min = x
+            if x > self.max:
+                self.max = x
+            if len(self.buffer) >= self.buffer_size:
+                self.merge_buffer()
+
+    def add_values(self, values):
+        '''
+        Adds a batch of values with weight 1, e.g. numpy array of events read together.
+        '''
+        if len(values) == 0:
+            return
+        with self.lock:
+            self.buffer += [(x, 1.0) for x in values.tolist()]
+            self.total += len(values)
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            if len(self.buffer) >= self.buffer_size:
+                self.merge_buffer()
+
+    def q_to_k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def k_to_q(self, k):
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def flush(self):
+        '''
+        Merges buffered values into centroids.
+        '''
+        with self.lock:
+            self.merge_buffer()
+
+    def merge_buffer(self):
+        '''
+        flush() without lock, caller holds it.
+        '''
+        if len(self.buffer) == 0:
+            return
+        points = sorted(list(zip(self.means, self.weights)) + self.buffer)
+        self.buffer = []
+        means = []
+        weights = []
+        so_far = 0.0
+        limit = self.k_to_q(self.q_to_k(0) + 1) * self.total
+        mean, weight = points[0]
+        for x, w in points[1:]:
+            if so_far + weight + w <= limit:
+                weight += w
+                mean += (x - mean) * w / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                so_far += weight
+                limit = self.k_to_q(self.q_to_k(min(so_far / self.total, 1.0)) + 1) * self.total
+                mean, weight = x, w
+        means.append(mean)
+        weights.append(weight)
+        self.means = means
+        self.weights = weights
+
+    def quantile(self, q):
+        '''
+        :param q: quantile in [0, 1], e.g. 0.5 for median
+        :return: estimated value, nan if digest is empty
+        '''
+        with self.lock:
+            self.merge_buffer()
+            return self.centroid_quantile(q)
+
+    def centroid_quantile(self, q):
+        '''
+        quantile() of merged centroids, caller holds lock.
+        '''
+        if self.total == 0:
+            return math.nan
+        if len(self.means) == 1:
+            return self.means[0]
+        target = q * self.total
+        cumulative = 0.0
+        previous_center = 0.0
+        previous_mean = self.min
+        for mean, weight in zip(self.means, self.weights):
+            center = cumulative + weight / 2
+            if target < center:
+                fraction = (target - previous_center) / (center - previous_center) if center > previous_center else 0
+                return previous_mean + fraction * (mean - previous_mean)
+            cumulative += weight
+            previous_center = center
+            previous_mean = mean
+        if self.total > previous_center:
+            fraction = (target - previous_center) / (self.total - previous_center)
+            return previous_mean + fraction * (self.max - previous_mean)
+        return self.max
+
+    def merge(self, other):
+        with other.lock:
+            other.merge_buffer()
+            centroids = list(zip(other.means, other.weights))
+            total, low, high = other.total, other.min, other.max
+        with self.lock:
+            self.buffer += centroids
+            self.total += total
+            self.min = min(self.min, low)
+            self.max = max(self.max, high)
+            self.merge_buffer()
+
+    def to_dict(self):
+        with self.lock:
+            self.merge_buffer()
+            return {'means': list(self.means), 'weights': list(self.weights), 'total': self.total,
+                    'min': self.min if self.total > 0 else None, 'max': self.max if self.total > 0 else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls()
+        digest.means = list(data['means'])
+        digest.weights = list(data['weights'])
+        digest.total = data['total']
+        if digest.total > 0:
+            digest.min = data['min']
+            digest.max = data['max']
+        return digest
+
+
+class DetectorStatistics():
+    '''
+    Streaming statistics of one detector.
+    quantities: name -> description, tracked with RunningStats and TDigest each
+    '''
+
+    quantities = {
+        'adc': 'ADC [0-1023]',
+        'sipm': 'SiPM [mV]',
+        'temp': 'Temp [C]',
+        'interarrival': 'Inter-arrival time [s]',
+        'deadtime': 'Dead time per event [ms]',
+    }
+
+    def __init__(self):
+        self.stats = {name: RunningStats() for name in self.quantities}
+        self.digests = {name: TDigest() for name in self.quantities}
+        self.last_time = None
+        self.last_deadtime = None
+
+    def add(self, name, value):
+        self.stats[name].add(value)
+        self.digests[name].add(value)
+
+    def add_event(self, event_time, values):
+        '''
+        :param event_time: UTC time of event in seconds since 1970
+        :param values: data line without date and time split into strings:
+                       [Event, Ardn_time[ms], ADC[0-1023], SiPM[mV], Deadtime[ms], Temp[C]]
+        '''
+        self.add('adc', float(values[2]))
+        self.add('sipm', float(values[3]))
+        self.add('temp', float(values[5]))
+        if self.last_time is not None and event_time >= self.last_time:
+            self.add('interarrival', event_time - self.last_time)
+        self.last_time = event_time
+        deadtime = float(values[4])
+        if self.last_deadtime is not None and deadtime >= self.last_deadtime: # Arduino value resets on restart
+            self.add('deadtime', deadtime - self.last_deadtime)
+        self.last_deadtime = deadtime
+
+    def add_values(self, name, values):
+        self.stats[name].add_values(values)
+        self.digests[name].add_values(values)
+
+    def add_events(self, times, columns):
+        '''
+        add_event() of a batch of events, quantities are updated with batch methods.
+        :param times: numpy array of UTC times of events
+        :param columns: dict: 'adc', 'sipm', 'deadtime', 'temp' -> numpy arrays of column values
+        '''
+        if len(times) == 0:
+            return
+        for name in ['adc', 'sipm', 'temp']:
+            self.add_values(name, columns[name])
+        for name, values, last in [('interarrival', times, self.last_time),
+                                   ('deadtime', columns['deadtime'], self.last_deadtime)]:
+            if last is not None and values[0] >= last:
+                self.add(name, float(values[0] - last))
+            steps = values[1:] - values[:-1]
+            self.add_values(name, steps[steps >= 0]) # Arduino deadtime resets on restart
+        self.last_time = float(times[-1])
+        self.last_deadtime = float(columns['deadtime'][-1])
+
+    def summary(self, name):
+        '''
+        :return: dict: n, mean, std, median, p95, min, max of given quantity
+        '''
+        stats = self.stats[name]
+        digest = self.digests[name]
+        return {'n': stats.n, 'mean': stats.mean, 'std': stats.std(), 'median': digest.quantile(0.5),
+                'p95': digest.quantile(0.95), 'min': stats.min, 'max': stats.max}
+
+    def merge(self, other):
+        for name in self.quantities:
+            self.stats[name].merge(other.stats[name])
+            self.digests[name].merge(other.digests[name])
+
+    def to_dict(self):
+        return {name: {'stats': self.stats[name].to_dict(), 'digest': self.digests[name].to_dict()}
+                for name in self.quantities}
+
+    @classmethod
+    def from_dict(cls, data):
+        statistics = cls()
+        for name in statistics.quantities:
+            if name in data:
+                statistics.stats[name] = RunningStats.from_dict(data[name]['stats'])
+                statistics.digests[name] = TDigest.from_dict(data[name]['digest'])
+        return statistics
+
+    def save(self, path):
+        with open(path, 'w') as stats_file:
+            json.dump(self.to_dict(), stats_file)
+
+
+def load_statistics(path):
+    '''
+    :param path: full path of .stats.json file
+    :return: DetectorStatistics
+    '''
+    with open(path, 'r') as stats_file:
+        return DetectorStatistics.from_dict(json.load(stats_file))
+
+
+def merge_statistics(paths):
+    '''
+    Merges saved statistics of several runs without reading their data files.
+    :param paths: list of .stats.json paths
+    :return: DetectorStatistics
+    '''
+    merged = DetectorStatistics()
+    for path in paths:
+        merged.merge(load_statistics(path))
+    return merged
@@ -0,0 +1,152 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Temperature compensation of SiPM amplitudes. SiPM gain changes with temperature, so amplitude is modelled as
+    log(SiPM[mV]) = c + slope * Temp[C]
+per detector. Fit uses all archived runs, sums needed by least squares are computed per run with numpy and
+solved for all detectors at once. Corrected amplitude: SiPM * exp(-slope * (Temp - reference_temp)).
+Usage: python TemperatureCalibration.py [measurements_folder] [--output calibration.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy
+
+from DataFiles import is_segment, MANIFEST_SUFFIX
+from FileFormats import read_data_file
+from Integrity import TEMP_RANGE
+
+CALIBRATION_FILE = 'calibration.json' # saved in measurements folder
+MIN_EVENTS = 50 # runs with fewer events are not used in fit
+
+
+def load_columns(path):
+    '''
+    Reads SiPM[mV] and Temp[C] columns of data file.
+    :param path: full path of data file
+    :return: device_id, amplitudes, temperatures (numpy arrays)
+    '''
+    info, data = read_data_file(path)
+    return info['device_id'], data['sipm'], data['temp']
+
+
+def run_sums(amplitudes, temperatures):
+    '''
+    Least squares sums of one run: n, sum t, sum t^2, sum y, sum t*y, where y = log(amplitude).
+    '''
+    valid = (amplitudes > 0) & numpy.isfinite(amplitudes) & \
+            (temperatures > TEMP_RANGE[0]) & (temperatures < TEMP_RANGE[1])
+    t = temperatures[valid]
+    y = numpy.log(amplitudes[valid])
+    return numpy.array([t.size, t.sum(), (t * t).sum(), y.sum(), (t * y).sum()])
+
+
+def fit(sums_by_detector):
+    '''
+    Solves least squares for all detectors at once.
+    :param sums_by_detector: dict: device_id -> array of run sums, shape (runs, 5)
+    :return: dict: device_id -> {'slope', 'reference_temp', 'events', 'runs'}
+    '''
+    detectors = sorted(sums_by_detector)
+    if len(detectors) == 0:
+        return {}
+    totals = numpy.array([sums_by_detector[device].sum(axis=0) for device in detectors])
+    n, st, stt, sy, sty = totals.T
+    denominator = n * stt - st * st
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        slope = numpy.where(denominator > 0, (n * sty - st * sy) / denominator, 0.0)
+        reference = numpy.where(n > 0, st / n, 0.0)
+    calibration = {}
+    for i, device in enumerate(detectors):
+        calibration[device] = {'slope': float(slope[i]), 'reference_temp': float(reference[i]),
+                               'events': int(n[i]), 'runs': int(len(sums_by_detector[device]))}
+    return calibration
+
+
+def calibrate(paths):
+    '''
+    Fits temperature coefficients of detectors found in data files.
+    :param paths: list of data file paths
+    :return: dict, see fit()
+    '''
+    sums = {}
+    for path in paths:
+        try:
+            device_id, amplitudes, temperatures = load_columns(path)
+        except Exception as exc:
+            print('Skipping ' + str(path) + ': ' + repr(exc))
+            continue
+        if amplitudes.size < MIN_EVENTS:
+            continue
+        sums.setdefault(device_id, []).append(run_sums(amplitudes, temperatures))
+    return fit({device: numpy.array(run_list) for device, run_list in sums.items()})
+
+
+def find_data_files(measurements_folder):
+    '''
+    :return: list of paths of all MASTER/SLAVE data files in measurements_folder and its sub-folders, rotated runs
+             are represented by their manifest
+    '''
+    paths = []
+    for folder, subfolders, files in os.walk(measurements_folder):
+        for file_name in sorted(files):
+            if ('_MASTER_' in file_name or '_SLAVE_' in file_name) and is_segment(file_name) == False and \
+                    file_name.endswith(('.csv', '.txt', '.gz', '.xz', MANIFEST_SUFFIX)):
+                paths.append(os.path.join(folder, file_name))
+    return paths
+
+
+def save_calibration(calibration, path):
+    with open(path, 'w') as calibration_file:
+        json.dump(calibration, calibration_file, indent=1)
+
+
+def load_calibration(path):
+    '''
+    :return: dict: device_id -> coefficients, empty if file does not exist
+    '''
+    try:
+        with open(path, 'r') as calibration_file:
+            return json.load(calibration_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def correct_amplitudes(amplitudes, temperatures, coefficients):
+    '''
+    Applies temperature correction. Events without temperature are left unchanged.
+    :param amplitudes: list or array of SiPM[mV]
+    :param temperatures: list or array of Temp[C], same length
+    :param coefficients: dict with 'slope' and 'reference_temp' or None for no correction
+    :return: numpy array of corrected amplitudes
+    '''
+    amplitudes = numpy.asarray(amplitudes, dtype=float)
+    if coefficients is None:
+        return amplitudes
+    temperatures = numpy.asarray(temperatures, dtype=float)[:amplitudes.size]
+    if temperatures.size < amplitudes.size: # live lists may be appended in between
+        amplitudes = amplitudes[:temperatures.size]
+    factor = numpy.exp(-coefficients['slope'] * (temperatures - coefficients['reference_temp']))
+    factor = numpy.where(numpy.isfinite(factor), factor, 1.0)
+    return amplitudes * factor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit SiPM amplitude vs temperature per detector.')
+    parser.add_argument('measurements', nargs='?', default='Measurements', help='folder with measurements')
+    parser.add_argument('--output', default=None, help='default: <measurements>/' + CALIBRATION_FILE)
+    args = parser.parse_args(argv)
+
+    calibration = calibrate(find_data_files(args.measurements))
+    output = args.output or os.path.join(args.measurements, CALIBRATION_FILE)
+    save_calibration(calibration, output)
+    for device, coefficients in sorted(calibration.items()):
+        print(device + ': ' + '{:.3%}'.format(coefficients['slope']) + ' per C, reference ' +
+              '{:.2f}'.format(coefficients['reference_temp']) + ' C, ' + str(coefficients['events']) + ' events.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
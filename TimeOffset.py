@@ -0,0 +1,139 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Estimates time offset and drift between MASTER and SLAVE computer timestamps of a run. Both event streams are binned
+finely and cross-correlated with FFT, O(B log B) for B bins instead of O(N*M) offset scans. The run is split into
+segments, a line fitted to peaks of segments gives offset and drift. When too few segments have a clear peak (low
+rate), their correlations are summed and drift is assumed 0. Result is saved in the run folder and used by
+Coincidence.py.
+Usage: python TimeOffset.py run_folder [run_folder ...] [--bin 0.001] [--max-lag 2] [--segment 1000]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy
+
+from Coincidence import load_events, find_run_files, OFFSET_FILE
+
+BIN_WIDTH = 0.001 # seconds
+MAX_LAG = 2.0 # seconds, largest offset searched
+SEGMENT = 1000 # seconds of data per FFT, 1 ms bins of 1000 s plus lags fill 2**20 FFT
+MIN_SIGNIFICANCE = 5 # peak height above background in standard deviations needed for a segment to be used for drift
+
+
+def segment_correlation(master_times, slave_times, start, length, bin_width, max_lag):
+    '''
+    Cross-correlation of master events in [start, start + length) with slave events for lags in [-max_lag, max_lag].
+    :return: array of 2 * lag_bins + 1 values, index lag_bins is lag 0
+    '''
+    bins = int(math.ceil(length / bin_width))
+    lag_bins = int(math.ceil(max_lag / bin_width))
+    size = 2**int(math.ceil(math.log2(bins + 2 * lag_bins)))
+
+    master = master_times[(master_times >= start) & (master_times < start + length)]
+    slave = slave_times[(slave_times >= start - max_lag) & (slave_times < start + length + max_lag)]
+    master_bins = numpy.bincount(((master - start) / bin_width).astype(int), minlength=size)[:size]
+    slave_bins = numpy.bincount(((slave - start + max_lag) / bin_width).astype(int), minlength=size)[:size]
+    correlation = numpy.fft.irfft(numpy.conj(numpy.fft.rfft(master_bins)) * numpy.fft.rfft(slave_bins), size)
+    return correlation[:2 * lag_bins + 1]
+
+
+def find_peak(correlation, bin_width, lag_bins):
+    '''
+    :return: lag of peak in seconds (parabolic interpolation between bins), significance of peak
+    '''
+    index = int(numpy.argmax(correlation))
+    shift = 0.0
+    if 0 < index < correlation.size - 1:
+        left, peak, right = correlation[index - 1:index + 2]
+        denominator = left - 2 * peak + right
+        if denominator != 0:
+            shift = 0.5 * (left - right) / denominator
+    background = numpy.median(correlation)
+    spread = correlation.std()
+    significance = (correlation[index] - background) / spread if spread > 0 else 0.0
+    return (index + shift - lag_bins) * bin_width, float(significance)
+
+
+def estimate_offset(master_times, slave_times, bin_width=BIN_WIDTH, max_lag=MAX_LAG, segment=SEGMENT):
+    '''
+    :param master_times: sorted array of master event times
+    :param slave_times: sorted array of slave event times
+    :return: dict: offset (slave - master at reference_time, seconds), drift_ppm, reference_time, significance,
+             segments used for drift
+    '''
+    if master_times.size == 0 or slave_times.size == 0:
+        raise ValueError('Both detectors need events to estimate time offset.')
+    start = max(master_times[0], slave_times[0])
+    end = min(master_times[-1], slave_times[-1])
+    if end <= start:
+        raise ValueError('Detectors have no common measurement time.')
+    lag_bins = int(math.ceil(max_lag / bin_width))
+
+    segments = []
+    total = None
+    segment_start = start
+    while segment_start < end:
+        length = min(segment, end - segment_start)
+        correlation = segment_correlation(master_times, slave_times, segment_start, length, bin_width, max_lag)
+        segments.append((segment_start + length / 2, correlation))
+        total = correlation if total is None else total + correlation
+        segment_start += segment
+
+    offset, significance = find_peak(total, bin_width, lag_bins)
+    reference_time = (start + end) / 2
+    centers = []
+    offsets = []
+    for center, correlation in segments:
+        segment_offset, segment_significance = find_peak(correlation, bin_width, lag_bins)
+        if segment_significance >= MIN_SIGNIFICANCE:
+            centers.append(center - reference_time)
+            offsets.append(segment_offset)
+    centers = numpy.array(centers)
+    offsets = numpy.array(offsets)
+
+    drift = 0.0
+    if centers.size >= 3:
+        drift, offset = numpy.polyfit(centers, offsets, 1)
+        # spurious peaks of single segments are removed and line is fitted again
+        good = numpy.abs(offsets - (offset + drift * centers)) < 5 * bin_width
+        if numpy.count_nonzero(good) >= 3:
+            drift, offset = numpy.polyfit(centers[good], offsets[good], 1)
+            centers = centers[good]
+    return {'offset': float(offset), 'drift_ppm': float(drift) * 1e6, 'reference_time': float(reference_time),
+            'significance': significance, 'segments': len(centers), 'bin_width': bin_width, 'max_lag': max_lag}
+
+
+def save_time_offset(result, run_folder):
+    with open(os.path.join(run_folder, OFFSET_FILE), 'w') as offset_file:
+        json.dump(result, offset_file, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Estimate MASTER/SLAVE time offset with FFT cross-correlation.')
+    parser.add_argument('run_folders', nargs='+', help='folders with MASTER and SLAVE data files')
+    parser.add_argument('--bin', type=float, default=BIN_WIDTH, help='bin width [s]')
+    parser.add_argument('--max-lag', type=float, default=MAX_LAG, help='largest offset searched [s]')
+    parser.add_argument('--segment', type=float, default=SEGMENT, help='seconds of data per FFT')
+    args = parser.parse_args(argv)
+
+    for run_folder in args.run_folders:
+        try:
+            master_path, slave_path = find_run_files(run_folder)
+            result = estimate_offset(load_events(master_path)[0], load_events(slave_path)[0], args.bin,
+                                     args.max_lag, args.segment)
+        except (OSError, ValueError) as exc:
+            print('Skipping ' + run_folder + ': ' + str(exc))
+            continue
+        save_time_offset(result, run_folder)
+        print(run_folder + ': offset ' + '{:.4f}'.format(result['offset']) + ' s, drift ' +
+              '{:.1f}'.format(result['drift_ppm']) + ' ppm, significance ' +
+              '{:.1f}'.format(result['significance']) + ', ' + str(result['segments']) + ' segments.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Project: Cosmic ray measurements in automation cycle using Python programming
+Event timestamping. Host time is taken from a monotonic high resolution clock, so NTP adjustments don't make it jump.
+Arduino time (Ardn_time[ms] column) is fitted to host time per detector to correct offset and drift.
+"""
+
+import time
+
+
+class HostClock():
+    '''
+    Monotonic UTC clock. Anchored to wall clock once at start, afterwards advanced with time.perf_counter().
+    Shared by all detectors of one measurement, so their timestamps have common time base.
+    :param time_start: datetime (UTC) of measurement start, clock reads this value at creation
+    :param anchor: time.perf_counter() value at time_start, given when clock is recreated in another process
+    '''
+
+    def __init__(self, time_start, anchor=None):
+        self.epoch = time_start.timestamp() # seconds since 1970 at anchor
+        self.anchor = time.perf_counter() if anchor is None else anchor
+
+    def now(self):
+        '''
+        :return: current UTC time in seconds since 1970
+        '''
+        return self.epoch + (time.perf_counter() - self.anchor)
+
+    def elapsed(self):
+        '''
+        :return: seconds since measurement start
+        '''
+        return time.perf_counter() - self.anchor
+
+
+class ArduinoClockFit():
+    '''
+    Online linear regression host_time = offset + slope * arduino_ms for one detector.
+    Arduino time resets when detector restarts (e.g. after reconnect), fit is restarted then.
+    min_points: number of events needed before fitted time is used instead of host time
+    max_residual: seconds, fit is restarted when host time differs more from prediction (counter reset, glitch)
+    '''
+
+    min_points = 10
+    max_residual = 1.0
+
+    def __init__(self):
+        self.reset()
+        self.cached_second = None
+        self.cached_prefix = ''
+
+    def reset(self):
+        self.n = 0
+        self.x0 = 0.0 # first point, sums are kept relative to it for numerical precision
+        self.y0 = 0.0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.last_x = None
+        self.slope = 0.001 # seconds per arduino millisecond
+        self.offset = 0.0
+
+    def add(self, arduino_ms, host_time):
+        '''
+        Adds event to fit. O(1).
+        :param arduino_ms: Arduino time of event in ms
+        :param host_time: host UTC time of event in seconds since 1970
+        '''
+        if self.last_x is not None and (arduino_ms < self.last_x or
+                                        (self.n >= self.min_points and
+                                         abs(self.predict(arduino_ms) - host_time) > self.max_residual)):
+            self.reset()
+        if self.n == 0:
+            self.x0 = arduino_ms
+            self.y0 = host_time
+        x = arduino_ms - self.x0
+        y = host_time - self.y0
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.sxy += x * y
+        self.last_x = arduino_ms
+
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if self.n >= 2 and denominator > 0:
+            self.slope = (self.n * self.sxy - self.sx * self.sy) / denominator
+            self.offset = (self.sy - self.slope * self.sx) / self.n
+        else:
+            self.slope = 0.001
+            self.offset = y - self.slope * x
+
+    def predict(self, arduino_ms):
+        '''
+        :return: host UTC time in seconds predicted for given Arduino time
+        '''
+        return self.y0 + self.offset + self.slope * (arduino_ms - self.x0)
+
+    def timestamp(self, arduino_ms, host_time):
+        '''
+        Adds event to fit and returns its corrected time.
+        :return: fitted host time, or host_time itself until fit has min_points events
+        '''
+        self.add(arduino_ms, host_time)
+        if self.n < self.min_points:
+            return host_time
+        return self.predict(arduino_ms)
+
+    def drift_ppm(self):
+        '''
+        :return: Arduino clock drift relative to host clock in parts per million
+        '''
+        return (self.slope * 1000 - 1) * 1e6
+
+    def format(self, utc_time):
+        '''
+        Formats time as 'YYYY-MM-DD HH:MM:SS.ffffff'. strftime is called only once per second.
+        :param utc_time: seconds since 1970
+        '''
+        second = int(utc_time)
+        if second != self.cached_second:
+            self.cached_second = second
+            self.cached_prefix = time.strftime('%Y-%m-%d %H:%M:%S.', time.gmtime(second))
+        return self.cached_prefix + '%06d' % int((utc_time - second) * 1e6)